@@ -17,13 +17,20 @@ from services.state import state
 from vietnam_provinces import PROVINCES
 from vietnam_wards import WARDS
 from services.weather_services import RegionIndex, WeatherService
-from services.app_utils import resolve_region, fetch_weather_data, build_weather_response
+from services.app_utils import SUMMARY_PROJECTION, resolve_region_async, fetch_weather_data_with_age_async, build_weather_response
 from services.open_meteo.open_meteo import fetch_forecast, read_cache, get_cache_summary
+from services.open_meteo.cache import forecast_cache
 from services.error_handler import handle_service_error
 from services.notify import router as notify_router
 from services.notify import notify_api
 from services.config import get_config, check_resources, check_api_connection  
 from services.chat import router as chat_router
+from services.scheduler import start_scheduler, shutdown_scheduler
+from services.http_client import startup_http_clients, shutdown_http_clients
+from services.prefetch import register_prefetch_jobs
+from services.alert_sweep import get_alert_index, register_alert_sweep_jobs
+from services.nchmf import register_nchmf_jobs
+from services.alert_geo import official_alerts_bulk
 
 # ==============================
 # Logging setup
@@ -125,6 +132,8 @@ except Exception as e:
 @app.on_event("startup")
 async def startup_event():
     logger.info("🚀 Application startup: hệ thống khởi động theo hướng gọi trực tiếp Open-Meteo...")
+    # Pool kết nối dùng chung cho mọi lời gọi upstream
+    startup_http_clients()
     try:
         # Kiểm tra cấu hình và kết nối API
         check_resources()
@@ -133,6 +142,23 @@ async def startup_event():
     except Exception as e:
         logger.error("❌ Lỗi khi kiểm tra tài nguyên/kết nối API: %s", e)
 
+    try:
+        # Làm nóng cache dự báo cho toàn bộ tỉnh/thành + phường/xã nóng
+        register_prefetch_jobs()
+        # Quét cảnh báo toàn quốc định kỳ trên cache vừa làm nóng
+        register_alert_sweep_jobs()
+        # Poll cảnh báo chính thức NCHMF (request có điều kiện, lưu trong bộ nhớ)
+        register_nchmf_jobs()
+        start_scheduler()
+    except Exception as e:
+        logger.error("❌ Lỗi khi khởi động scheduler prefetch: %s", e)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    logger.info("🛑 Application shutdown: dừng scheduler nền và đóng HTTP client...")
+    shutdown_scheduler()
+    await shutdown_http_clients()
+
 # ==============================
 # Router & Endpoints (Direct Source)
 # ==============================
@@ -154,7 +180,7 @@ def ping():
     }
 
 @router.get("/v1/weather", tags=["Weather Services"])
-def get_weather(
+async def get_weather(
     region: str = Query(None, description="Tên địa danh"),
     lat: float = Query(None, description="Vĩ độ"),
     lon: float = Query(None, description="Kinh độ")
@@ -163,7 +189,7 @@ def get_weather(
     Lấy dữ liệu thời tiết trực tiếp từ Open-Meteo theo region hoặc lat/lon.
     """
     logger.info(f"/v1/weather region={region} lat={lat} lon={lon}")
-    region_info = resolve_region(region=region, lat=lat, lon=lon)
+    region_info = await resolve_region_async(region=region, lat=lat, lon=lon)
 
     # Nếu không tìm thấy region hoặc tọa độ
     if (not region_info or
@@ -187,11 +213,13 @@ def get_weather(
 
     try:
         # Lấy dữ liệu thời tiết từ Open-Meteo
-        data = fetch_weather_data(region_info["lat"], region_info["lon"])
+        data, age_s = await fetch_weather_data_with_age_async(region_info["lat"], region_info["lon"])
+        response = build_weather_response(region_info, data)
+        response["data_age_s"] = round(age_s, 1) if data and age_s is not None else None
         return {
             "status": "ok",
             "message": "Dữ liệu thời tiết đã được lấy thành công",
-            "data": build_weather_response(region_info, data)
+            "data": response
         }
     except Exception as e:
         logger.exception("Error in /v1/weather")
@@ -220,6 +248,10 @@ def health():
                 "config": get_config(),
                 "resources": resources,
                 "checks": {"api_connection": api_status},
+                "cache": forecast_cache.stats(),
+                "prefetch": state.get("prefetch"),
+                "alert_sweep": state.get("alert_sweep"),
+                "nchmf": state.get("nchmf"),
                 "system_time": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S"),
                 "app_version": "1.0.0",
             }
@@ -240,7 +272,7 @@ def health():
         }
 
 @router.get("/v1/weather_summary", tags=["Weather Services"])
-def get_weather_summary(
+async def get_weather_summary(
     lat: float = Query(..., description="Vĩ độ"),
     lon: float = Query(..., description="Kinh độ")
 ):
@@ -248,8 +280,8 @@ def get_weather_summary(
     Trả về summary dữ liệu thời tiết trực tiếp cho một địa điểm (direct source mode).
     """
     try:
-        # Lấy dữ liệu trực tiếp từ Open-Meteo
-        data = fetch_weather_data(lat, lon)
+        # Chỉ cần current_weather: URL nhỏ nhất, hoặc dùng lại payload rộng hơn đã cache
+        data, age_s = await fetch_weather_data_with_age_async(lat, lon, projection=SUMMARY_PROJECTION)
 
         # Trích xuất dữ liệu từ current_weather
         current = data.get("current_weather", {}) if data else {}
@@ -265,7 +297,8 @@ def get_weather_summary(
             },
             "meta": {
                 "source": "Open-Meteo API",
-                "ts": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+                "ts": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S"),
+                "data_age_s": round(age_s, 1) if data and age_s is not None else None,
             }
         }
 
@@ -286,6 +319,53 @@ def get_weather_summary(
         return JSONResponse(content=error_info, status_code=500)
 
 
+@router.get("/v1/alerts/active", tags=["Weather Services"])
+def get_active_alerts(
+    code: str = Query(None, description="Mã luật, ví dụ RAIN_EXTREME, STORM_WIND, STORM_GUST, HEAT_ALERT"),
+    hours: int = Query(None, description="Số giờ tới (mặc định ALERT_SWEEP_HOURS)"),
+    province: str = Query(None, description="Lọc theo tên tỉnh/thành (chứa chuỗi)"),
+    type: str = Query(None, description="province | ward"),
+    severity: str = Query(None, description="severe | warning | info"),
+    limit: int = Query(500, description="Số bản ghi tối đa"),
+):
+    """
+    Cảnh báo đang hiệu lực trên toàn quốc (tỉnh/thành + phường/xã) từ lượt quét gần nhất.
+    Ví dụ: phường/xã mưa ≥100 mm/24h trong 72 giờ tới → ?code=RAIN_EXTREME&type=ward&hours=72
+    """
+    try:
+        index = get_alert_index()
+        if index is None:
+            return {"status": "ok", "message": "Chưa có lượt quét cảnh báo", "data": {"alerts": []}}
+        alerts = index.query(code=code, hours=hours, province=province, loc_type=type,
+                             severity=severity, limit=max(0, limit) or None)
+        # Cảnh báo chính thức NCHMF phủ từng vị trí (một truy vấn STRtree cho cả danh sách)
+        official = official_alerts_bulk([a["lat"] for a in alerts], [a["lon"] for a in alerts])
+        for row, titles in zip(alerts, official):
+            row["official"] = titles
+        return {
+            "status": "ok",
+            "message": f"{len(alerts)} cảnh báo đang hiệu lực",
+            "data": {
+                "built_at": index.built_at,
+                "from": index.hour_iso(0),
+                "hours": index.horizon(hours),
+                "coverage": index.coverage(),
+                "summary": index.summary(hours),
+                "alerts": alerts,
+            }
+        }
+    except Exception as e:
+        logger.exception("Error in /v1/alerts/active")
+        error_info = handle_service_error(
+            service="alert_sweep",
+            context="get_active_alerts",
+            e=e,
+            alert_type="data",
+            extra_info={"code": code, "hours": hours, "province": province}
+        )
+        return JSONResponse(content=error_info, status_code=500)
+
+
 @router.get("/version", tags=["System"])
 def version_info():
     """
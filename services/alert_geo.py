@@ -0,0 +1,225 @@
+# services/alert_geo.py
+import logging
+import re
+import threading
+import unicodedata
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from services import config
+from services.nchmf import RSS, OfficialAlert, official_store
+from vietnam_provinces import PROVINCES
+from vietnam_wards import WARDS
+
+logger = logging.getLogger("WeatherService")
+
+# shapely (tùy chọn): STRtree trên vùng ảnh hưởng của cảnh báo; thiếu thì không lọc theo vị trí
+try:
+    import shapely
+    from shapely import STRtree
+except ImportError:  # pragma: no cover - phụ thuộc môi trường
+    shapely = None
+    STRtree = None
+
+_KM_PER_DEG = 111.0
+# Chưa có ranh giới hành chính: vùng tỉnh/thành ≈ bao lồi các phường/xã + đệm (độ)
+PROVINCE_BUFFER_DEG = 0.05
+
+# Tên tỉnh/thành trước sáp nhập 2025 (bản tin cũ/quen dùng) → tỉnh/thành hiện tại
+LEGACY_PROVINCES = {
+    "Hà Giang": "Tuyên Quang", "Yên Bái": "Lào Cai", "Bắc Kạn": "Thái Nguyên",
+    "Hòa Bình": "Phú Thọ", "Vĩnh Phúc": "Phú Thọ", "Bắc Giang": "Bắc Ninh",
+    "Hải Dương": "Hải Phòng", "Thái Bình": "Hưng Yên", "Hà Nam": "Ninh Bình", "Nam Định": "Ninh Bình",
+    "Quảng Bình": "Quảng Trị", "Thừa Thiên Huế": "Huế", "Quảng Nam": "Đà Nẵng", "Kon Tum": "Quảng Ngãi",
+    "Bình Định": "Gia Lai", "Phú Yên": "Đắk Lắk", "Ninh Thuận": "Khánh Hòa",
+    "Đắk Nông": "Lâm Đồng", "Bình Thuận": "Lâm Đồng", "Bình Phước": "Đồng Nai",
+    "Bình Dương": "Hồ Chí Minh", "Bà Rịa - Vũng Tàu": "Hồ Chí Minh", "Bà Rịa Vũng Tàu": "Hồ Chí Minh",
+    "Long An": "Tây Ninh", "Tiền Giang": "Đồng Tháp", "Kiên Giang": "An Giang",
+    "Bến Tre": "Vĩnh Long", "Trà Vinh": "Vĩnh Long", "Sóc Trăng": "Cần Thơ", "Hậu Giang": "Cần Thơ",
+    "Bạc Liêu": "Cà Mau", "TP.HCM": "Hồ Chí Minh", "TP HCM": "Hồ Chí Minh", "Sài Gòn": "Hồ Chí Minh",
+}
+
+# Vùng khí hậu hay dùng trong bản tin NCHMF → tỉnh/thành
+_TAY_BAC = ["Lai Châu", "Điện Biên", "Sơn La", "Lào Cai"]
+_VIET_BAC = ["Cao Bằng", "Tuyên Quang", "Thái Nguyên", "Lạng Sơn", "Quảng Ninh", "Phú Thọ"]
+_DONG_BANG_BAC = ["Hà Nội", "Hải Phòng", "Hưng Yên", "Ninh Bình", "Bắc Ninh"]
+_BAC_TRUNG_BO = ["Thanh Hóa", "Nghệ An", "Hà Tĩnh", "Quảng Trị", "Huế"]
+_NAM_TRUNG_BO = ["Đà Nẵng", "Quảng Ngãi", "Gia Lai", "Đắk Lắk", "Khánh Hòa", "Lâm Đồng"]
+_TAY_NGUYEN = ["Gia Lai", "Đắk Lắk", "Lâm Đồng"]
+_DONG_NAM_BO = ["Hồ Chí Minh", "Đồng Nai", "Tây Ninh"]
+_TAY_NAM_BO = ["Cần Thơ", "Đồng Tháp", "An Giang", "Vĩnh Long", "Cà Mau"]
+REGIONS = {
+    "Tây Bắc Bộ": _TAY_BAC, "Tây Bắc": _TAY_BAC,
+    "Đông Bắc Bộ": _VIET_BAC, "Việt Bắc": _VIET_BAC,
+    "Đồng bằng Bắc Bộ": _DONG_BANG_BAC, "Đồng bằng và Trung du Bắc Bộ": _DONG_BANG_BAC + _VIET_BAC,
+    "Bắc Bộ": _TAY_BAC + _VIET_BAC + _DONG_BANG_BAC,
+    "Bắc Trung Bộ": _BAC_TRUNG_BO, "Trung Trung Bộ": ["Huế", "Đà Nẵng", "Quảng Ngãi"],
+    "Nam Trung Bộ": _NAM_TRUNG_BO, "Trung Bộ": _BAC_TRUNG_BO + _NAM_TRUNG_BO,
+    "Tây Nguyên": _TAY_NGUYEN,
+    "Đông Nam Bộ": _DONG_NAM_BO, "Tây Nam Bộ": _TAY_NAM_BO, "Nam Bộ": _DONG_NAM_BO + _TAY_NAM_BO,
+}
+
+# "Vị trí tâm bão ở vào khoảng 17,5 độ Vĩ Bắc; 112,3 độ Kinh Đông"
+_CENTER_RE = re.compile(
+    r"(\d{1,2}(?:[.,]\d+)?)\s*độ\s*vĩ\s*bắc\W{0,5}(\d{2,3}(?:[.,]\d+)?)\s*độ\s*kinh\s*đông"
+)
+
+
+def _fold(text: str) -> str:
+    """NFC + casefold (feed có thể gửi tiếng Việt dạng tổ hợp NFD)."""
+    return unicodedata.normalize("NFC", text or "").casefold()
+
+
+def _short(name: str) -> str:
+    for prefix in ("Thành phố ", "Tỉnh "):
+        if name.startswith(prefix):
+            return name[len(prefix):]
+    return name
+
+
+@lru_cache(maxsize=1)
+def _name_table() -> Tuple[re.Pattern, Dict[str, Tuple[str, ...]]]:
+    """Regex mọi tên (tỉnh/thành, tên cũ, vùng) + tên đã fold → tỉnh/thành hiện tại (khóa PROVINCES)."""
+    full = {_short(name): name for name in PROVINCES}
+    names: Dict[str, Tuple[str, ...]] = {_fold(short): (name,) for short, name in full.items()}
+    for alias, short in LEGACY_PROVINCES.items():
+        names[_fold(alias)] = (full[short],)
+    for region, shorts in REGIONS.items():
+        names[_fold(region)] = tuple(dict.fromkeys(full[s] for s in shorts))
+    # Tên dài trước: "Bắc Trung Bộ" thắng "Trung Bộ", "Tây Nam Bộ" thắng "Nam Bộ"
+    alternation = "|".join(re.escape(n) for n in sorted(names, key=len, reverse=True))
+    return re.compile(rf"(?<!\w)(?:{alternation})(?!\w)"), names
+
+
+def alert_areas(text: str) -> Tuple[Set[str], List[Tuple[float, float]]]:
+    """Tỉnh/thành (khóa PROVINCES) và tâm bão (lat, lon) nhắc tới trong nội dung cảnh báo."""
+    text = _fold(text)
+    pattern, names = _name_table()
+    provinces = {p for match in pattern.findall(text) for p in names[match]}
+    centers = [(float(lat.replace(",", ".")), float(lon.replace(",", ".")))
+               for lat, lon in _CENTER_RE.findall(text)]
+    return provinces, centers
+
+
+@lru_cache(maxsize=1)
+def province_shapes() -> Dict[str, "shapely.Geometry"]:
+    """Vùng xấp xỉ của từng tỉnh/thành: bao lồi tọa độ phường/xã (khóa "Tên__Tỉnh") + trung tâm tỉnh."""
+    coords: Dict[str, List[Tuple[float, float]]] = {}
+    for name, info in PROVINCES.items():
+        if info.get("lat") is not None and info.get("lon") is not None:
+            coords.setdefault(name, []).append((info["lon"], info["lat"]))
+    for key, info in WARDS.items():
+        province = key.partition("__")[2]
+        if province in PROVINCES and info.get("lat") is not None and info.get("lon") is not None:
+            coords.setdefault(province, []).append((info["lon"], info["lat"]))
+    return {name: shapely.multipoints(pts).convex_hull.buffer(PROVINCE_BUFFER_DEG) for name, pts in coords.items()}
+
+
+def is_located(alert: OfficialAlert) -> bool:
+    """Cảnh báo từ RSS chính thức có nêu tỉnh/thành/vùng hoặc tâm bão. Chỉ những cảnh báo này
+    được gắn vào bản tin của một vị trí; tin không rõ vùng (hoặc lấy từ trang HTML) thì không."""
+    if alert.kind != RSS:
+        return False
+    provinces, centers = alert_areas(f"{alert.title} {alert.summary or ''}")
+    return bool(provinces or centers)
+
+
+def alert_geometries(alert: OfficialAlert) -> list:
+    """Vùng ảnh hưởng của một cảnh báo (mỗi tỉnh/thành, mỗi vòng quanh tâm bão một hình);
+    rỗng = không xác định được vùng → không gắn với vị trí nào."""
+    provinces, centers = alert_areas(f"{alert.title} {alert.summary or ''}")
+    shapes = province_shapes()
+    geoms = [shapes[p] for p in sorted(provinces) if p in shapes]
+    radius = config.NCHMF_STORM_RADIUS_KM / _KM_PER_DEG
+    geoms.extend(shapely.points(lon, lat).buffer(radius) for lat, lon in centers)
+    return geoms
+
+
+class AlertGeoIndex:
+    """
+    STRtree trên vùng ảnh hưởng của các cảnh báo chính thức (dựng lại khi tập cảnh báo đổi).
+    Một điểm/cả loạt điểm → các cảnh báo có vùng chứa điểm, giữ thứ tự của tập cảnh báo
+    (mới nhất trước). Cảnh báo không xác định được vùng (is_located sai) không khớp điểm nào.
+    """
+
+    __slots__ = ("alerts", "tree", "owner", "unlocated", "version")
+
+    def __init__(self, alerts: List[OfficialAlert], version: int = None):
+        geoms, owner, unlocated = [], [], 0
+        for i, alert in enumerate(alerts):
+            parts = alert_geometries(alert) if alert.kind == RSS else []
+            if not parts:
+                unlocated += 1
+            geoms.extend(parts)
+            owner.extend([i] * len(parts))
+        self.alerts = alerts
+        self.tree = STRtree(geoms) if geoms else None
+        self.owner = np.array(owner, dtype=np.int64)
+        self.unlocated = unlocated
+        self.version = version
+
+    def match_many(self, lats: Sequence[float], lons: Sequence[float]) -> List[List[OfficialAlert]]:
+        """Một truy vấn STRtree cho cả loạt điểm (vd. toàn bộ phường/xã)."""
+        n = len(lats)
+        hits: List[Set[int]] = [set() for _ in range(n)]
+        if self.tree is not None and n:
+            points = shapely.points(np.asarray(lons, dtype=float), np.asarray(lats, dtype=float))
+            src, dst = self.tree.query(points, predicate="intersects")
+            for i, a in zip(src.tolist(), self.owner[dst].tolist()):
+                hits[i].add(a)
+        return [[self.alerts[a] for a in sorted(idx)] for idx in hits]
+
+    def match(self, lat: float, lon: float) -> List[OfficialAlert]:
+        return self.match_many([lat], [lon])[0]
+
+    def stats(self) -> Dict:
+        return {"alerts": len(self.alerts), "areas": len(self.owner), "unlocated": self.unlocated}
+
+
+_index: Optional[AlertGeoIndex] = None
+_index_lock = threading.Lock()
+_warned_missing_shapely = False
+
+
+def get_alert_geo_index() -> Optional[AlertGeoIndex]:
+    """Geo-index theo phiên bản hiện tại của official_store; None nếu chưa cài shapely."""
+    global _index, _warned_missing_shapely
+    if shapely is None:
+        if not _warned_missing_shapely:
+            logger.warning("[alert_geo] Chưa cài 'shapely', cảnh báo chính thức không lọc theo vị trí")
+            _warned_missing_shapely = True
+        return None
+    version = official_store.version
+    index = _index
+    if index is not None and index.version == version:
+        return index
+    with _index_lock:
+        if _index is None or _index.version != version:
+            _index = AlertGeoIndex(official_store.alerts(), version)
+        return _index
+
+
+def _located_titles(category: Optional[str]) -> List[str]:
+    """Thiếu shapely: không lọc được theo điểm, chỉ giữ cảnh báo có vùng/tâm bão xác định."""
+    return [a.title for a in official_store.alerts(category) if is_located(a)]
+
+
+def official_alerts_at(lat: Optional[float], lon: Optional[float], category: str) -> List[str]:
+    """Tiêu đề cảnh báo chính thức có vùng ảnh hưởng chứa vị trí (lat, lon).
+    Thiếu tọa độ hoặc shapely: mọi cảnh báo xác định được vùng."""
+    index = get_alert_geo_index() if lat is not None and lon is not None else None
+    if index is None:
+        return _located_titles(category)
+    return [a.title for a in index.match(lat, lon) if a.category == category]
+
+
+def official_alerts_bulk(lats: Sequence[float], lons: Sequence[float], category: str = None) -> List[List[str]]:
+    """Bản loạt của official_alerts_at: mỗi điểm một list tiêu đề."""
+    index = get_alert_geo_index()
+    if index is None:
+        titles = _located_titles(category)
+        return [list(titles) for _ in range(len(lats))]
+    return [[a.title for a in found if category is None or a.category == category]
+            for found in index.match_many(lats, lons)]
@@ -0,0 +1,376 @@
+# services/alert_rules.py
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from services.alert_thresholds import (
+    ALERT_DESCRIPTIONS,
+    HEAT_ALERT, COLD_ALERT, WIND_ALERT, RAIN_ALERT, UV_ALERT, SOLAR_ALERT,
+    MSLP_LOW, MSLP_HIGH, HUMIDITY_HIGH, HUMIDITY_LOW,
+    TEMP_EXTREME, WIND_EXTREME, RAIN_EXTREME, PRESSURE_LOW,
+)
+from services.open_meteo.table import to_timestamp
+from services.open_meteo.utils import safe_float
+
+# Phạm vi dữ liệu của một luật
+CURRENT, HOURLY, DAILY = "current", "hourly", "daily"
+SCOPES = (CURRENT, HOURLY, DAILY)
+
+# Mức độ cảnh báo
+INFO, WARNING, SEVERE = "info", "warning", "severe"
+
+_OPS = {
+    ">=": np.greater_equal,
+    ">": np.greater,
+    "<=": np.less_equal,
+    "<": np.less,
+}
+
+TS_FORMAT = "%d/%m %H:%M"
+# {label} mặc định trong thông điệp theo phạm vi
+SCOPE_LABELS = {CURRENT: "hiện tại", HOURLY: "theo giờ", DAILY: "theo ngày"}
+
+
+class AlertRule:
+    """
+    Một luật cảnh báo dạng dữ liệu: field op threshold trên một phạm vi (current/hourly/daily).
+    - field: tên cột, hoặc tuple tên thay thế (lấy cột đầu tiên có mặt)
+    - window: số bước liên tiếp phải thỏa (1 = xét từng giờ/ngày, >1 = một bản ghi cho mỗi đợt)
+    - template: chuỗi str.format với {value}, {threshold}, {time}, {steps} và các khóa context
+    - strict: luật current chỉ nhận giá trị int/float (chuỗi số, numpy int... bị bỏ qua thay vì ép kiểu)
+    """
+
+    __slots__ = ("code", "scope", "field", "op", "threshold", "template", "window", "severity", "ts_format", "strict")
+
+    def __init__(self, code: str, scope: str, field: Union[str, Sequence[str]], op: str, threshold: float,
+                 template: str, window: int = 1, severity: str = WARNING, ts_format: str = TS_FORMAT,
+                 strict: bool = False):
+        if scope not in SCOPES:
+            raise ValueError(f"scope không hợp lệ: {scope}")
+        if op not in _OPS:
+            raise ValueError(f"phép so sánh không hợp lệ: {op}")
+        self.code = code
+        self.scope = scope
+        self.field = (field,) if isinstance(field, str) else tuple(field)
+        self.op = op
+        self.threshold = float(threshold)
+        self.template = template
+        self.window = max(1, int(window))
+        self.severity = severity
+        self.ts_format = ts_format
+        self.strict = bool(strict)
+
+    def __repr__(self) -> str:
+        return f"AlertRule({self.code}: {self.scope}.{'|'.join(self.field)} {self.op} {self.threshold:g}, window={self.window})"
+
+    def test(self, values: np.ndarray) -> np.ndarray:
+        """Mặt nạ thỏa điều kiện trên mảng float bất kỳ chiều (NaN → False)."""
+        with np.errstate(invalid="ignore"):
+            return _OPS[self.op](values, self.threshold)
+
+
+class AlertRecord:
+    """Một cảnh báo đã phát: luật nào, ở bước nào (index, số bước), giá trị và thông điệp."""
+
+    __slots__ = ("code", "scope", "severity", "index", "steps", "ts", "value", "message")
+
+    def __init__(self, code: str, scope: str, severity: str, index: Optional[int], steps: int,
+                 ts: Any, value: float, message: str):
+        self.code = code
+        self.scope = scope
+        self.severity = severity
+        self.index = index
+        self.steps = steps
+        self.ts = ts
+        self.value = value
+        self.message = message
+
+    def __repr__(self) -> str:
+        return f"AlertRecord({self.code}, {self.scope}[{self.index}], {self.value!r})"
+
+    def to_dict(self) -> Dict[str, Any]:
+        ts = to_timestamp(self.ts) if self.ts is not None else None
+        return {
+            "code": self.code,
+            "scope": self.scope,
+            "severity": self.severity,
+            "index": self.index,
+            "steps": self.steps,
+            "time": ts.strftime("%Y-%m-%dT%H:%M") if ts is not None and not pd.isna(ts) else None,
+            "value": self.value,
+            "message": self.message,
+        }
+
+
+# ===== Đọc cột =====
+def _numeric(values: Any) -> np.ndarray:
+    """Cột bất kỳ → float64 (None/không phải số → NaN)."""
+    arr = values.to_numpy() if isinstance(values, (pd.Series, pd.Index)) else np.asarray(values)
+    if arr.dtype.kind in "iufb":
+        return arr.astype(np.float64, copy=False)
+    try:
+        return arr.astype(np.float64)
+    except (TypeError, ValueError):
+        return pd.to_numeric(pd.Series(arr.ravel()), errors="coerce").to_numpy(np.float64).reshape(arr.shape)
+
+
+def _has(table: Any, name: str) -> bool:
+    if isinstance(table, pd.DataFrame):
+        return name in table.columns
+    return name in table
+
+
+def _column(table: Any, name: str) -> Any:
+    """Cột name của DataFrame/ForecastTable/dict mảng (None nếu không có)."""
+    if table is None or not _has(table, name):
+        return None
+    return table[name]
+
+
+def _cell(col: Any, i: int) -> Any:
+    return col.iloc[i] if isinstance(col, pd.Series) else col[i]
+
+
+def _runs(mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Các đoạn True liên tiếp của mặt nạ 1 chiều: (vị trí bắt đầu, độ dài)."""
+    edges = np.diff(np.concatenate(([False], mask, [False])).astype(np.int8))
+    starts = np.flatnonzero(edges == 1)
+    return starts, np.flatnonzero(edges == -1) - starts
+
+
+def window_mask(mask: np.ndarray, window: int) -> np.ndarray:
+    """Đánh dấu các bước thuộc đợt thỏa liên tiếp ≥ window bước (theo trục cuối, mảng bất kỳ chiều)."""
+    if window <= 1 or mask.shape[-1] == 0:
+        return mask
+    # Độ dài đoạn True kết thúc tại mỗi bước, rồi lan ngược độ dài đoạn về đầu đoạn
+    run = np.zeros(mask.shape, dtype=np.int64)
+    prev = np.zeros(mask.shape[:-1], dtype=np.int64)
+    for t in range(mask.shape[-1]):
+        prev = np.where(mask[..., t], prev + 1, 0)
+        run[..., t] = prev
+    total = np.zeros(mask.shape, dtype=np.int64)
+    nxt = np.zeros(mask.shape[:-1], dtype=np.int64)
+    for t in range(mask.shape[-1] - 1, -1, -1):
+        nxt = np.where(mask[..., t], np.maximum(nxt, run[..., t]), 0)
+        total[..., t] = nxt
+    return total >= window
+
+
+# ===== Bộ luật đã biên dịch =====
+class RuleSet:
+    """
+    Bộ luật biên dịch một lần: gom theo phạm vi, mỗi cột chỉ đọc và đổi sang float64 một lần
+    cho mọi luật dùng nó, điều kiện tính bằng mặt nạ trên cả cột (hoặc mảng nhiều điểm × thời gian).
+    Thời gian chỉ được định dạng cho những bước có cảnh báo.
+    """
+
+    def __init__(self, rules: Iterable[AlertRule]):
+        self.rules = tuple(rules)
+        self._by_scope: Dict[str, List[AlertRule]] = {scope: [] for scope in SCOPES}
+        for rule in self.rules:
+            self._by_scope[rule.scope].append(rule)
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def __iter__(self):
+        return iter(self.rules)
+
+    def scope_rules(self, scope: str) -> List[AlertRule]:
+        return self._by_scope.get(scope, [])
+
+    def fields(self, scope: str) -> List[str]:
+        """Mọi tên cột (kể cả tên thay thế) các luật của scope cần đọc."""
+        seen = {}
+        for rule in self._by_scope.get(scope, []):
+            for name in rule.field:
+                seen.setdefault(name, None)
+        return list(seen)
+
+    def masks(self, scope: str, columns: Mapping[str, Any]) -> List[Tuple[AlertRule, np.ndarray, np.ndarray]]:
+        """
+        [(luật, giá trị float, mặt nạ đã áp window)] cho các luật của scope có cột trong columns.
+        columns có thể là bảng một điểm (mảng 1 chiều) hoặc mảng điểm × thời gian (trục cuối là thời gian).
+        """
+        cache: Dict[str, np.ndarray] = {}
+        out = []
+        for rule in self._by_scope.get(scope, []):
+            name = next((f for f in rule.field if _has(columns, f)), None)
+            if name is None:
+                continue
+            values = cache.get(name)
+            if values is None:
+                values = cache[name] = _numeric(columns[name])
+            mask = rule.test(values)
+            if rule.window > 1:
+                mask = window_mask(mask, rule.window)
+            out.append((rule, values, mask))
+        return out
+
+    def count(self, scope: str, columns: Mapping[str, Any]) -> Dict[str, Any]:
+        """Số bước thỏa mỗi luật (theo trục cuối; luật có window đếm số đợt)."""
+        counts = {}
+        for rule, _, mask in self.masks(scope, columns):
+            if rule.window > 1 and mask.shape[-1]:
+                starts = mask & ~np.concatenate((np.zeros(mask.shape[:-1] + (1,), bool), mask[..., :-1]), axis=-1)
+                counts[rule.code] = starts.sum(axis=-1)
+            else:
+                counts[rule.code] = mask.sum(axis=-1)
+        return counts
+
+    # ----- Bản ghi cho một địa điểm -----
+    def evaluate_current(self, current: Optional[dict], **context) -> List[AlertRecord]:
+        """Luật current trên dict số liệu hiện tại (giá trị không đổi được sang số được bỏ qua)."""
+        if not current:
+            return []
+        context.setdefault("label", SCOPE_LABELS[CURRENT])
+        records = []
+        for rule in self._by_scope[CURRENT]:
+            name = next((f for f in rule.field if current.get(f) is not None), None)
+            raw = current.get(name) if name is not None else None
+            if rule.strict:
+                value = float(raw) if isinstance(raw, (int, float)) else None
+            else:
+                value = safe_float(raw, None)
+            if value is None or not rule.test(np.float64(value)):
+                continue
+            message = rule.template.format(value=value, threshold=rule.threshold, time="", steps=1, **context)
+            records.append(AlertRecord(rule.code, CURRENT, rule.severity, None, 1, current.get("ts"), value, message))
+        return records
+
+    def evaluate_table(self, scope: str, table: Any, **context) -> List[AlertRecord]:
+        """Luật hourly/daily trên một bảng (DataFrame/ForecastTable/dict mảng), thứ tự theo
+        bước thời gian rồi theo thứ tự luật."""
+        if table is None:
+            return []
+        context.setdefault("label", SCOPE_LABELS[scope])
+        hits = []   # (bước, thứ tự luật, luật, số bước, giá trị)
+        for pos, (rule, values, mask) in enumerate(self.masks(scope, table)):
+            if rule.window > 1:
+                starts, lengths = _runs(mask)
+                for start, steps in zip(starts.tolist(), lengths.tolist()):
+                    span = values[start:start + steps]
+                    value = float(np.nanmax(span) if rule.op in (">=", ">") else np.nanmin(span))
+                    hits.append((start, pos, rule, steps, value))
+            else:
+                for i in np.flatnonzero(mask).tolist():
+                    hits.append((i, pos, rule, 1, float(values[i])))
+        if not hits:
+            return []
+        hits.sort(key=lambda h: (h[0], h[1]))
+
+        ts_local, ts_raw = _column(table, "ts_local"), _column(table, "ts")
+        times: Dict[int, Any] = {}
+        records = []
+        for i, _, rule, steps, value in hits:
+            if i not in times:
+                times[i] = (_cell(ts_local, i) if ts_local is not None else None) or \
+                           (_cell(ts_raw, i) if ts_raw is not None else None)
+            ts_val = times[i]
+            ts = to_timestamp(ts_val)
+            ts_str = ts.strftime(rule.ts_format) if ts is not pd.NaT else str(ts_val)
+            message = rule.template.format(value=value, threshold=rule.threshold, time=ts_str, steps=steps, **context)
+            records.append(AlertRecord(rule.code, scope, rule.severity, i, steps, ts_val, value, message))
+        return records
+
+    def evaluate(self, current: Optional[dict] = None, hourly: Any = None, daily: Any = None,
+                 **context) -> List[AlertRecord]:
+        """Mọi luật cho một địa điểm trong một lượt: current → hourly → daily.
+        context truyền thêm khóa cho template (label mặc định theo phạm vi)."""
+        records = self.evaluate_current(current, **context)
+        records.extend(self.evaluate_table(HOURLY, hourly, **context))
+        records.extend(self.evaluate_table(DAILY, daily, **context))
+        return records
+
+
+# ===== Bộ luật theo ngưỡng trong services.alert_thresholds =====
+def _described(code: str, scope: str, field, op: str, threshold: float, unit_fmt: str) -> AlertRule:
+    return AlertRule(code, scope, field, op, threshold, ALERT_DESCRIPTIONS[code] + " (" + unit_fmt + ")")
+
+
+# Cảnh báo theo số liệu hiện tại (thứ tự và nội dung như detect_alerts)
+CURRENT_RULES = [
+    _described("HEAT_ALERT", CURRENT, "temp_c", ">=", HEAT_ALERT, "{value:.1f}°C"),
+    _described("COLD_ALERT", CURRENT, "temp_c", "<=", COLD_ALERT, "{value:.1f}°C"),
+    _described("WIND_ALERT", CURRENT, "wind_speed_ms", ">=", WIND_ALERT, "{value:.1f} m/s"),
+    _described("RAIN_ALERT", CURRENT, "rain_24h", ">=", RAIN_ALERT, "{value:.1f} mm"),
+    _described("UV_ALERT", CURRENT, "uv_index", ">=", UV_ALERT, "{value:.1f}"),
+    _described("SOLAR_ALERT", CURRENT, "solar_wm2", ">=", SOLAR_ALERT, "{value:.1f} W/m²"),
+    _described("MSLP_LOW", CURRENT, "mslp", "<", MSLP_LOW, "{value:.1f} hPa"),
+    _described("MSLP_HIGH", CURRENT, "mslp", ">", MSLP_HIGH, "{value:.1f} hPa"),
+    _described("HUMIDITY_HIGH", CURRENT, "humidity_pct", ">=", HUMIDITY_HIGH, "{value:.0f}%"),
+    _described("HUMIDITY_LOW", CURRENT, "humidity_pct", "<=", HUMIDITY_LOW, "{value:.0f}%"),
+]
+
+# Ngưỡng bất thường trên số liệu hiện tại (check_unusual_alert, chỉ xét giá trị int/float như trước)
+EXTREME_CURRENT_RULES = [
+    AlertRule("TEMP_EXTREME", CURRENT, "temp_c", ">=", TEMP_EXTREME,
+              "🌡️ Nhiệt độ bất thường {value:.1f}°C ≥ {threshold}°C", severity=SEVERE, strict=True),
+    AlertRule("WIND_EXTREME", CURRENT, "wind_speed_ms", ">=", WIND_EXTREME,
+              "💨 Gió cực mạnh {value:.1f} m/s ≥ {threshold} m/s", severity=SEVERE, strict=True),
+    AlertRule("RAIN_EXTREME", CURRENT, "rain_mm", ">=", RAIN_EXTREME,
+              "🌧️ Mưa cực lớn {value:.1f} mm ≥ {threshold} mm/ngày", severity=SEVERE, strict=True),
+    AlertRule("PRESSURE_LOW", CURRENT, "mslp_hpa", "<=", PRESSURE_LOW,
+              "📉 Áp suất bất thường {value:.0f} hPa ≤ {threshold} hPa", severity=SEVERE, strict=True),
+]
+
+# Ngưỡng bất thường theo từng giờ/ngày (check_unusual_alert, {label} = "theo giờ"/"theo ngày")
+EXTREME_ROW_RULES = [
+    AlertRule("TEMP_EXTREME", scope, "temp_c", ">=", TEMP_EXTREME,
+              "🌡️ {label} {time}: nhiệt độ bất thường {value:.1f}°C", severity=SEVERE)
+    for scope in (HOURLY, DAILY)
+] + [
+    AlertRule("WIND_EXTREME", scope, "wind_speed_ms", ">=", WIND_EXTREME,
+              "💨 {label} {time}: gió cực mạnh {value:.1f} m/s", severity=SEVERE)
+    for scope in (HOURLY, DAILY)
+] + [
+    AlertRule("RAIN_EXTREME", scope, "rain_mm", ">=", RAIN_EXTREME,
+              "🌧️ {label} {time}: mưa cực lớn {value:.1f} mm", severity=SEVERE)
+    for scope in (HOURLY, DAILY)
+]
+
+# Thống kê số ngày trong xu hướng 10 ngày (cột do generate_trend_10days dựng)
+TREND_RULES = [
+    AlertRule("rain_days", DAILY, "rain_total", ">", 0.0, "", severity=INFO),
+    AlertRule("heavy_rain_days", DAILY, "rain_total", ">=", RAIN_ALERT, ""),
+    AlertRule("sunny_days", DAILY, "temp_max", ">=", HEAT_ALERT, ""),
+    AlertRule("cold_days", DAILY, "temp_min", "<=", COLD_ALERT, ""),
+    AlertRule("windy_days", DAILY, "wind_avg", ">=", WIND_ALERT, ""),
+    AlertRule("uv_high_days", DAILY, "uv", ">=", UV_ALERT, ""),
+    AlertRule("realfeel_cold_days", DAILY, "realfeel", "<=", 10.0, "", severity=INFO),
+    AlertRule("heat_index_high_days", DAILY, "heat_index", ">=", 40.0, ""),
+]
+
+# Cảnh báo theo ngày dùng cho dự báo (nắng nóng kéo dài, mưa/gió/nhiệt cực đoan)
+DAILY_RULES = [
+    AlertRule("HEAT_SPELL", DAILY, "temp_max", ">=", HEAT_ALERT,
+              "🔥 Nắng nóng kéo dài {steps} ngày từ {time}, cao nhất {value:.1f}°C", window=3, ts_format="%d/%m"),
+    AlertRule("RAIN_ALERT", DAILY, "rain_mm", ">=", RAIN_ALERT,
+              ALERT_DESCRIPTIONS["RAIN_ALERT"] + " {time} ({value:.1f} mm)", ts_format="%d/%m"),
+    AlertRule("WIND_ALERT", DAILY, ("wind_gust_max_ms", "wind_speed_max_ms"), ">=", WIND_ALERT,
+              ALERT_DESCRIPTIONS["WIND_ALERT"] + " {time} ({value:.1f} m/s)", ts_format="%d/%m"),
+    AlertRule("UV_ALERT", DAILY, "uv_index", ">=", UV_ALERT,
+              ALERT_DESCRIPTIONS["UV_ALERT"] + " {time} ({value:.1f})", ts_format="%d/%m", severity=INFO),
+]
+
+CURRENT_ALERTS = RuleSet(CURRENT_RULES)
+EXTREME_ALERTS = RuleSet(EXTREME_CURRENT_RULES + EXTREME_ROW_RULES)
+TREND_STATS = RuleSet(TREND_RULES)
+# Bộ luật mặc định cho một địa điểm: hiện tại + bất thường + theo ngày
+DEFAULT_RULES = RuleSet(CURRENT_RULES + EXTREME_CURRENT_RULES + EXTREME_ROW_RULES + DAILY_RULES)
+
+
+def evaluate_alerts(current: Optional[dict] = None, hourly: Any = None, daily: Any = None,
+                    rules: RuleSet = DEFAULT_RULES) -> List[dict]:
+    """Chạy bộ luật cho một địa điểm, trả về list bản ghi cảnh báo (dict, dùng cho JSON/API)."""
+    records = rules.evaluate(current, hourly, daily)
+    return [r.to_dict() for r in records]
+
+
+__all__ = [
+    "CURRENT", "HOURLY", "DAILY", "INFO", "WARNING", "SEVERE",
+    "AlertRule", "AlertRecord", "RuleSet", "window_mask",
+    "CURRENT_RULES", "EXTREME_CURRENT_RULES", "EXTREME_ROW_RULES", "TREND_RULES", "DAILY_RULES",
+    "CURRENT_ALERTS", "EXTREME_ALERTS", "TREND_STATS", "DEFAULT_RULES", "evaluate_alerts",
+]
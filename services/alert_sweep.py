@@ -0,0 +1,323 @@
+# services/alert_sweep.py
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from services import config
+from services.state import state
+from services.scheduler import get_scheduler
+from services.alert_rules import HOURLY, INFO, SEVERE, WARNING, AlertRule, RuleSet
+from services.storm_alert import (
+    LOW_PRESSURE_FORMATION, STORM_PRESSURE_ALERT, STORM_WIND_ALERT, STORM_WIND_EXTREME,
+)
+from services.alert_thresholds import HEAT_ALERT, RAIN_ALERT, RAIN_EXTREME, TEMP_EXTREME, WIND_ALERT
+from services.open_meteo.cache import forecast_cache, forecast_cache_key
+from services.open_meteo.compact import block_array
+from services.open_meteo.grid import snap_to_grid
+from services.open_meteo.utils import kmh_to_ms_array
+from services.open_meteo.timeaxis import HOUR_S, LOCAL_UTC_OFFSET_S, epoch_to_iso, hourly_axis
+from vietnam_provinces import PROVINCES
+from vietnam_wards import WARDS
+
+logger = logging.getLogger("WeatherService")
+
+ALERT_SWEEP_JOB_ID = "alert_sweep"
+
+# Biến hourly xếp chồng: (tên cột, biến Open-Meteo, đổi km/h → m/s như parse_hourly)
+SWEEP_VARS = [
+    ("temp_c", "temperature_2m", False),
+    ("wind_speed_ms", "windspeed_10m", True),
+    ("wind_gust_ms", "windgusts_10m", True),
+    ("rain_mm", "precipitation", False),
+    ("mslp_hpa", "pressure_msl", False),
+]
+# Cột dẫn xuất: tổng mưa 24 giờ trượt (mm/ngày) kết thúc tại mỗi giờ
+RAIN_24H = "rain_24h_mm"
+
+# Ngưỡng nắng nóng, gió/gió giật, mưa lớn, áp thấp/bão (services.alert_thresholds + storm_alert) trên mảng điểm × giờ
+SWEEP_RULES = RuleSet([
+    AlertRule("STORM_PRESSURE", HOURLY, "mslp_hpa", "<=", STORM_PRESSURE_ALERT,
+              "🌀 Áp suất rất thấp {value:.0f} hPa (tâm bão)", severity=SEVERE),
+    AlertRule("STORM_WIND", HOURLY, "wind_speed_ms", ">=", STORM_WIND_ALERT,
+              "🌀 Gió bão {value:.1f} m/s", severity=SEVERE),
+    # Gió giật ≥ STORM_WIND_EXTREME (~cấp 10) dù gió trung bình chưa tới ngưỡng bão
+    AlertRule("STORM_GUST", HOURLY, "wind_gust_ms", ">=", STORM_WIND_EXTREME,
+              "🌀 Gió giật mạnh {value:.1f} m/s", severity=SEVERE),
+    AlertRule("RAIN_EXTREME", HOURLY, RAIN_24H, ">=", RAIN_EXTREME,
+              "🌧️ Mưa cực lớn {value:.1f} mm/24h", severity=SEVERE),
+    AlertRule("TEMP_EXTREME", HOURLY, "temp_c", ">=", TEMP_EXTREME,
+              "🌡️ Nhiệt độ bất thường {value:.1f}°C", severity=SEVERE),
+    AlertRule("LOW_PRESSURE", HOURLY, "mslp_hpa", "<=", LOW_PRESSURE_FORMATION,
+              "📉 Áp suất thấp {value:.0f} hPa (áp thấp hình thành)"),
+    AlertRule("RAIN_ALERT", HOURLY, RAIN_24H, ">=", RAIN_ALERT, "🌧️ Mưa lớn {value:.1f} mm/24h"),
+    AlertRule("WIND_ALERT", HOURLY, "wind_speed_ms", ">=", WIND_ALERT, "💨 Gió mạnh {value:.1f} m/s"),
+    AlertRule("HEAT_ALERT", HOURLY, "temp_c", ">=", HEAT_ALERT, "🔥 Nắng nóng {value:.1f}°C", severity=INFO),
+])
+_SEVERITY_ORDER = {SEVERE: 0, WARNING: 1, INFO: 2}
+
+
+def sweep_locations() -> List[Dict[str, Any]]:
+    """Toàn bộ tỉnh/thành + phường/xã có tọa độ (phường/xã lấy tên tỉnh từ khóa "Tên__Tỉnh")."""
+    locations = []
+    for name, info in PROVINCES.items():
+        if info.get("lat") is not None and info.get("lon") is not None:
+            locations.append({"name": name, "type": "province", "province": name,
+                              "lat": info["lat"], "lon": info["lon"]})
+    for key, info in WARDS.items():
+        if info.get("lat") is None or info.get("lon") is None:
+            continue
+        name, _, province = key.partition("__")
+        locations.append({"name": name, "key": key, "type": "ward", "province": province or None,
+                          "lat": info["lat"], "lon": info["lon"]})
+    return locations
+
+
+class AlertIndex:
+    """
+    Chỉ mục cảnh báo toàn quốc của một lượt quét:
+    - values: mảng (ô lưới × giờ × biến) dựng từ payload đang có trong cache
+    - masks: mặt nạ (ô lưới × giờ) của từng luật SWEEP_RULES, tính một lần khi quét
+    Truy vấn (luật, số giờ tới, tỉnh, loại địa điểm) chỉ cắt mảng, không đọc lại payload.
+    """
+
+    __slots__ = ("built_at", "start_s", "hours", "variables", "values", "cells", "cell_age_s",
+                 "locations", "loc_cell", "loc_type", "loc_province", "masks", "build_ms")
+
+    def __init__(self, start_s: int, hours: int, variables: List[str], values: np.ndarray,
+                 cells: List[tuple], cell_age_s: np.ndarray, locations: List[dict], loc_cell: np.ndarray):
+        self.built_at = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+        self.start_s = start_s
+        self.hours = hours
+        self.variables = variables
+        self.values = values
+        self.cells = cells
+        self.cell_age_s = cell_age_s
+        self.locations = locations
+        self.loc_cell = loc_cell
+        self.loc_type = np.array([loc["type"] for loc in locations], dtype=object)
+        self.loc_province = np.array([(loc.get("province") or "").lower() for loc in locations], dtype=object)
+        self.build_ms = 0.0
+        self.masks = {rule.code: (rule, vals, mask) for rule, vals, mask in SWEEP_RULES.masks(HOURLY, self.columns)}
+
+    @property
+    def columns(self) -> Dict[str, np.ndarray]:
+        """Tên biến → mảng (ô lưới × giờ) (view của values)."""
+        return {name: self.values[:, :, k] for k, name in enumerate(self.variables)}
+
+    def hour_iso(self, i: int) -> str:
+        return epoch_to_iso(self.start_s + int(i) * HOUR_S, LOCAL_UTC_OFFSET_S)
+
+    def coverage(self) -> Dict[str, Any]:
+        located = self.loc_cell >= 0
+        return {
+            "locations": len(self.locations),
+            "locations_covered": int(located.sum()),
+            "cells": len(self.cells),
+            "max_age_s": round(float(self.cell_age_s.max()), 1) if len(self.cells) else None,
+        }
+
+    def _cell_hits(self, code: str, hours: int) -> Dict[str, np.ndarray]:
+        """Theo ô lưới trong hours giờ tới: có vượt ngưỡng, giờ đầu tiên, số giờ, giá trị cực trị."""
+        rule, vals, mask = self.masks[code]
+        mask, vals = mask[:, :hours], vals[:, :hours]
+        hit = mask.any(axis=1)
+        fill = -np.inf if rule.op in (">=", ">") else np.inf
+        extreme = np.where(mask, vals, fill)
+        peak = extreme.max(axis=1) if fill < 0 else extreme.min(axis=1)
+        return {"hit": hit, "first": mask.argmax(axis=1), "count": mask.sum(axis=1), "peak": peak}
+
+    def summary(self, hours: int = None) -> List[Dict[str, Any]]:
+        """Số ô lưới/địa điểm vượt ngưỡng của từng luật."""
+        hours = self.horizon(hours)
+        out = []
+        for code, (rule, _, _) in self.masks.items():
+            hit = self._cell_hits(code, hours)["hit"]
+            loc_hit = hit[self.loc_cell] & (self.loc_cell >= 0) if len(self.cells) else np.zeros(len(self.loc_cell), bool)
+            out.append({"code": code, "severity": rule.severity, "cells": int(hit.sum()),
+                        "locations": int(loc_hit.sum())})
+        return out
+
+    def horizon(self, hours: Optional[int]) -> int:
+        return self.hours if not hours or hours <= 0 else min(int(hours), self.hours)
+
+    def query(self, code: str = None, hours: int = None, province: str = None, loc_type: str = None,
+              severity: str = None, limit: int = None) -> List[Dict[str, Any]]:
+        """
+        Cảnh báo đang hiệu lực theo địa điểm trong hours giờ tới, lọc theo mã luật/tỉnh/loại/mức độ.
+        Sắp theo mức độ, rồi theo mức vượt ngưỡng (nặng nhất trước).
+        """
+        hours = self.horizon(hours)
+        codes = [c for c in self.masks if code is None or c == code]
+        if severity:
+            codes = [c for c in codes if self.masks[c][0].severity == severity]
+        sel = self.loc_cell >= 0
+        if loc_type:
+            sel &= self.loc_type == loc_type
+        if province:
+            needle = province.strip().lower()
+            sel &= np.array([needle in p for p in self.loc_province], dtype=bool)
+        candidates = np.flatnonzero(sel)
+
+        # Xếp hạng trên mảng (mức độ, mức vượt ngưỡng) rồi mới dựng dict cho phần được trả về
+        hits_by_code, parts = {}, []
+        for c in codes:
+            rule = self.masks[c][0]
+            hits = hits_by_code[c] = self._cell_hits(c, hours)
+            li = candidates[hits["hit"][self.loc_cell[candidates]]]
+            excess = hits["peak"][self.loc_cell[li]] - rule.threshold
+            parts.append((np.full(len(li), _SEVERITY_ORDER.get(rule.severity, 9)),
+                          -excess if rule.op in (">=", ">") else excess, np.full(len(li), len(parts)), li))
+        if not parts:
+            return []
+        sev, excess, code_pos, loc_idx = (np.concatenate(cols) for cols in zip(*parts))
+        order = np.lexsort((loc_idx, excess, sev))
+        if limit:
+            order = order[:limit]
+
+        rows = []
+        for k in order.tolist():
+            c = codes[code_pos[k]]
+            rule, hits = self.masks[c][0], hits_by_code[c]
+            li = int(loc_idx[k])
+            ci = self.loc_cell[li]
+            peak = float(hits["peak"][ci])
+            loc = self.locations[li]
+            rows.append({
+                "code": c,
+                "severity": rule.severity,
+                "name": loc["name"],
+                "type": loc["type"],
+                "province": loc.get("province"),
+                "lat": loc["lat"],
+                "lon": loc["lon"],
+                "first_time": self.hour_iso(hits["first"][ci]),
+                "hours_over": int(hits["count"][ci]),
+                "peak": round(peak, 2),
+                "threshold": rule.threshold,
+                "message": rule.template.format(value=peak, threshold=rule.threshold, time="", steps=1),
+            })
+        return rows
+
+
+def _rolling_sum(values: np.ndarray, window: int) -> np.ndarray:
+    """Tổng trượt window bước kết thúc tại mỗi bước theo trục cuối (NaN tính là 0, đầu chuỗi cộng ít bước hơn)."""
+    csum = np.cumsum(np.nan_to_num(values), axis=-1)
+    out = csum.copy()
+    out[..., window:] -= csum[..., :-window]
+    return np.where(np.isnan(values), np.nan, out)
+
+
+def build_alert_index(hours: int = None, now: datetime = None) -> AlertIndex:
+    """
+    Dựng AlertIndex từ payload đang có trong forecast_cache (không gọi upstream):
+    mỗi ô lưới một hàng, hours giờ tới tính từ giờ hiện tại, các biến SWEEP_VARS + RAIN_24H.
+    Ô lưới chưa có trong cache bị bỏ qua (xem coverage()).
+    """
+    t0 = time.perf_counter()
+    hours = max(1, int(hours or config.ALERT_SWEEP_HOURS))
+    tz_local = timezone(timedelta(seconds=LOCAL_UTC_OFFSET_S))
+    now_local = (now or datetime.now(tz_local)).astimezone(tz_local).replace(minute=0, second=0, microsecond=0)
+    start_s = int(now_local.timestamp())
+
+    locations = sweep_locations()
+    cell_of_loc = [snap_to_grid(loc["lat"], loc["lon"]) for loc in locations]
+    cells, rows, ages = [], [], []
+    cell_row: Dict[tuple, int] = {}
+    # Ô lưới cùng lượt dự báo dùng chung list "time": tính vị trí giờ hiện tại một lần
+    starts: Dict[tuple, tuple] = {}
+    # Bổ sung 23 giờ trước mốc hiện tại để tổng mưa 24h ở giờ đầu đủ cửa sổ
+    lead = 23
+    variables = [name for name, _, _ in SWEEP_VARS]
+    for cell in dict.fromkeys(cell_of_loc):
+        hit = forecast_cache.peek(forecast_cache_key(*cell), raw=True)
+        if hit is None:
+            continue
+        payload, age_s = hit
+        times = (payload.get("hourly") or {}).get("time")
+        if not times:
+            continue
+        offset = payload.get("utc_offset_seconds")
+        offset = LOCAL_UTC_OFFSET_S if offset is None else offset
+        # Giữ list trong giá trị và so bằng is: id() chỉ duy nhất khi đối tượng còn sống
+        axis_key = (id(times), offset)
+        hit = starts.get(axis_key)
+        if hit is None or hit[0] is not times:
+            hit = starts[axis_key] = (times, hourly_axis(times, offset).hour_index(now_local))
+        start = hit[1]
+        if start < 0:
+            continue
+        block = np.full((lead + hours, len(SWEEP_VARS)), np.nan)
+        lo = max(0, start - lead)
+        hi = min(len(times), start + hours)
+        dst = lo - (start - lead)
+        for k, (_, var, to_ms) in enumerate(SWEEP_VARS):
+            arr = block_array(payload, "hourly", var)
+            if arr is not None:
+                seg = arr[lo:hi]
+                block[dst:dst + len(seg), k] = kmh_to_ms_array(seg) if to_ms else seg
+        cell_row[cell] = len(cells)
+        cells.append(cell)
+        rows.append(block)
+        ages.append(age_s)
+
+    if rows:
+        stacked = np.stack(rows)   # (ô lưới × (lead + giờ) × biến)
+        rain = stacked[:, :, variables.index("rain_mm")]
+        rain24 = _rolling_sum(rain, 24)[:, lead:]
+        values = np.concatenate((stacked[:, lead:, :], rain24[:, :, None]), axis=2)
+    else:
+        values = np.zeros((0, hours, len(variables) + 1))
+    loc_cell = np.array([cell_row.get(c, -1) for c in cell_of_loc], dtype=np.int64)
+    index = AlertIndex(start_s, hours, variables + [RAIN_24H], values, cells,
+                       np.array(ages, dtype=float), locations, loc_cell)
+    index.build_ms = round((time.perf_counter() - t0) * 1e3, 1)
+    return index
+
+
+# ===== Chỉ mục dùng chung + job định kỳ =====
+_index: Optional[AlertIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_alert_index(build: bool = True) -> Optional[AlertIndex]:
+    """Chỉ mục của lượt quét gần nhất; chưa có thì quét ngay (chỉ đọc cache nên nhanh)."""
+    if _index is None and build:
+        run_alert_sweep()
+    return _index
+
+
+def run_alert_sweep() -> int:
+    """Một lượt quét toàn quốc, thay chỉ mục dùng chung; trả về số ô lưới đã quét."""
+    global _index
+    try:
+        index = build_alert_index()
+    except Exception as e:
+        logger.warning(f"[alert_sweep] Lỗi khi quét cảnh báo toàn quốc: {e}")
+        return 0
+    with _index_lock:
+        _index = index
+    cov = index.coverage()
+    state["alert_sweep"] = {"built_at": index.built_at, "build_ms": index.build_ms, "hours": index.hours, **cov}
+    logger.info(
+        f"[alert_sweep] {cov['cells']} ô lưới / {cov['locations_covered']}/{cov['locations']} địa điểm "
+        f"trong {index.build_ms} ms"
+    )
+    return cov["cells"]
+
+
+def register_alert_sweep_jobs() -> None:
+    """Đăng ký lượt quét cảnh báo mỗi ALERT_SWEEP_INTERVAL_MIN phút (chạy trên cache prefetch làm nóng)."""
+    if not config.ALERT_SWEEP_ENABLED:
+        logger.info("[alert_sweep] ALERT_SWEEP_ENABLED=false, bỏ qua")
+        return
+    get_scheduler().add_job(
+        run_alert_sweep,
+        "interval",
+        minutes=max(1, config.ALERT_SWEEP_INTERVAL_MIN),
+        id=ALERT_SWEEP_JOB_ID,
+        replace_existing=True,
+    )
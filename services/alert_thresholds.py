@@ -0,0 +1,33 @@
+# services/alert_thresholds.py
+# Ngưỡng cảnh báo dùng chung (utils, alert_rules...); module không import gì để tránh vòng import
+
+# ===== Ngưỡng cảnh báo (chuẩn Việt Nam) =====
+HEAT_ALERT = 32.0         # Nắng nóng (≥32°C đã oi bức)
+RAIN_ALERT = 10.0         # Mưa lớn (≥10 mm/ngày dễ gây ngập úng)
+WIND_ALERT = 8.0          # Gió mạnh (≥8 m/s bắt đầu gây nguy hiểm ngoài trời)
+HUMIDITY_HIGH = 80.0      # Độ ẩm cao (≥80% gây oi bức, dễ cảm lạnh)
+HUMIDITY_LOW = 40.0       # Độ ẩm thấp (≤40% gây khô da)
+COLD_ALERT = 20.0         # Trời lạnh (≤20°C đã lạnh với người VN)
+MSLP_HIGH = 1020.0        # Áp suất cao
+MSLP_LOW = 1008.0         # Áp suất thấp
+SOLAR_ALERT = 600.0       # Bức xạ mặt trời mạnh (≥600 W/m²)
+UV_ALERT = 4.0            # UV cao (≥4 đã cần cảnh báo ở VN)
+
+# ===== Ngưỡng cảnh báo bất thường =====
+TEMP_EXTREME = 40.0       # °C, nhiệt độ cực cao
+WIND_EXTREME = 25.0       # m/s, gió cực mạnh
+RAIN_EXTREME = 100.0      # mm/ngày, mưa cực lớn
+PRESSURE_LOW = 990.0      # hPa, áp suất thấp bất thường
+
+ALERT_DESCRIPTIONS = {
+    "HEAT_ALERT": "🔥 Nắng nóng oi bức nguy hiểm",
+    "RAIN_ALERT": "🌧️ Mưa lớn dễ gây ngập úng",
+    "WIND_ALERT": "💨 Gió mạnh, nguy hiểm ngoài trời",
+    "HUMIDITY_HIGH": "💧 Độ ẩm cao bất thường, dễ gây cảm lạnh",
+    "HUMIDITY_LOW": "🏜️ Độ ẩm thấp bất thường, dễ gây khô da",
+    "COLD_ALERT": "❄️ Trời lạnh bất thường",
+    "MSLP_HIGH": "📈 Áp suất cao bất thường",
+    "MSLP_LOW": "📉 Áp suất thấp bất thường",
+    "SOLAR_ALERT": "🔆 Bức xạ mặt trời mạnh",
+    "UV_ALERT": "☀️ Chỉ số UV cao",
+}
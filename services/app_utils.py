@@ -1,15 +1,19 @@
 # services/app_utils.py
 import re
 import logging
-import requests
 import unicodedata
 from datetime import datetime
 from difflib import get_close_matches
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple
+
+import anyio
 
 from vietnam_provinces import PROVINCES
 from vietnam_wards import WARDS
 from services.error_handler import handle_service_error
+from services.http_client import get_session
+from services.open_meteo.compact import expand_payload
+from services.open_meteo.projection import ISO, Projection, fetch_projected_with_age, fetch_projected_with_age_async
 
 logger = logging.getLogger("WeatherService")
 
@@ -31,7 +35,7 @@ def fallback_geocode(region: str) -> Optional[Dict[str, float]]:
         url = "https://nominatim.openstreetmap.org/search"
         params = {"q": region, "format": "json", "limit": 1}
         headers = {"User-Agent": "WeatherGfsApp/1.0"}
-        resp = requests.get(url, params=params, headers=headers, timeout=10)
+        resp = get_session().get(url, params=params, headers=headers, timeout=10)
         if resp.status_code == 200:
             data = resp.json()
             if data:
@@ -133,42 +137,47 @@ def resolve_region(region: str = None, lat: float = None, lon: float = None) ->
 
     return {"name": "Unknown region", "lat": None, "lon": None, "source": "empty"}
 
+async def resolve_region_async(region: str = None, lat: float = None, lon: float = None) -> Dict[str, Any]:
+    """Bản asyncio của resolve_region. Có lat/lon thì xử lý ngay; tra theo tên (fuzzy match,
+    có thể gọi Nominatim) thì chạy trong threadpool để không chặn event loop."""
+    if lat is not None and lon is not None:
+        return resolve_region(region=region, lat=lat, lon=lon)
+    return await anyio.to_thread.run_sync(lambda: resolve_region(region=region, lat=lat, lon=lon))
+
 # ------------------- WEATHER FETCH -------------------
+WEATHER_HOURLY_VARS = [
+    "temperature_2m","apparent_temperature","dewpoint_2m",
+    "precipitation","precipitation_probability",
+    "relative_humidity_2m",
+    "windspeed_10m","winddirection_10m","windgusts_10m",
+    "cloudcover","cloudcover_low","cloudcover_mid","cloudcover_high",
+    "shortwave_radiation","pressure_msl"
+]
+WEATHER_DAILY_VARS = [
+    "temperature_2m_max","temperature_2m_min","precipitation_sum",
+    "windspeed_10m_max","windgusts_10m_max",
+    "precipitation_hours","sunrise","sunset"
+]
+# Dữ liệu trả raw cho client nên luôn dùng thời gian ISO
+WEATHER_PROJECTION = Projection(WEATHER_HOURLY_VARS, WEATHER_DAILY_VARS, current=True, days=10, timeformat=ISO)
+# /v1/weather_summary chỉ đọc current_weather
+SUMMARY_PROJECTION = Projection(current=True, days=1, timeformat=ISO)
+
 def fetch_weather_data(lat: float, lon: float, days: int = 10) -> Optional[Dict[str, Any]]:
-    """Lấy dữ liệu thời tiết trực tiếp từ Open-Meteo API."""
-    try:
-        hourly_vars = ",".join([
-            "temperature_2m","apparent_temperature","dewpoint_2m",
-            "precipitation","precipitation_probability",
-            "relative_humidity_2m",
-            "windspeed_10m","winddirection_10m","windgusts_10m",
-            "cloudcover","cloudcover_low","cloudcover_mid","cloudcover_high",
-            "shortwave_radiation","pressure_msl"
-        ])
-        daily_vars = ",".join([
-            "temperature_2m_max","temperature_2m_min","precipitation_sum",
-            "windspeed_10m_max","windgusts_10m_max",
-            "precipitation_hours","sunrise","sunset"
-        ])
-        url = (
-            "https://api.open-meteo.com/v1/forecast?"
-            f"latitude={lat}&longitude={lon}"
-            f"&current_weather=true"
-            f"&hourly={hourly_vars}"
-            f"&daily={daily_vars}"
-            f"&timezone=Asia%2FHo_Chi_Minh"
-            f"&forecast_days={days}"
-        )
-        logger.debug(f"[fetch_weather_data] Requesting: {url}")
-        resp = requests.get(url, timeout=30)
-        if resp.status_code == 200:
-            logger.debug("[fetch_weather_data] Response OK")
-            return resp.json()
-        logger.error(f"[fetch_weather_data] HTTP {resp.status_code} for URL: {url}")
-        return None
-    except Exception as e:
-        logger.error(f"[fetch_weather_data] Exception: {e}")
-        return None
+    """Lấy dữ liệu thời tiết Open-Meteo, qua cache in-process (TTL + LRU) theo ô lưới."""
+    return fetch_weather_data_with_age(lat, lon, days)[0]
+
+def fetch_weather_data_with_age(lat: float, lon: float, days: int = 10) -> Tuple[Optional[Dict[str, Any]], Optional[float]]:
+    """Như fetch_weather_data, trả thêm tuổi dữ liệu (giây) để báo data_age_s.
+    Payload rộng hơn đã có trong cache (cùng ô lưới) được dùng lại, không gọi API lần nữa."""
+    data, age_s = fetch_projected_with_age(lat, lon, WEATHER_PROJECTION.with_days(days))
+    return expand_payload(data), age_s
+
+async def fetch_weather_data_with_age_async(lat: float, lon: float, days: int = 10,
+                                            projection: Projection = None) -> Tuple[Optional[Dict[str, Any]], Optional[float]]:
+    """Bản asyncio của fetch_weather_data_with_age (httpx, cùng cache); projection để endpoint chỉ lấy phần cần."""
+    data, age_s = await fetch_projected_with_age_async(lat, lon, projection or WEATHER_PROJECTION.with_days(days))
+    return expand_payload(data), age_s
 
 # ------------------- WEATHER RESPONSE -------------------
 def build_weather_response(region_info: Dict[str, Any], weather_data: Dict[str, Any]) -> Dict[str, Any]:
@@ -1,25 +1,32 @@
 # services/bulletin.py
 import logging
-import pandas as pd
+from functools import partial
+
+import anyio
 from datetime import datetime
 from pytz import timezone
 
 # Import dịch vụ Open-Meteo
-from services.open_meteo.open_meteo import read_cache
-from services.rain_openmeteo import get_precipitation_summary, get_precipitation_current
+from services.open_meteo.open_meteo import ForecastBundle
 
 # Import các module con để sinh bản tin
 from services.current_conditions import generate_current_conditions
 from services.daily_overview import generate_daily_overview
 from services.hourly_forecast import generate_hourly_forecast
-from services.trend_10days import generate_trend_10days, _ensure_ts_local
+from services.trend_10days import generate_trend_10days
 from services.storm_alert import check_storm_alert
 from services.unusual_alert import check_unusual_alert
+from services.alert_rules import evaluate_alerts
+from services.nchmf import STORM, UNUSUAL
+from services.alert_geo import official_alerts_at
 
 from services.utils import (
     safe_float,
     choose_weather_icon,
     _safe_df_records,
+    _ensure_ts_local,
+    _iso_time_fields,
+    as_dataframe,
 )
 
 # Logging
@@ -32,23 +39,38 @@ logger = logging.getLogger(__name__)
 # Múi giờ mặc định Việt Nam (ICT, UTC+7)
 ICT = timezone("Asia/Bangkok")
 
+# ===== Bản asyncio của generate_bulletin (cho route async) =====
+async def generate_bulletin_async(region_name: str, lat: float, lon: float, bundle: ForecastBundle = None):
+    """Tải payload bằng httpx trên event loop, sau đó đẩy phần parse/sinh bản tin
+    (thuần CPU, pandas) sang threadpool để không chặn event loop."""
+    bundle = bundle or ForecastBundle(lat, lon)
+    try:
+        await bundle.load_async()
+    except Exception as e:
+        logger.error(f"Lỗi hệ thống khi tải dữ liệu bản tin: {e}")
+        return {
+            "status": "error",
+            "message": f"Lỗi hệ thống khi tải dữ liệu bản tin: {e}",
+            "hint": "Kiểm tra kết nối API Open-Meteo",
+            "note": "generate_bulletin_async không tải được payload",
+        }
+    return await anyio.to_thread.run_sync(partial(generate_bulletin, region_name, lat, lon, bundle=bundle))
+
 # ===== Hàm 2: Sinh bản tin đầy đủ từ tọa độ =====
-def generate_bulletin(region_name: str, lat: float, lon: float):
-    """Điều phối sinh bản tin thời tiết từ dữ liệu Open-Meteo (chuẩn ICT UTC+7)."""
+def generate_bulletin(region_name: str, lat: float, lon: float, bundle: ForecastBundle = None):
+    """Điều phối sinh bản tin thời tiết từ dữ liệu Open-Meteo (chuẩn ICT UTC+7).
+    Toàn bộ các bước dùng chung một ForecastBundle (một lần gọi API cho mỗi request)."""
     try:
         now_local = datetime.now(ICT)
         today = now_local.date()
 
-        # 1. Đọc dữ liệu từ cache
-        current_df = read_cache(lat, lon, "current")
-        hourly_df = read_cache(lat, lon, "hourly")
-        daily_df = read_cache(lat, lon, "daily")
+        # 1. Đọc dữ liệu từ cache (một payload cho cả current/hourly/daily), giữ dạng ForecastTable
+        bundle = bundle or ForecastBundle(lat, lon)
+        current_tbl = bundle.table("current")
+        hourly_tbl = bundle.table("hourly")
+        daily_tbl = bundle.table("daily")
 
-        current_df = current_df if isinstance(current_df, pd.DataFrame) else pd.DataFrame()
-        hourly_df = hourly_df if isinstance(hourly_df, pd.DataFrame) else pd.DataFrame()
-        daily_df = daily_df if isinstance(daily_df, pd.DataFrame) else pd.DataFrame()
-
-        if current_df.empty and hourly_df.empty and daily_df.empty:
+        if current_tbl.empty and hourly_tbl.empty and daily_tbl.empty:
             return {
                 "status": "error",
                 "message": "Không có dữ liệu từ nguồn",
@@ -56,20 +78,25 @@ def generate_bulletin(region_name: str, lat: float, lon: float):
                 "note": "Thiếu current/hourly/daily"
             }
 
-        # 2. Chuẩn hóa thời gian về ICT
-        hourly_df = _ensure_ts_local(hourly_df) if not hourly_df.empty else hourly_df
-        daily_df = _ensure_ts_local(daily_df) if not daily_df.empty else daily_df
+        # 2. Chuẩn hóa thời gian về ICT (tính một lần cho mỗi payload đã cache)
+        hourly_tbl = bundle.memo("local:hourly", partial(_ensure_ts_local, hourly_tbl))
+        daily_tbl = bundle.memo("local:daily", partial(_ensure_ts_local, daily_tbl))
+
+        # Các module dùng groupby/iterrows cần pandas: đổi một lần cho request (không giữ
+        # DataFrame float64 trong cache, bảng đã lưu gọn)
+        hourly_df = as_dataframe(hourly_tbl)
+        daily_df = as_dataframe(daily_tbl)
 
         # Current an toàn
-        current = current_df.iloc[0].to_dict() if not current_df.empty else {}
+        current = current_tbl.row(0) if not current_tbl.empty else {}
         bulletin = []
         alerts_list = []
         rain_summary = {"current": 0.0, "24h": 0.0, "hourly": [], "10d": []}
 
-        # 3. Lượng mưa (chuẩn ICT)
+        # 3. Lượng mưa (chuẩn ICT) — tính từ cùng payload, không gọi API riêng
         try:
-            rain_summary = get_precipitation_summary(lat, lon)
-            current["rain_now"] = safe_float(get_precipitation_current(lat, lon), 0.0)
+            rain_summary = bundle.rain_summary
+            current["rain_now"] = safe_float(rain_summary.get("current"), 0.0)
             current["rain_mm"] = safe_float(rain_summary.get("current"), current.get("rain_mm", 0.0))
             current["rain_24h"] = safe_float(rain_summary.get("24h"), 0.0)
             current["rain_10d"] = rain_summary.get("10d", [])
@@ -129,10 +156,11 @@ def generate_bulletin(region_name: str, lat: float, lon: float):
 
         # 8. Xu hướng 10 ngày
         if not hourly_df.empty:
-            trend_msgs, dfd_10, stats = generate_trend_10days(
-                hourly_df,
-                today,
-                rain_10d=current.get("rain_10d")
+            # Xu hướng bắt đầu từ giờ hiện tại: giữ theo giờ cùng payload
+            trend_msgs, dfd_10, stats = bundle.memo(
+                "trend_10days",
+                partial(generate_trend_10days, hourly_df, today, rain_10d=current.get("rain_10d")),
+                variant=now_local.strftime("%Y-%m-%dT%H"),
             )
             bulletin.extend(trend_msgs)
         else:
@@ -141,7 +169,7 @@ def generate_bulletin(region_name: str, lat: float, lon: float):
 
         # 9. Cảnh báo bão
         try:
-            storm_alerts = check_storm_alert(current, daily_df)
+            storm_alerts = check_storm_alert(current, daily_df, official_alerts=official_alerts_at(lat, lon, STORM))
             bulletin.append("🚨 Cảnh báo bão:\n" + storm_alerts)
             alerts_list.append(storm_alerts)
         except Exception as e:
@@ -152,7 +180,7 @@ def generate_bulletin(region_name: str, lat: float, lon: float):
 
         # 10. Cảnh báo bất thường
         try:
-            unusual_alerts = check_unusual_alert(current, hourly_df, daily_df)
+            unusual_alerts = check_unusual_alert(current, hourly_df, daily_df, official_alerts=official_alerts_at(lat, lon, UNUSUAL))
             bulletin.append("⚠️ Cảnh báo hiện tượng bất thường:\n" + unusual_alerts)
             alerts_list.append(unusual_alerts)
         except Exception as e:
@@ -161,7 +189,14 @@ def generate_bulletin(region_name: str, lat: float, lon: float):
             bulletin.append("⚠️ Cảnh báo hiện tượng bất thường:\n" + unusual_alerts)
             alerts_list.append(unusual_alerts)
 
-        # 11. Kết quả trả về
+        # 11. Bản ghi cảnh báo có cấu trúc (mọi luật của DEFAULT_RULES trong một lượt)
+        try:
+            alert_records = evaluate_alerts(current, hourly_df, daily_df)
+        except Exception as e:
+            logger.warning(f"Lỗi khi đánh giá bộ luật cảnh báo: {e}")
+            alert_records = []
+
+        # 12. Kết quả trả về
         return {
             "status": "ok",
             "source": src_name,
@@ -170,12 +205,14 @@ def generate_bulletin(region_name: str, lat: float, lon: float):
                 "text": "\n".join(bulletin),
                 "updated_at": now_local.isoformat()
             },
-            "current": current,
-            "hourly": _safe_df_records(hourly_df),
-            "daily": _safe_df_records(daily_df),
+            "current": _iso_time_fields(current),
+            "hourly": _safe_df_records(hourly_tbl),
+            "daily": _safe_df_records(daily_tbl),
             "alerts": alerts_list,
+            "alert_records": alert_records,
             "rain": rain_summary,
-            "trend_stats": stats
+            "trend_stats": stats,
+            "data_age_s": bundle.data_age_s,
         }
 
     except Exception as e:
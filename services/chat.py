@@ -5,8 +5,8 @@ from typing import Optional
 from fastapi import APIRouter, Query
 from fastapi.responses import JSONResponse
 
-from services.app_utils import resolve_region
-from services.bulletin import generate_bulletin
+from services.app_utils import resolve_region_async
+from services.bulletin import generate_bulletin_async
 from services.error_handler import handle_service_error
 
 logger = logging.getLogger("WeatherAPI")
@@ -36,7 +36,7 @@ def clean_nan(obj):
 
 
 @router.get("/v1/chat", tags=["Weather Services"])
-def chat(
+async def chat(
     region: Optional[str] = Query(None, description="Tên địa danh"),
     lat: Optional[float] = Query(None, description="Vĩ độ"),
     lon: Optional[float] = Query(None, description="Kinh độ"),
@@ -47,7 +47,7 @@ def chat(
 
         # 1) Resolve region safely
         try:
-            region_info = resolve_region(region=region, lat=lat, lon=lon)
+            region_info = await resolve_region_async(region=region, lat=lat, lon=lon)
         except Exception as re:
             logger.exception("[chat] resolve_region raised")
             handle_service_error("chat_route", "resolve_region", re, alert_type="system")
@@ -88,7 +88,7 @@ def chat(
 
         # 3) Generate bulletin safely
         try:
-            bulletin_result = generate_bulletin(
+            bulletin_result = await generate_bulletin_async(
                 region_name=region_info.get("name") or (region or "Khu vực"),
                 lat=region_info["lat"],
                 lon=region_info["lon"],
@@ -129,7 +129,9 @@ def chat(
                         "hourly": bulletin_result.get("hourly", []),
                         "daily": bulletin_result.get("daily", []),
                         "alerts": bulletin_result.get("alerts", []),
+                        "alert_records": bulletin_result.get("alert_records", []),
                         "source": bulletin_result.get("source", "open_meteo"),
+                        "data_age_s": bulletin_result.get("data_age_s"),
                         "options": {"group_hours": group_hours},
                     }),
                 },
@@ -3,7 +3,6 @@ import os
 import json
 import psutil
 from dotenv import load_dotenv
-import requests
 from typing import Dict, Any
 
 # 1. Load biến môi trường từ .env
@@ -31,6 +30,54 @@ API_TIMEOUT: int = int(os.getenv("API_TIMEOUT", "20"))
 API_USER_AGENT: str = os.getenv("API_USER_AGENT", "WeatherVietnam/1.0 (+https://example.local)")
 MAX_RETRIES: int = int(os.getenv("MAX_RETRIES", "3"))
 API_TZ: str = os.getenv("API_TZ", "Asia/Ho_Chi_Minh")
+# Yêu cầu Open-Meteo trả thời gian dạng epoch (timeformat=unixtime), parser giữ trục thời gian int64
+OPEN_METEO_UNIXTIME: bool = os.getenv("OPEN_METEO_UNIXTIME", "false").lower() == "true"
+# Định dạng phản hồi forecast: json | flatbuffers (cần openmeteo_sdk, lỗi thì quay về JSON)
+OPEN_METEO_FORMAT: str = os.getenv("OPEN_METEO_FORMAT", "json").strip().lower()
+
+# Forecast cache (in-process, TTL + LRU)
+FORECAST_CACHE_TTL: int = int(os.getenv("FORECAST_CACHE_TTL", "1800"))
+FORECAST_CACHE_MAX_ENTRIES: int = int(os.getenv("FORECAST_CACHE_MAX_ENTRIES", "2048"))
+# Cửa sổ stale-while-revalidate (giây) sau khi hết TTL; 0 = tắt
+FORECAST_CACHE_STALE_GRACE: int = int(os.getenv("FORECAST_CACHE_STALE_GRACE", "3600"))
+# Ngân sách bộ nhớ (MB) cho payload + kết quả parse gắn kèm; 0 = không giới hạn
+FORECAST_CACHE_MAX_MB: int = int(os.getenv("FORECAST_CACHE_MAX_MB", "512"))
+# Lưu chuỗi số trong cache dạng float32/int32 (bung lại đúng giá trị khi đọc)
+FORECAST_CACHE_COMPACT: bool = os.getenv("FORECAST_CACHE_COMPACT", "true").lower() == "true"
+# Số điểm tối đa trong một request nhiều tọa độ
+FORECAST_BATCH_SIZE: int = int(os.getenv("FORECAST_BATCH_SIZE", "50"))
+# Bước lưới (độ) để gom tọa độ lân cận về cùng một ô; 0 = tắt
+GRID_SNAP_DEG: float = float(os.getenv("GRID_SNAP_DEG", "0.1"))
+
+# Shared HTTP client (connection pool + keep-alive)
+HTTP_POOL_HOSTS: int = int(os.getenv("HTTP_POOL_HOSTS", "10"))
+HTTP_POOL_PER_HOST: int = int(os.getenv("HTTP_POOL_PER_HOST", "20"))
+HTTP_KEEPALIVE_EXPIRY: float = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP2_ENABLED: bool = os.getenv("HTTP2_ENABLED", "false").lower() == "true"
+
+# Prefetch scheduler (APScheduler)
+PREFETCH_ENABLED: bool = os.getenv("PREFETCH_ENABLED", "true").lower() == "true"
+PREFETCH_CRON_HOUR: str = os.getenv("PREFETCH_CRON_HOUR", "*")
+PREFETCH_CRON_MINUTE: str = os.getenv("PREFETCH_CRON_MINUTE", "5")
+PREFETCH_SPREAD_S: int = int(os.getenv("PREFETCH_SPREAD_S", "600"))
+PREFETCH_HOT_WARDS: list = [w.strip() for w in os.getenv("PREFETCH_HOT_WARDS", "").split(",") if w.strip()]
+
+# Quét cảnh báo toàn quốc từ cache dự báo (tỉnh/thành + phường/xã)
+ALERT_SWEEP_ENABLED: bool = os.getenv("ALERT_SWEEP_ENABLED", "true").lower() == "true"
+ALERT_SWEEP_INTERVAL_MIN: int = int(os.getenv("ALERT_SWEEP_INTERVAL_MIN", "15"))
+ALERT_SWEEP_HOURS: int = int(os.getenv("ALERT_SWEEP_HOURS", "72"))
+
+# Cảnh báo chính thức NCHMF: poll nền (ETag/If-Modified-Since), giữ trong bộ nhớ
+NCHMF_POLL_ENABLED: bool = os.getenv("NCHMF_POLL_ENABLED", "true").lower() == "true"
+NCHMF_POLL_INTERVAL_MIN: int = int(os.getenv("NCHMF_POLL_INTERVAL_MIN", "10"))
+# Cảnh báo không còn trên feed quá số giờ này thì bỏ khỏi danh sách
+NCHMF_ALERT_TTL_H: int = int(os.getenv("NCHMF_ALERT_TTL_H", "24"))
+NCHMF_TIMEOUT: int = int(os.getenv("NCHMF_TIMEOUT", "10"))
+# Bán kính vùng ảnh hưởng quanh tâm bão (km) khi lọc cảnh báo chính thức theo vị trí
+NCHMF_STORM_RADIUS_KM: float = float(os.getenv("NCHMF_STORM_RADIUS_KM", "300"))
+NCHMF_URL: str = os.getenv("NCHMF_URL", "https://www.nchmf.gov.vn/")
+NCHMF_STORM_RSS: str = os.getenv("NCHMF_STORM_RSS", "https://www.nchmf.gov.vn/rss/bao-canh-bao.xml")
+NCHMF_UNUSUAL_RSS: str = os.getenv("NCHMF_UNUSUAL_RSS", "https://www.nchmf.gov.vn/rss/canh-bao-bat-thuong.xml")
 
 # Monitoring thresholds
 CPU_THRESHOLD: float = float(os.getenv("CPU_THRESHOLD", "80.0"))
@@ -77,7 +124,8 @@ def check_resources(cpu_threshold: float = CPU_THRESHOLD,
 def check_api_connection(url: str = "https://api.open-meteo.com/v1/forecast") -> Dict[str, str]:
     try:
         headers = {"User-Agent": API_USER_AGENT, "Accept": "application/json"}
-        resp = requests.get(url, headers=headers, timeout=API_TIMEOUT)
+        from services.http_client import get_session
+        resp = get_session().get(url, headers=headers, timeout=API_TIMEOUT)
         if resp.status_code == 200:
             return {"status": "ok", "message": "Kết nối thành công."}
         else:
@@ -105,6 +153,45 @@ def get_config() -> Dict[str, Any]:
             "API_USER_AGENT": API_USER_AGENT,
             "MAX_RETRIES": MAX_RETRIES,
             "API_TZ": API_TZ,
+            "OPEN_METEO_UNIXTIME": OPEN_METEO_UNIXTIME,
+            "OPEN_METEO_FORMAT": OPEN_METEO_FORMAT,
+        },
+        "CACHE": {
+            "FORECAST_CACHE_TTL": FORECAST_CACHE_TTL,
+            "FORECAST_CACHE_MAX_ENTRIES": FORECAST_CACHE_MAX_ENTRIES,
+            "FORECAST_CACHE_STALE_GRACE": FORECAST_CACHE_STALE_GRACE,
+            "FORECAST_CACHE_MAX_MB": FORECAST_CACHE_MAX_MB,
+            "FORECAST_CACHE_COMPACT": FORECAST_CACHE_COMPACT,
+            "FORECAST_BATCH_SIZE": FORECAST_BATCH_SIZE,
+            "GRID_SNAP_DEG": GRID_SNAP_DEG,
+        },
+        "HTTP": {
+            "HTTP_POOL_HOSTS": HTTP_POOL_HOSTS,
+            "HTTP_POOL_PER_HOST": HTTP_POOL_PER_HOST,
+            "HTTP_KEEPALIVE_EXPIRY": HTTP_KEEPALIVE_EXPIRY,
+            "HTTP2_ENABLED": HTTP2_ENABLED,
+        },
+        "PREFETCH": {
+            "PREFETCH_ENABLED": PREFETCH_ENABLED,
+            "PREFETCH_CRON_HOUR": PREFETCH_CRON_HOUR,
+            "PREFETCH_CRON_MINUTE": PREFETCH_CRON_MINUTE,
+            "PREFETCH_SPREAD_S": PREFETCH_SPREAD_S,
+            "PREFETCH_HOT_WARDS": PREFETCH_HOT_WARDS,
+        },
+        "ALERT_SWEEP": {
+            "ALERT_SWEEP_ENABLED": ALERT_SWEEP_ENABLED,
+            "ALERT_SWEEP_INTERVAL_MIN": ALERT_SWEEP_INTERVAL_MIN,
+            "ALERT_SWEEP_HOURS": ALERT_SWEEP_HOURS,
+        },
+        "NCHMF": {
+            "NCHMF_POLL_ENABLED": NCHMF_POLL_ENABLED,
+            "NCHMF_POLL_INTERVAL_MIN": NCHMF_POLL_INTERVAL_MIN,
+            "NCHMF_ALERT_TTL_H": NCHMF_ALERT_TTL_H,
+            "NCHMF_TIMEOUT": NCHMF_TIMEOUT,
+            "NCHMF_STORM_RADIUS_KM": NCHMF_STORM_RADIUS_KM,
+            "NCHMF_URL": NCHMF_URL,
+            "NCHMF_STORM_RSS": NCHMF_STORM_RSS,
+            "NCHMF_UNUSUAL_RSS": NCHMF_UNUSUAL_RSS,
         },
         "THRESHOLDS": {
             "CPU_THRESHOLD": CPU_THRESHOLD,
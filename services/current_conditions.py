@@ -7,7 +7,9 @@ from services.utils import (
     choose_weather_icon,
     fmt_unit,
     generate_comment,
+    to_timestamp,
 )
+from services.open_meteo.timeaxis import is_epoch
 from services.meteorology import compute_all_metrics
 from services.wind import compute_wind_metrics, wind_alert
 
@@ -39,6 +41,8 @@ def format_source(src):
 def format_time(ts):
     """Định dạng thời gian quan trắc ISO → DD/MM/YYYY HH:MM (local)."""
     try:
+        if is_epoch(ts):
+            return to_timestamp(ts).strftime("%d/%m/%Y %H:%M")
         ts_str = str(ts)
         if ts_str.endswith("Z"):
             ts_str = ts_str.replace("Z", "+00:00")
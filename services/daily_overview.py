@@ -1,18 +1,14 @@
 # services/daily_overview.py
 import pandas as pd
+from services.alert_thresholds import HEAT_ALERT, COLD_ALERT, WIND_ALERT, RAIN_ALERT, UV_ALERT, SOLAR_ALERT
 from services.utils import (
     safe_float,
     _fmt_mm,
     _fmt_hum,
     _fmt_wind,
     fmt_unit,
-    HEAT_ALERT,
-    COLD_ALERT,
-    WIND_ALERT,
-    RAIN_ALERT,
-    UV_ALERT,
-    SOLAR_ALERT,
     generate_comment,
+    as_dataframe,
 )
 from services.meteorology import compute_all_metrics
 from services.wind import compute_wind_metrics, wind_alert
@@ -20,6 +16,7 @@ from services.wind import compute_wind_metrics, wind_alert
 
 def generate_daily_overview(hourly_df, today, hum=None, rain_24h=None):
     bulletin = []
+    hourly_df = as_dataframe(hourly_df)
 
     # Lọc dữ liệu theo ngày
     if not hourly_df.empty and "ts_local" in hourly_df.columns:
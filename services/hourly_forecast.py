@@ -1,6 +1,7 @@
 # services/hourly_forecast.py
 import pandas as pd
 
+from services.alert_thresholds import HEAT_ALERT, COLD_ALERT, WIND_ALERT, UV_ALERT, SOLAR_ALERT
 from services.utils import (
     safe_float,
     choose_weather_icon,
@@ -8,11 +9,8 @@ from services.utils import (
     _fmt_hum,
     _fmt_wind,
     fmt_unit,
-    HEAT_ALERT,
-    COLD_ALERT,
-    WIND_ALERT,
-    UV_ALERT,
-    SOLAR_ALERT,
+    to_timestamp,
+    as_dataframe,
 )
 from services.meteorology import compute_all_metrics
 
@@ -42,6 +40,7 @@ def generate_hourly_forecast(
     """
 
     bulletin = []
+    hourly_df = as_dataframe(hourly_df)
 
     if hourly_df is None or hourly_df.empty:
         return ["❌ Không có dữ liệu hourly từ nguồn"]
@@ -67,7 +66,7 @@ def generate_hourly_forecast(
         if "ts_local" in next_24.columns and pd.notnull(row.get("ts_local")):
             ts_txt = row["ts_local"].strftime("%H:%M")
         elif row.get("ts"):
-            ts_txt = pd.to_datetime(row.get("ts"), errors="coerce").strftime("%H:%M")
+            ts_txt = to_timestamp(row.get("ts")).strftime("%H:%M")
 
         # Các biến khí tượng
         tval    = row.get("temp_c")
@@ -0,0 +1,97 @@
+# services/http_client.py
+import logging
+import threading
+from typing import Optional
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from services import config
+
+logger = logging.getLogger("WeatherService")
+
+# HTTP client dùng chung toàn tiến trình: giữ kết nối keep-alive, không phải
+# bắt tay TCP/TLS lại cho mỗi lần gọi upstream (Open-Meteo, NCHMF, Nominatim...).
+_session: Optional[requests.Session] = None
+_async_client: Optional[httpx.AsyncClient] = None
+_lock = threading.Lock()
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _build_session() -> requests.Session:
+    session = requests.Session()
+    # pool_maxsize là số kết nối giữ lại theo từng host; khi đầy thì mở thêm kết nối tạm
+    # (không dùng pool_block: requests không có timeout chờ pool, caller có thể treo vô hạn)
+    adapter = HTTPAdapter(
+        pool_connections=config.HTTP_POOL_HOSTS,
+        pool_maxsize=config.HTTP_POOL_PER_HOST,
+        max_retries=0,
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"User-Agent": config.API_USER_AGENT})
+    return session
+
+
+def _build_async_client() -> httpx.AsyncClient:
+    http2 = config.HTTP2_ENABLED and _http2_available()
+    if config.HTTP2_ENABLED and not http2:
+        logger.warning("[http_client] HTTP2_ENABLED=true nhưng chưa cài 'h2', dùng HTTP/1.1")
+    return httpx.AsyncClient(
+        http2=http2,
+        timeout=config.API_TIMEOUT,
+        headers={"User-Agent": config.API_USER_AGENT},
+        limits=httpx.Limits(
+            max_connections=config.HTTP_POOL_HOSTS * config.HTTP_POOL_PER_HOST,
+            max_keepalive_connections=config.HTTP_POOL_PER_HOST,
+            keepalive_expiry=config.HTTP_KEEPALIVE_EXPIRY,
+        ),
+    )
+
+
+def get_session() -> requests.Session:
+    """requests.Session dùng chung (đường sync); tự tạo nếu app chưa gọi startup."""
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """httpx.AsyncClient dùng chung (đường asyncio); tự tạo nếu app chưa gọi startup."""
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        with _lock:
+            if _async_client is None or _async_client.is_closed:
+                _async_client = _build_async_client()
+    return _async_client
+
+
+def startup_http_clients() -> None:
+    """Khởi tạo pool kết nối khi app startup."""
+    get_session()
+    get_async_client()
+    logger.info("🔌 Shared HTTP clients ready (pooled, keep-alive)")
+
+
+async def shutdown_http_clients() -> None:
+    """Đóng pool kết nối khi app shutdown."""
+    global _session, _async_client
+    with _lock:
+        session, client = _session, _async_client
+        _session, _async_client = None, None
+    if session is not None:
+        session.close()
+    if client is not None and not client.is_closed:
+        await client.aclose()
+    logger.info("🔌 Shared HTTP clients closed")
@@ -0,0 +1,340 @@
+# services/nchmf.py
+import hashlib
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urljoin
+
+from lxml import etree, html as lxml_html
+
+from services import config
+from services.state import state
+from services.http_client import get_session
+from services.scheduler import get_scheduler
+
+logger = logging.getLogger("WeatherService")
+
+NCHMF_JOB_ID = "nchmf_poll"
+
+RSS, HTML = "rss", "html"
+STORM, UNUSUAL = "storm", "unusual"
+
+_ATOM = "{http://www.w3.org/2005/Atom}"
+# Parser XML an toàn: không tải DTD/entity ngoài, chịu được feed lỗi nhẹ
+_XML_PARSER = etree.XMLParser(recover=True, resolve_entities=False, no_network=True, huge_tree=False)
+# Khối tin trên trang HTML: chỉ phần tử class "news-item" (không lấy li của menu/điều hướng);
+# khối lồng trong khối khác chỉ tính khối ngoài để không trùng tiêu đề
+_NEWS_ITEM = "contains(concat(' ', normalize-space(@class), ' '), ' news-item ')"
+_HTML_ITEMS = f"//*[{_NEWS_ITEM}][not(ancestor::*[{_NEWS_ITEM}])]"
+
+
+class FeedItem:
+    """Một mục đọc từ feed RSS/Atom hoặc trang HTML."""
+
+    __slots__ = ("title", "link", "guid", "published", "summary")
+
+    def __init__(self, title: str, link: str = None, guid: str = None, published: datetime = None,
+                 summary: str = ""):
+        self.title = title
+        self.link = link
+        self.guid = guid
+        self.published = published
+        self.summary = summary
+
+    def __repr__(self) -> str:
+        return f"FeedItem({self.title!r})"
+
+
+class OfficialAlert:
+    """Cảnh báo chính thức đã khử trùng (theo tiêu đề chuẩn hóa + loại), kèm mốc thời gian.
+    source là tên feed, kind là kiểu feed (rss/html) đã cho ra bản ghi."""
+
+    __slots__ = ("id", "category", "title", "summary", "link", "source", "kind", "published",
+                 "first_seen", "last_seen")
+
+    def __init__(self, id: str, category: str, item: FeedItem, source: str, seen_at: float, kind: str = RSS):
+        self.id = id
+        self.category = category
+        self.title = item.title
+        self.summary = item.summary
+        self.link = item.link
+        self.source = source
+        self.kind = kind
+        self.published = item.published
+        self.first_seen = seen_at
+        self.last_seen = seen_at
+
+    def to_dict(self) -> Dict:
+        def iso(ts: Optional[float]) -> Optional[str]:
+            return datetime.fromtimestamp(ts, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ") if ts else None
+        return {
+            "id": self.id,
+            "category": self.category,
+            "title": self.title,
+            "summary": self.summary,
+            "link": self.link,
+            "source": self.source,
+            "kind": self.kind,
+            "published": self.published.isoformat() if self.published else None,
+            "first_seen": iso(self.first_seen),
+            "last_seen": iso(self.last_seen),
+        }
+
+
+# ===== Parse bằng lxml =====
+def _clean(text: Optional[str]) -> str:
+    return " ".join((text or "").split())
+
+
+def _plain_text(text: Optional[str]) -> str:
+    """description/summary của feed thường chứa HTML: bỏ thẻ, gộp khoảng trắng."""
+    if text and "<" in text:
+        try:
+            text = lxml_html.fromstring(text).text_content()
+        except (etree.ParserError, ValueError):
+            pass
+    return _clean(text)
+
+
+def _parse_date(value: Optional[str]) -> Optional[datetime]:
+    """pubDate (RFC 822) hoặc updated/published (ISO 8601) → datetime; None nếu không đọc được."""
+    value = _clean(value)
+    if not value:
+        return None
+    try:
+        return parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+def parse_rss(content: bytes, base_url: str = "") -> List[FeedItem]:
+    """RSS 2.0 (item) hoặc Atom (entry) → FeedItem; feed hỏng trả list rỗng."""
+    root = etree.fromstring(content, _XML_PARSER) if content else None
+    if root is None:
+        return []
+    items = []
+    for node in root.iter("item"):
+        title = _clean(node.findtext("title"))
+        if title:
+            items.append(FeedItem(title, _clean(node.findtext("link")) or None,
+                                  _clean(node.findtext("guid")) or None, _parse_date(node.findtext("pubDate")),
+                                  _plain_text(node.findtext("description"))))
+    for node in root.iter(f"{_ATOM}entry"):
+        title = _clean(node.findtext(f"{_ATOM}title"))
+        if title:
+            link = node.find(f"{_ATOM}link")
+            href = link.get("href") if link is not None else None
+            items.append(FeedItem(title, urljoin(base_url, href) if href else None,
+                                  _clean(node.findtext(f"{_ATOM}id")) or None,
+                                  _parse_date(node.findtext(f"{_ATOM}updated") or node.findtext(f"{_ATOM}published")),
+                                  _plain_text(node.findtext(f"{_ATOM}summary") or node.findtext(f"{_ATOM}content"))))
+    return items
+
+
+def parse_html(content: str, base_url: str = "") -> List[FeedItem]:
+    """Trang tin NCHMF (đã giải mã, resp.text): mỗi khối .news-item là một mục
+    (tiêu đề = chữ của thẻ a đầu tiên, không có thì toàn bộ chữ của khối; link = thẻ a đó)."""
+    if not content:
+        return []
+    try:
+        doc = lxml_html.fromstring(content)
+    except (etree.ParserError, ValueError):
+        return []
+    items = []
+    for node in doc.xpath(_HTML_ITEMS):
+        link = next(iter(node.xpath(".//a[@href]")), None)
+        title = _clean(link.text_content() if link is not None else None) or _clean(node.text_content())
+        if not title:
+            continue
+        href = link.get("href") if link is not None else None
+        items.append(FeedItem(title, urljoin(base_url, href) if href else None))
+    return items
+
+
+# ===== Bộ lọc theo loại cảnh báo =====
+def _is_storm(title: str) -> bool:
+    from services.storm_alert import STORM_KEYWORDS
+    return any(k in title for k in STORM_KEYWORDS)
+
+
+def _is_unusual(title: str) -> bool:
+    from services.unusual_alert import _EVENTS_RE
+    return bool(_EVENTS_RE.search(title))
+
+
+CATEGORY_FILTERS: Dict[str, Callable[[str], bool]] = {STORM: _is_storm, UNUSUAL: _is_unusual}
+
+
+class Feed:
+    """Một nguồn poll: URL, kiểu (rss/html), các loại cảnh báo lọc từ nguồn này
+    và validator của lần tải trước (ETag/Last-Modified) để gửi request có điều kiện."""
+
+    __slots__ = ("name", "url", "kind", "categories", "etag", "last_modified", "items", "status", "checked_at")
+
+    def __init__(self, name: str, url: str, kind: str, categories: Tuple[str, ...]):
+        self.name = name
+        self.url = url
+        self.kind = kind
+        self.categories = categories
+        self.etag: Optional[str] = None
+        self.last_modified: Optional[str] = None
+        self.items: List[FeedItem] = []
+        self.status: Optional[str] = None
+        self.checked_at: Optional[float] = None
+
+    def conditional_headers(self) -> Dict[str, str]:
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    def fetch(self, session=None) -> List[FeedItem]:
+        """Tải feed; 304 Not Modified thì dùng lại các mục đã parse lần trước (không parse lại)."""
+        resp = (session or get_session()).get(self.url, headers=self.conditional_headers(),
+                                              timeout=config.NCHMF_TIMEOUT)
+        self.checked_at = time.time()
+        if resp.status_code == 304:
+            self.status = "not_modified"
+            return self.items
+        resp.raise_for_status()
+        # XML tự khai báo encoding (bytes); HTML dùng resp.text như requests giải mã
+        self.items = parse_rss(resp.content, self.url) if self.kind == RSS else parse_html(resp.text, self.url)
+        self.etag = resp.headers.get("ETag")
+        self.last_modified = resp.headers.get("Last-Modified")
+        self.status = "ok"
+        return self.items
+
+    def stats(self) -> Dict:
+        return {"url": self.url, "kind": self.kind, "status": self.status, "items": len(self.items),
+                "etag": bool(self.etag), "last_modified": bool(self.last_modified)}
+
+
+def default_feeds() -> List[Feed]:
+    """Chỉ hai RSS chính thức (bão/áp thấp, hiện tượng bất thường). Trang chủ HTML không được
+    poll mặc định: tin thường/menu khớp từ khóa sẽ thành cảnh báo chính thức và che mất phân tích mô hình."""
+    return [
+        Feed("storm_rss", config.NCHMF_STORM_RSS, RSS, (STORM,)),
+        Feed("unusual_rss", config.NCHMF_UNUSUAL_RSS, RSS, (UNUSUAL,)),
+    ]
+
+
+def _alert_id(category: str, title: str) -> str:
+    return hashlib.sha1(f"{category}|{title.casefold()}".encode("utf-8")).hexdigest()[:16]
+
+
+class OfficialAlertStore:
+    """
+    Tập cảnh báo chính thức trong bộ nhớ, cập nhật bởi poller nền:
+    cùng tiêu đề (chuẩn hóa) + loại từ nhiều feed/lần poll chỉ giữ một bản ghi,
+    bản ghi không còn xuất hiện quá ttl_s thì bị bỏ. Đọc không gọi mạng.
+    """
+
+    def __init__(self, feeds: List[Feed] = None, ttl_s: float = None):
+        self.feeds = feeds if feeds is not None else default_feeds()
+        self.ttl_s = float(config.NCHMF_ALERT_TTL_H * 3600 if ttl_s is None else ttl_s)
+        self._alerts: Dict[str, OfficialAlert] = {}
+        self._lock = threading.Lock()
+        self.version = 0
+        self.last_poll: Optional[float] = None
+
+    def poll(self, session=None) -> int:
+        """Poll mọi feed một lượt; lỗi một feed không ảnh hưởng feed khác. Trả về số cảnh báo đang giữ."""
+        now = time.time()
+        seen: List[Tuple[str, FeedItem, Feed]] = []
+        for feed in self.feeds:
+            try:
+                items = feed.fetch(session)
+            except Exception as e:
+                feed.status = f"error: {e}"
+                logger.warning(f"[nchmf] Lỗi khi tải {feed.name} ({feed.url}): {e}")
+                continue
+            for item in items:
+                key = item.title.lower()
+                for category in feed.categories:
+                    if CATEGORY_FILTERS[category](key):
+                        seen.append((category, item, feed))
+        with self._lock:
+            before = set(self._alerts)
+            changed = False
+            for category, item, feed in seen:
+                aid = _alert_id(category, item.title)
+                alert = self._alerts.get(aid)
+                if alert is None:
+                    self._alerts[aid] = OfficialAlert(aid, category, item, feed.name, now, feed.kind)
+                    continue
+                alert.last_seen = now
+                alert.link = alert.link or item.link
+                alert.published = alert.published or item.published
+                # Tin cùng tiêu đề được cập nhật (vị trí tâm bão mới...): giữ nội dung mới nhất
+                if item.summary and item.summary != alert.summary:
+                    alert.summary = item.summary
+                    changed = True
+            for aid in [a for a, alert in self._alerts.items() if now - alert.last_seen > self.ttl_s]:
+                del self._alerts[aid]
+            if changed or set(self._alerts) != before:
+                self.version += 1
+            self.last_poll = now
+            return len(self._alerts)
+
+    def alerts(self, category: str = None) -> List[OfficialAlert]:
+        """Cảnh báo đang giữ (mới nhất trước), lọc theo loại nếu có."""
+        with self._lock:
+            out = [a for a in self._alerts.values() if category is None or a.category == category]
+        return sorted(out, key=lambda a: (a.published.timestamp() if a.published else a.first_seen), reverse=True)
+
+    def titles(self, category: str = None) -> List[str]:
+        return [a.title for a in self.alerts(category)]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            counts = {}
+            for alert in self._alerts.values():
+                counts[alert.category] = counts.get(alert.category, 0) + 1
+        return {
+            "last_poll": datetime.fromtimestamp(self.last_poll, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+            if self.last_poll else None,
+            "version": self.version,
+            "alerts": counts,
+            "feeds": {feed.name: feed.stats() for feed in self.feeds},
+        }
+
+
+# Tập cảnh báo dùng chung toàn tiến trình
+official_store = OfficialAlertStore()
+
+
+def official_alerts(category: str = STORM) -> List[str]:
+    """Tiêu đề cảnh báo chính thức đang hiệu lực (đọc bộ nhớ, không gọi NCHMF) để truyền vào
+    check_storm_alert/check_unusual_alert(official_alerts=...)."""
+    return official_store.titles(category)
+
+
+def run_nchmf_poll() -> int:
+    count = official_store.poll()
+    state["nchmf"] = official_store.stats()
+    return count
+
+
+def register_nchmf_jobs() -> None:
+    """Poll NCHMF mỗi NCHMF_POLL_INTERVAL_MIN phút + một lượt ngay khi khởi động."""
+    if not config.NCHMF_POLL_ENABLED:
+        logger.info("[nchmf] NCHMF_POLL_ENABLED=false, bỏ qua")
+        return
+    scheduler = get_scheduler()
+    scheduler.add_job(
+        run_nchmf_poll,
+        "interval",
+        minutes=max(1, config.NCHMF_POLL_INTERVAL_MIN),
+        id=NCHMF_JOB_ID,
+        replace_existing=True,
+    )
+    scheduler.add_job(run_nchmf_poll, id=f"{NCHMF_JOB_ID}_startup", replace_existing=True)
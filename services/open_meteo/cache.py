@@ -0,0 +1,440 @@
+# services/open_meteo/cache.py
+import sys
+import time
+import asyncio
+import threading
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+from services import config
+from services.open_meteo.utils import HOURLY_VARS, DAILY_VARS
+from services.open_meteo.compact import CompactPayload, compact_payload, expand_payload
+from services.open_meteo.singleflight import SingleFlight
+
+logger = logging.getLogger("WeatherService")
+
+
+def make_cache_key(lat: float, lon: float, variables: Iterable[str] = (), ndigits: int = 4) -> Tuple:
+    """Khóa cache: tọa độ đã chuẩn hóa + tập biến yêu cầu (không phụ thuộc thứ tự)."""
+    return (round(float(lat), ndigits), round(float(lon), ndigits), tuple(sorted(set(variables))))
+
+
+def forecast_cache_key(lat: float, lon: float, forecast_days: int = None) -> Tuple:
+    """Khóa cache cho payload đầy đủ của build_api_url."""
+    days = int(forecast_days or config.FORECAST_DAYS)
+    variables = [f"hourly:{v}" for v in HOURLY_VARS] + [f"daily:{v}" for v in DAILY_VARS]
+    extra = ["current_weather", f"days:{days}"]
+    if config.OPEN_METEO_UNIXTIME:
+        extra.append("timeformat:unixtime")
+    if config.OPEN_METEO_FORMAT != "json":
+        extra.append(f"format:{config.OPEN_METEO_FORMAT}")
+    return make_cache_key(lat, lon, variables + extra)
+
+
+def approx_size(obj: Any) -> int:
+    """Ước lượng nhanh bộ nhớ (byte) của payload/kết quả dẫn xuất để tính vào ngân sách cache.
+    List chỉ đo phần tử đầu rồi nhân số phần tử (mọi phần tử cùng kiểu), không duyệt toàn bộ."""
+    if obj is None:
+        return 0
+    if hasattr(obj, "memory_usage") and hasattr(obj, "columns"):   # DataFrame
+        return int(obj.memory_usage(index=True, deep=False).sum())
+    nbytes = getattr(obj, "nbytes", None)                          # ndarray, ForecastTable
+    if isinstance(nbytes, int):
+        return nbytes
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(approx_size(k) + approx_size(v) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)):
+        if not obj:
+            return sys.getsizeof(obj)
+        first = obj[0]
+        if isinstance(first, (dict, list, tuple)) or hasattr(first, "nbytes") or hasattr(first, "columns"):
+            return sys.getsizeof(obj) + sum(approx_size(v) for v in obj)
+        return sys.getsizeof(obj) + len(obj) * sys.getsizeof(first)
+    return sys.getsizeof(obj)
+
+
+class CacheEntry:
+    """Một bản ghi trong cache: payload + thời điểm tải + các kết quả dẫn xuất
+    (bảng đã parse, chỉ mục giờ địa phương, tổng hợp mưa...) tính lần đầu rồi giữ lại.
+    Làm mới payload tạo CacheEntry mới nên mọi kết quả dẫn xuất bị bỏ cùng lúc.
+    FORECAST_CACHE_COMPACT: payload giữ dạng CompactPayload (float32/int32); đọc ra vẫn ở dạng gọn
+    (parser đọc thẳng PackedSeries), chỉ chỗ trả JSON thô mới bung bằng expand_payload."""
+    __slots__ = ("_data", "fetched_at", "expires_at", "stale_until", "derived", "size_bytes")
+
+    def __init__(self, data: Any, ttl_s: float, stale_grace_s: float = 0.0):
+        now = time.monotonic()
+        self._data = compact_payload(data) if config.FORECAST_CACHE_COMPACT else data
+        self.derived: Dict[str, Tuple[Hashable, Any, int]] = {}
+        self.size_bytes = approx_size(self._data)
+        self.fetched_at = now
+        self.expires_at = now + ttl_s
+        self.stale_until = self.expires_at + max(0.0, stale_grace_s)
+
+    @property
+    def data(self) -> Any:
+        return self._data
+
+    def owns(self, data: Any) -> bool:
+        """data là payload của bản ghi này (chính nó hoặc bản đã bung đang dùng)."""
+        stored = self._data
+        return stored is data or (isinstance(stored, CompactPayload) and stored.owns(data))
+
+    @property
+    def age_s(self) -> float:
+        return time.monotonic() - self.fetched_at
+
+    def is_fresh(self) -> bool:
+        return time.monotonic() < self.expires_at
+
+    def is_servable(self) -> bool:
+        """Còn hạn hoặc đã hết hạn nhưng vẫn trong cửa sổ stale-while-revalidate."""
+        return time.monotonic() < self.stale_until
+
+
+class ForecastCache:
+    """
+    Cache dự báo trong bộ nhớ tiến trình: TTL + giới hạn số bản ghi, loại bỏ theo LRU.
+    Thread-safe (các handler sync chạy trên threadpool của Starlette).
+    Khi miss, các caller đồng thời cùng khóa được gộp qua single-flight
+    nên mỗi khóa chỉ có một request upstream tại một thời điểm.
+    Stale-while-revalidate: bản ghi hết hạn nhưng còn trong stale_grace_s được trả
+    ngay, đồng thời chạy một lần làm mới nền; lỗi upstream không xóa bản ghi cũ.
+    """
+
+    def __init__(self, ttl_s: float = 1800, max_entries: int = 2048,
+                 stale_grace_s: float = 0.0, refresh_workers: int = 4, max_bytes: int = 0):
+        self.ttl_s = float(ttl_s)
+        self.max_entries = int(max_entries)
+        # Ngân sách bộ nhớ (payload + kết quả dẫn xuất); 0 = chỉ giới hạn theo số bản ghi
+        self.max_bytes = int(max_bytes)
+        self.bytes = 0
+        self.derived_hits = 0
+        self.derived_misses = 0
+        self.stale_grace_s = float(stale_grace_s)
+        self.refresh_workers = int(refresh_workers)
+        self._entries: "OrderedDict[Hashable, CacheEntry]" = OrderedDict()
+        # Chỉ mục ô lưới → các khóa đang có (khóa dạng (lat, lon, biến) của make_cache_key)
+        self._by_cell: Dict[Tuple, set] = {}
+        self._lock = threading.RLock()
+        self._refreshing = set()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # Giữ tham chiếu mạnh tới task làm mới nền (event loop chỉ giữ weakref)
+        self._refresh_tasks: set = set()
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+        self.evictions = 0
+        self.flight = SingleFlight()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_s > 0 and self.max_entries > 0
+
+    @staticmethod
+    def _cell_of(key: Hashable) -> Optional[Tuple]:
+        return key[:2] if isinstance(key, tuple) and len(key) == 3 else None
+
+    def _drop(self, key: Hashable) -> None:
+        """Xóa bản ghi và gỡ khỏi chỉ mục ô lưới (gọi khi đang giữ lock)."""
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry.size_bytes
+        cell = self._cell_of(key)
+        keys = self._by_cell.get(cell)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_cell[cell]
+
+    def _lookup(self, key: Hashable) -> Tuple[Optional[CacheEntry], str]:
+        """Trả về (entry, trạng thái) với trạng thái 'fresh' | 'stale' | 'miss'; có tính hit/miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.is_fresh():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry, "fresh"
+            if entry is not None and entry.is_servable():
+                self._entries.move_to_end(key)
+                self.stale_hits += 1
+                return entry, "stale"
+            if entry is not None:
+                self._drop(key)
+            self.misses += 1
+            return None, "miss"
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Trả về payload còn hạn, hoặc None (tính là miss)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or not entry.is_fresh():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.data
+
+    def set(self, key: Hashable, data: Any) -> Any:
+        """Ghi payload vào cache, loại bỏ bản ghi ít dùng nhất nếu vượt giới hạn.
+        Trả về payload như khi đọc lại từ cache (dạng gọn nếu FORECAST_CACHE_COMPACT)."""
+        if not self.enabled:
+            # Không lưu nhưng vẫn trả cùng dạng như khi đọc từ cache (caller dùng tiếp kết quả)
+            return compact_payload(data) if config.FORECAST_CACHE_COMPACT else data
+        entry = CacheEntry(data, self.ttl_s, self.stale_grace_s)
+        with self._lock:
+            old = self._entries.get(key)
+            if old is not None:
+                self.bytes -= old.size_bytes
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            self.bytes += entry.size_bytes
+            cell = self._cell_of(key)
+            if cell is not None:
+                self._by_cell.setdefault(cell, set()).add(key)
+            self._enforce_budget()
+        return entry.data
+
+    def _enforce_budget(self) -> None:
+        """Loại bản ghi cũ nhất (LRU) khi vượt số bản ghi hoặc ngân sách bộ nhớ; luôn giữ bản ghi mới nhất."""
+        while len(self._entries) > self.max_entries or (
+            self.max_bytes > 0 and self.bytes > self.max_bytes and len(self._entries) > 1
+        ):
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+
+    def memo(self, key: Hashable, data: Any, name: str, build: Callable[[], Any], variant: Hashable = None) -> Any:
+        """
+        Kết quả dẫn xuất name của payload data (khóa key): tính lần đầu bằng build() rồi gắn vào
+        bản ghi cache; variant khác lần trước (ví dụ giờ hiện tại) thì tính lại.
+        data không còn là payload đang cache (đã làm mới/bị loại) thì chỉ tính, không lưu.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            hit = entry.derived.get(name) if entry is not None and entry.owns(data) else None
+            if hit is not None and hit[0] == variant:
+                self.derived_hits += 1
+                return hit[1]
+            self.derived_misses += 1
+        value = build()
+        if entry is None or not entry.owns(data):
+            return value
+        size = approx_size(value)
+        with self._lock:
+            if self._entries.get(key) is entry:
+                old = entry.derived.get(name)
+                entry.derived[name] = (variant, value, size)
+                delta = size - (old[2] if old else 0)
+                entry.size_bytes += delta
+                self.bytes += delta
+                self._entries.move_to_end(key)
+                self._enforce_budget()
+        return value
+
+    def find_fresh(self, cell: Tuple, accept: Callable[[Hashable, Any], bool],
+                   prefer: Hashable = None) -> Optional[Tuple[Hashable, Any, float]]:
+        """Tìm bản ghi còn hạn của ô lưới cell mà accept(key, data) chấp nhận (ưu tiên khóa prefer).
+        Trả (key, data, tuổi giây) và tính là hit; không thấy thì trả None (không tính miss)."""
+        with self._lock:
+            keys = list(self._by_cell.get(cell, ()))
+        if prefer in keys:
+            keys.remove(prefer)
+            keys.insert(0, prefer)
+        for key in keys:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is None or not entry.is_fresh():
+                    continue
+            data = entry.data
+            if accept(key, data):
+                with self._lock:
+                    if key in self._entries:
+                        self._entries.move_to_end(key)
+                    self.hits += 1
+                return key, data, entry.age_s
+        return None
+
+    def _peek(self, key: Hashable) -> Optional[CacheEntry]:
+        """Đọc bản ghi còn hạn mà không tính hit/miss (dùng khi kiểm tra lại sau single-flight)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry if entry is not None and entry.is_fresh() else None
+
+    def peek(self, key: Hashable, stale: bool = True, raw: bool = False) -> Optional[Tuple[Any, float]]:
+        """(payload, tuổi giây) đang có của khóa mà không tính hit/miss, không gọi upstream
+        (stale=True: nhận cả bản hết hạn còn trong stale_grace_s). raw=True trả dạng lưu trong
+        cache (CompactPayload) để đọc mảng trực tiếp, không bung list (quét hàng loạt ô lưới);
+        mặc định trả dict JSON đã bung."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or not (entry.is_servable() if stale else entry.is_fresh()):
+                return None
+        return (entry.data if raw else expand_payload(entry.data)), entry.age_s
+
+    def _loader(self, key: Hashable, loader: Callable[[], Any]) -> Callable[[], Tuple[Any, float]]:
+        def load():
+            # Caller dẫn đầu trước đó có thể vừa ghi cache xong
+            cached = self._peek(key)
+            if cached is not None:
+                return cached.data, cached.age_s
+            fresh = loader()
+            if fresh:
+                fresh = self.set(key, fresh)
+            return fresh, 0.0
+        return load
+
+    def _async_loader(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Callable[[], Awaitable[Tuple[Any, float]]]:
+        async def load():
+            cached = self._peek(key)
+            if cached is not None:
+                return cached.data, cached.age_s
+            fresh = await loader()
+            if fresh:
+                fresh = self.set(key, fresh)
+            return fresh, 0.0
+        return load
+
+    def _claim_refresh(self, key: Hashable) -> bool:
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            self.refreshes += 1
+            return True
+
+    def _release_refresh(self, key: Hashable) -> None:
+        with self._lock:
+            self._refreshing.discard(key)
+
+    def _refresh_in_background(self, key: Hashable, loader: Callable[[], Any]) -> None:
+        """Chạy một lần làm mới nền cho khóa (bỏ qua nếu đã có lần làm mới đang chạy)."""
+        if not self._claim_refresh(key):
+            return
+
+        def run():
+            try:
+                self.flight.do(key, self._loader(key, loader))
+            except Exception as e:
+                with self._lock:
+                    self.refresh_errors += 1
+                logger.warning(f"[forecast_cache] Background refresh failed for {key[:2]}: {e}")
+            finally:
+                self._release_refresh(key)
+
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=max(1, self.refresh_workers),
+                    thread_name_prefix="forecast-refresh",
+                )
+            executor = self._executor
+        executor.submit(run)
+
+    def _refresh_in_background_async(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> None:
+        if not self._claim_refresh(key):
+            return
+
+        async def run():
+            try:
+                await self.flight.do_async(key, self._async_loader(key, loader))
+            except Exception as e:
+                with self._lock:
+                    self.refresh_errors += 1
+                logger.warning(f"[forecast_cache] Background refresh failed for {key[:2]}: {e}")
+            finally:
+                self._release_refresh(key)
+
+        task = asyncio.ensure_future(run())
+        self._refresh_tasks.add(task)
+        task.add_done_callback(self._refresh_tasks.discard)
+
+    def refresh(self, key: Hashable, loader: Callable[[], Any]) -> bool:
+        """Tải lại khóa ngay (bỏ qua TTL), dùng cho prefetch; trả True nếu tải được payload hợp lệ."""
+        def load():
+            fresh = loader()
+            if fresh:
+                fresh = self.set(key, fresh)
+            return fresh, 0.0
+        data, _ = self.flight.do(key, load)
+        return bool(data)
+
+    def get_or_load_with_age(self, key: Hashable, loader: Callable[[], Any]) -> Tuple[Any, Optional[float]]:
+        """Như get_or_load nhưng trả thêm tuổi dữ liệu (giây) — 0.0 nếu vừa tải từ upstream."""
+        if not self.enabled:
+            return self.flight.do(key, loader), 0.0
+        entry, state = self._lookup(key)
+        if state == "fresh":
+            return entry.data, entry.age_s
+        if state == "stale":
+            self._refresh_in_background(key, loader)
+            return entry.data, entry.age_s
+        return self.flight.do(key, self._loader(key, loader))
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """Đọc cache, nếu miss thì gọi loader; chỉ lưu kết quả hợp lệ (khác rỗng)."""
+        return self.get_or_load_with_age(key, loader)[0]
+
+    async def get_or_load_with_age_async(self, key: Hashable,
+                                         loader: Callable[[], Awaitable[Any]]) -> Tuple[Any, Optional[float]]:
+        """Phiên bản asyncio của get_or_load_with_age: loader là coroutine function."""
+        if not self.enabled:
+            return await self.flight.do_async(key, loader), 0.0
+        entry, state = self._lookup(key)
+        if state == "fresh":
+            return entry.data, entry.age_s
+        if state == "stale":
+            self._refresh_in_background_async(key, loader)
+            return entry.data, entry.age_s
+        return await self.flight.do_async(key, self._async_loader(key, loader))
+
+    async def get_or_load_async(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Phiên bản asyncio của get_or_load: loader là coroutine function."""
+        return (await self.get_or_load_with_age_async(key, loader))[0]
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._drop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_cell.clear()
+            self.bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """Thống kê hit/miss phục vụ /health."""
+        with self._lock:
+            total = self.hits + self.stale_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_s": self.ttl_s,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "stale_grace_s": self.stale_grace_s,
+                "stale_hits": self.stale_hits,
+                "refreshes": self.refreshes,
+                "refresh_errors": self.refresh_errors,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "derived_hits": self.derived_hits,
+                "derived_misses": self.derived_misses,
+                "singleflight": self.flight.stats(),
+            }
+
+
+# Cache dùng chung toàn tiến trình
+forecast_cache = ForecastCache(
+    ttl_s=config.FORECAST_CACHE_TTL,
+    max_entries=config.FORECAST_CACHE_MAX_ENTRIES,
+    stale_grace_s=config.FORECAST_CACHE_STALE_GRACE,
+    max_bytes=config.FORECAST_CACHE_MAX_MB * 1024 * 1024,
+)
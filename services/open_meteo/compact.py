@@ -0,0 +1,289 @@
+# services/open_meteo/compact.py
+import sys
+import threading
+import weakref
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+# Số chữ số thập phân tối đa thử khi nén float64 → float32 (giá trị Open-Meteo ≤ 3 chữ số)
+_MAX_NDIGITS = 4
+# Cột chuỗi có số giá trị khác nhau không quá ngưỡng này mới lưu dạng mã
+_MAX_DISTINCT = 64
+
+
+class CategoryTable:
+    """Bảng chuỗi dùng chung toàn tiến trình (weather_desc, source...): mỗi chuỗi một mã int16."""
+
+    __slots__ = ("_values", "_index", "_lock")
+
+    def __init__(self):
+        self._values: List[str] = []
+        self._index: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def encode(self, values) -> Optional[np.ndarray]:
+        """Mảng chuỗi/None → mã int16 (-1 = None); None nếu bảng đã đầy."""
+        with self._lock:
+            for v in set(values):
+                if v is not None and v not in self._index:
+                    if len(self._values) >= np.iinfo(np.int16).max:
+                        return None
+                    self._index[v] = len(self._values)
+                    self._values.append(v)
+            index = self._index
+            return np.fromiter((-1 if v is None else index[v] for v in values), dtype=np.int16, count=len(values))
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        lookup = np.empty(len(self._values) + 1, dtype=object)
+        lookup[:-1] = self._values
+        lookup[-1] = None
+        return lookup[codes]
+
+
+CATEGORIES = CategoryTable()
+
+
+class PackedSeries:
+    """
+    Một chuỗi giá trị lưu gọn trong cache, bung ra lại đúng giá trị gốc khi cần:
+    - "f32": float32 + số chữ số thập phân (NaN = None), bung bằng round(float64, ndigits)
+    - "int": int32 (chuỗi toàn số nguyên, không có None)
+    - "cat": mã int16 vào CATEGORIES
+    """
+
+    __slots__ = ("values", "kind", "ndigits")
+
+    def __init__(self, values: np.ndarray, kind: str, ndigits: int = 0):
+        self.values = values
+        self.kind = kind
+        self.ndigits = ndigits
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __getitem__(self, index) -> "PackedSeries":
+        """Cắt theo slice/mảng index/mặt nạ, vẫn giữ dạng gọn."""
+        return PackedSeries(self.values[index], self.kind, self.ndigits)
+
+    @property
+    def nbytes(self) -> int:
+        return self.values.nbytes
+
+    def to_numpy(self) -> np.ndarray:
+        """float64 (NaN ở chỗ thiếu) / int64 / object như trước khi nén."""
+        if self.kind == "f32":
+            return np.round(self.values.astype(np.float64), self.ndigits)
+        if self.kind == "int":
+            return self.values.astype(np.int64)
+        return CATEGORIES.decode(self.values)
+
+    def item(self, i: int):
+        """Phần tử thứ i như trong payload JSON gốc (None ở chỗ thiếu)."""
+        if self.kind == "f32":
+            v = float(self.values[i])
+            return None if v != v else round(v, self.ndigits)
+        if self.kind == "int":
+            return int(self.values[i])
+        code = int(self.values[i])
+        return None if code < 0 else CATEGORIES.decode(np.array([code]))[0]
+
+    def tolist(self) -> list:
+        """List Python như payload JSON gốc (NaN → None)."""
+        out = self.to_numpy().tolist()
+        if self.kind == "f32" and np.isnan(self.values).any():
+            out = [None if v != v else v for v in out]
+        return out
+
+
+def _lossless_ndigits(vals: np.ndarray) -> Optional[int]:
+    """Số chữ số nhỏ nhất để float32 bung lại đúng từng giá trị float64; None nếu không được."""
+    packed = vals.astype(np.float32)
+    wide = packed.astype(np.float64)
+    for nd in range(_MAX_NDIGITS + 1):
+        if np.array_equal(np.round(wide, nd), vals, equal_nan=True):
+            return nd
+    return None
+
+
+def pack_array(vals: np.ndarray) -> Optional[PackedSeries]:
+    """Cột ndarray → PackedSeries nếu nén được không mất mát, ngược lại None."""
+    if vals.dtype == np.float64:
+        nd = _lossless_ndigits(vals)
+        return PackedSeries(vals.astype(np.float32), "f32", nd) if nd is not None else None
+    if vals.dtype.kind == "O" and len(vals):
+        if all(v is None or type(v) is str for v in vals) and len(set(vals)) <= _MAX_DISTINCT:
+            if all(v is None for v in vals):
+                return None
+            codes = CATEGORIES.encode(vals)
+            return PackedSeries(codes, "cat") if codes is not None else None
+    return None
+
+
+def pack_list(values: Any) -> Optional[PackedSeries]:
+    """List số của payload (hourly/daily) → PackedSeries; giữ nguyên kiểu Python khi bung
+    (float vẫn là float, int vẫn là int). Chuỗi, giá trị lẫn kiểu hoặc mất mát → None."""
+    if not isinstance(values, list) or not values:
+        return None
+    kinds = {type(v) for v in values}
+    if kinds == {int}:
+        arr = np.asarray(values, dtype=np.int64)
+        if arr.min() < np.iinfo(np.int32).min or arr.max() > np.iinfo(np.int32).max:
+            return None
+        return PackedSeries(arr.astype(np.int32), "int")
+    if not kinds <= {float, type(None)} or float not in kinds:
+        return None
+    vals = np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+    if np.isnan(vals).sum() != values.count(None):
+        return None   # payload có NaN thật (không phải None): giữ nguyên
+    return pack_array(vals)
+
+
+class SharedTimes(list):
+    """List "time" dùng chung giữa các payload trong cache. axes giữ trục đã parse
+    (timeaxis.hourly_axis, theo utc_offset_s) nên trục sống và bị bỏ cùng list này."""
+    __slots__ = ("axes", "__weakref__")
+
+    def __init__(self, values=()):
+        super().__init__(values)
+        self.axes: Dict[int, Any] = {}
+
+
+# Các ô lưới cùng lượt dự báo có trục "time" giống hệt nhau: giữ một list dùng chung
+# (tiết kiệm bộ nhớ và trục đã parse trong timeaxis cũng được dùng lại giữa các ô).
+# Chỉ giữ tham chiếu yếu: list biến mất khi không còn payload nào trong cache dùng nó.
+_shared_axes: "weakref.WeakValueDictionary[tuple, SharedTimes]" = weakref.WeakValueDictionary()
+_shared_lock = threading.Lock()
+
+
+def shared_axis(times: Any) -> Any:
+    """Trả về SharedTimes dùng chung bằng giá trị với times (dựng mới nếu chưa có)."""
+    if isinstance(times, SharedTimes) or not isinstance(times, list) or not times:
+        return times
+    key = tuple(times)
+    with _shared_lock:
+        shared = _shared_axes.get(key)
+        if shared is None:
+            shared = _shared_axes[key] = SharedTimes(times)
+    return shared
+
+
+class Payload(dict):
+    """Payload đã bung từ CompactPayload (dict thường, thêm weakref để cache dùng lại khi còn được giữ)."""
+    __slots__ = ("__weakref__",)
+
+
+class CompactPayload:
+    """
+    Payload forecast lưu trong cache: các list số trong hourly/daily nén thành PackedSeries,
+    list chuỗi (time, sunrise...) và các trường khác giữ nguyên tham chiếu.
+    expand() dựng lại dict cùng giá trị với payload gốc; bản đã bung được dùng lại
+    chừng nào còn request giữ nó (cùng đối tượng → memo/trục thời gian vẫn khớp).
+    """
+
+    __slots__ = ("_fields", "_ref", "nbytes")
+
+    def __init__(self, payload: Dict[str, Any]):
+        fields: Dict[str, Any] = {}
+        nbytes = sys.getsizeof(payload)
+        for key, value in payload.items():
+            if key in ("hourly", "daily") and isinstance(value, dict):
+                block = {}
+                for name, vals in value.items():
+                    if name == "time":
+                        # Giữ list (định danh ổn định cho trục đã parse), dùng chung giữa các ô
+                        block[name] = shared_axis(vals)
+                        nbytes += sys.getsizeof(vals)
+                        continue
+                    packed = pack_list(vals)
+                    block[name] = packed if packed is not None else vals
+                    nbytes += packed.nbytes if packed is not None else _list_bytes(vals)
+                fields[key] = block
+            else:
+                fields[key] = value
+                nbytes += sys.getsizeof(value)
+        self._fields = fields
+        self._ref = None
+        self.nbytes = nbytes
+
+    def expand(self) -> Payload:
+        live = self._ref() if self._ref is not None else None
+        if live is not None:
+            return live
+        out = Payload()
+        for key, value in self._fields.items():
+            if key in ("hourly", "daily") and isinstance(value, dict):
+                value = {name: v.tolist() if isinstance(v, PackedSeries) else v for name, v in value.items()}
+            out[key] = value
+        self._ref = weakref.ref(out)
+        return out
+
+    def owns(self, data: Any) -> bool:
+        """data là bản đã bung đang còn sống của payload này."""
+        return self._ref is not None and self._ref() is data
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Trường đã lưu (khối hourly/daily chứa PackedSeries), không bung."""
+        return self._fields.get(key, default)
+
+    def items(self):
+        return self._fields.items()
+
+
+def _list_bytes(values: Any) -> int:
+    if isinstance(values, list) and values:
+        return sys.getsizeof(values) + len(values) * sys.getsizeof(values[0])
+    return sys.getsizeof(values)
+
+
+def block_array(payload: Any, block: str, name: str) -> Optional[np.ndarray]:
+    """Một biến số của khối hourly/daily (payload dict hoặc CompactPayload) → float64, None → NaN.
+    Đọc thẳng PackedSeries, không bung cả payload; None nếu không có biến hoặc không phải số."""
+    values = ((payload.get(block) if payload is not None else None) or {}).get(name)
+    if values is None:
+        return None
+    if isinstance(values, PackedSeries):
+        return values.to_numpy().astype(np.float64, copy=False) if values.kind != "cat" else None
+    try:
+        return np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        return None
+
+
+def as_list(values: Any) -> Any:
+    """Một biến của khối hourly/daily dạng list như payload JSON (chỉ bung đúng biến đó)."""
+    return values.tolist() if isinstance(values, PackedSeries) else values
+
+
+def expand_payload(data: Any) -> Any:
+    """Payload đọc từ cache → dict JSON gốc; chỉ dùng ở chỗ trả payload thô cho client.
+    Nhận cả dict đã cắt theo projection mà các khối còn chứa PackedSeries."""
+    if isinstance(data, CompactPayload):
+        return data.expand()
+    if isinstance(data, dict) and any(
+        isinstance(v, PackedSeries)
+        for name in ("hourly", "daily") if isinstance(data.get(name), dict)
+        for v in data[name].values()
+    ):
+        out = dict(data)
+        for name in ("hourly", "daily"):
+            if isinstance(out.get(name), dict):
+                out[name] = {k: as_list(v) for k, v in out[name].items()}
+        return out
+    return data
+
+
+def compact_payload(data: Any) -> Any:
+    """Payload forecast (dict có hourly/daily) → CompactPayload; dữ liệu khác giữ nguyên."""
+    if isinstance(data, dict) and ("hourly" in data or "daily" in data):
+        return CompactPayload(data)
+    return data
+
+
+__all__ = [
+    "CATEGORIES", "CompactPayload", "PackedSeries", "SharedTimes", "as_list", "block_array", "compact_payload", "expand_payload",
+    "pack_array", "pack_list",
+]
@@ -17,21 +17,24 @@ from .utils import (
     _nearest_hour_index,
     kmh_to_ms,
 )
+from .table import ForecastTable
+from .timeaxis import LOCAL_UTC_OFFSET_S
 
-def parse_current(data: dict) -> pd.DataFrame:
+def parse_current_table(data: dict) -> ForecastTable:
     """
-    Parse dữ liệu current_weather kết hợp với hourly để bổ sung trường thiếu.
+    Parse dữ liệu current_weather kết hợp với hourly để bổ sung trường thiếu (bảng 1 dòng).
     Luôn dùng safe_float/safe_round để tránh lỗi khi dữ liệu không hợp lệ.
     """
+    utc_offset_s = data.get("utc_offset_seconds", LOCAL_UTC_OFFSET_S)
     try:
         cw = data.get("current_weather", {}) or {}
         h = data.get("hourly", {}) or {}
         times = h.get("time", []) or []
-        idx = _nearest_hour_index(times, cw.get("time"))
+        idx = _nearest_hour_index(times, cw.get("time"), data.get("utc_offset_seconds") or 0)
 
         if not cw or not cw.get("time"):
-            # Trả về DataFrame rỗng nếu thiếu dữ liệu cơ bản
-            return pd.DataFrame()
+            # Trả về bảng rỗng nếu thiếu dữ liệu cơ bản
+            return ForecastTable(utc_offset_s=utc_offset_s)
 
         # Lấy giá trị mưa và mây từ hourly nếu có index hợp lệ
         rain_val_raw = _get(h, "precipitation", idx, 2) if idx >= 0 else None
@@ -59,9 +62,13 @@ def parse_current(data: dict) -> pd.DataFrame:
             "source": "open_meteo",
         }
 
-        return pd.DataFrame([record])
+        return ForecastTable.from_records([record], utc_offset_s)
 
     except Exception as e:
         # Nếu có lỗi parse, gọi handle_service_error để log cảnh báo
         handle_service_error("parse_current", "current", e, alert_type="data")
-        return pd.DataFrame()
\ No newline at end of file
+        return ForecastTable(utc_offset_s=utc_offset_s)
+
+def parse_current(data: dict) -> pd.DataFrame:
+    """Bản DataFrame của parse_current_table."""
+    return parse_current_table(data).to_pandas()
\ No newline at end of file
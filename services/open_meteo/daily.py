@@ -1,23 +1,62 @@
 # services/open_meteo/daily.py
 import pandas as pd
 import numpy as np
-from .utils import describe_weather, extract_hourly_for_day, aggregate_daily_from_hourly, kmh_to_ms
 from services.error_handler import handle_service_error
+from .compact import PackedSeries
+from .table import ForecastTable
+from .timeaxis import LOCAL_UTC_OFFSET_S, is_epoch
 from .utils import (
-    _get,
-    safe_round,
-    safe_float,
-    describe_weather,
-    _nearest_hour_index,
-    kmh_to_ms,
+    _get_array,
+    as_column,
+    describe_weather_array,
+    round_array,
 )
 
+# Biến hourly dùng để tổng hợp ngày: (cột, biến Open-Meteo, số chữ số, đổi km/h→m/s)
+_AGG_SOURCES = [
+    ("temp_c", "temperature_2m", 2, False),
+    ("apparent_temp_c", "apparent_temperature", 2, False),
+    ("dewpoint_c", "dewpoint_2m", 2, False),
+    ("rain_mm", "precipitation", 2, False),
+    ("precip_prob_pct", "precipitation_probability", 0, False),
+    ("humidity_pct", "relative_humidity_2m", 0, False),
+    ("wind_speed_ms", "windspeed_10m", 2, True),
+    ("wind_gust_ms", "windgusts_10m", 2, True),
+    ("wind_direction", "winddirection_10m", 0, False),
+    ("cloud_cover_pct", "cloudcover", 0, False),
+    ("mslp_hpa", "pressure_msl", 1, False),
+    ("solar_radiation_wm2", "shortwave_radiation", 1, False),
+    ("uv_index", "uv_index", 1, False),
+]
+
+# Trường tổng hợp (theo thứ tự của aggregate_daily_from_hourly): (tên, cột nguồn, phép gộp)
+_AGG_FIELDS = [
+    ("temp_c", "temp_c", "mean"),
+    ("temp_min", "temp_c", "min"),
+    ("temp_max", "temp_c", "max"),
+    ("apparent_temp_c", "apparent_temp_c", "mean"),
+    ("dewpoint_c", "dewpoint_c", "mean"),
+    ("rain_mm", "rain_mm", "sum"),
+    ("rain_hourly_mm", "rain_mm", "max"),
+    ("precip_prob_pct", "precip_prob_pct", "mean"),
+    ("humidity_pct", "humidity_pct", "mean"),
+    ("wind_speed_ms", "wind_speed_ms", "mean"),
+    ("wind_gust_ms", "wind_gust_ms", "max"),
+    ("wind_direction", "wind_direction", "mean"),
+    ("cloud_cover_pct", "cloud_cover_pct", "mean"),
+    ("mslp_hpa", "mslp_hpa", "mean"),
+    ("solar_radiation_wm2", "solar_radiation_wm2", "mean"),
+    ("uv_index", "uv_index", "max"),
+]
+
 def _get_daily_value(d: dict, key: str, i: int):
     """Helper: lấy giá trị daily JSON theo index, trả về None nếu không hợp lệ.
-       Hỗ trợ list, tuple, numpy.ndarray, pandas.Series, pd.Index."""
+       Hỗ trợ list, tuple, numpy.ndarray, pandas.Series, pd.Index, PackedSeries."""
     arr = d.get(key)
     if arr is None:
         return None
+    if isinstance(arr, PackedSeries):
+        return arr.item(i) if i < len(arr) else None
     # Ép kiểu về list nếu là numpy/pandas
     if isinstance(arr, (np.ndarray, pd.Series, pd.Index)):
         arr = arr.tolist()
@@ -25,60 +64,126 @@ def _get_daily_value(d: dict, key: str, i: int):
         return arr[i]
     return None
 
-def parse_daily(data: dict, forecast_days: int = 10) -> pd.DataFrame:
-    """Parse dữ liệu daily, ưu tiên lấy trực tiếp từ daily JSON, fallback sang aggregate từ hourly nếu thiếu."""
+def _day_key(ts, utc_offset_s: int = 0):
+    """Khóa ngày địa phương: 'YYYY-MM-DD' với chuỗi ISO, số ngày kể từ epoch với thời gian epoch."""
+    if is_epoch(ts):
+        return (int(ts) + utc_offset_s) // 86400
+    if isinstance(ts, str) and len(ts) >= 10:
+        return ts[:10]
+    return None
+
+def _daily_aggregates(h: dict, days: list, utc_offset_s: int = 0) -> tuple:
+    """
+    Tổng hợp hourly → ngày cho mọi ngày trong một lượt: gán mã ngày cho từng giờ rồi
+    gộp bằng bincount (tổng/đếm, cộng tuần tự như sum()) và minimum/maximum.at.
+    Trả về (dict tên → mảng theo ngày, mảng bool ngày có dữ liệu hourly).
+    """
+    times = h.get("time") or []
+    if not isinstance(times, list):
+        times = []
+    n_days = len(days)
+
+    # Ngày trùng nhau dùng chung một nhóm
+    groups = {}
+    day_group = np.array([groups.setdefault(_day_key(day, utc_offset_s), len(groups)) for day in days],
+                         dtype=np.int64)
+    codes = np.fromiter(
+        (groups.get(k, -1) if k is not None else -1 for k in (_day_key(ts, utc_offset_s) for ts in times)),
+        dtype=np.int64, count=len(times),
+    )
+    n_groups = len(groups)
+    in_day = codes >= 0
+    has_hourly = np.bincount(codes[in_day], minlength=n_groups)[day_group] > 0 if n_days else np.zeros(0, bool)
+
+    source = {}
+    for name, key, nd, to_ms in _AGG_SOURCES:
+        vals = _get_array(h, key, len(times), nd)
+        source[name] = round_array(vals / 3.6, 2) if to_ms else vals
+
+    def reduce(vals: np.ndarray, how: str) -> np.ndarray:
+        valid = in_day & ~np.isnan(vals)
+        idx, v = codes[valid], vals[valid]
+        count = np.bincount(idx, minlength=n_groups)
+        if how in ("mean", "sum"):
+            total = np.bincount(idx, weights=v, minlength=n_groups)
+            out = total / np.where(count > 0, count, 1) if how == "mean" else total
+        else:
+            out = np.full(n_groups, np.inf if how == "min" else -np.inf)
+            (np.minimum if how == "min" else np.maximum).at(out, idx, v)
+        out = np.where(count > 0, out, np.nan)
+        return round_array(out, 2)[day_group]
+
+    agg = {name: reduce(source[col], how) for name, col, how in _AGG_FIELDS}
+
+    # Số giờ mưa: đếm rain_mm > 0, None nếu ngày không có giá trị mưa nào
+    rain = source["rain_mm"]
+    valid = in_day & ~np.isnan(rain)
+    rain_count = np.bincount(codes[valid], minlength=n_groups)
+    wet = np.bincount(codes[valid & (rain > 0)], minlength=n_groups)
+    agg["precip_hours"] = np.where(rain_count > 0, wet, np.nan).astype(float)[day_group]
+    return agg, has_hourly
+
+def _prefer_daily(daily_vals: np.ndarray, fallback: np.ndarray) -> np.ndarray:
+    """Ưu tiên giá trị daily JSON, thiếu thì lấy giá trị tổng hợp từ hourly."""
+    return np.where(np.isnan(daily_vals), fallback, daily_vals)
+
+def parse_daily_table(data: dict, forecast_days: int = 10) -> ForecastTable:
+    """Parse dữ liệu daily thành ForecastTable, ưu tiên lấy trực tiếp từ daily JSON,
+    fallback sang aggregate từ hourly nếu thiếu."""
+    utc_offset_s = data.get("utc_offset_seconds", LOCAL_UTC_OFFSET_S)
     try:
         d = data.get("daily", {}) or {}
         times = d.get("time", []) or []
         h = data.get("hourly", {}) or {}
         if not times:
-            return pd.DataFrame()
-
-        records = []
-        for i, ts in enumerate(times[:forecast_days]):
-            # Lấy dữ liệu hourly trong ngày đó
-            day_hourly = extract_hourly_for_day(h, ts)
-            agg = aggregate_daily_from_hourly(day_hourly)
-
-            # Lấy trực tiếp từ daily JSON (ưu tiên tuyệt đối)
-            temp_min = _get_daily_value(d, "temperature_2m_min", i)
-            temp_max = _get_daily_value(d, "temperature_2m_max", i)
-            rain_mm = _get_daily_value(d, "precipitation_sum", i)
-            precip_hours = _get_daily_value(d, "precipitation_hours", i)
-            uv_index = _get_daily_value(d, "uv_index_max", i)
-            wind_speed_max = _get_daily_value(d, "windspeed_10m_max", i)
-            wind_gust_max = _get_daily_value(d, "windgusts_10m_max", i)
-            sunrise = _get_daily_value(d, "sunrise", i)
-            sunset = _get_daily_value(d, "sunset", i)
-
-            rec = {
-                "ts": f"{ts}T00:00",
-                "temp_min": temp_min if temp_min is not None else agg.get("temp_min"),
-                "temp_max": temp_max if temp_max is not None else agg.get("temp_max"),
-                "rain_mm": rain_mm if rain_mm is not None else agg.get("rain_mm"),
-                "rain_hourly_mm": agg.get("rain_hourly_mm"),
-                "wind_speed_max_ms": kmh_to_ms(wind_speed_max) if wind_speed_max is not None else agg.get("wind_speed_ms"),
-                "wind_gust_max_ms": kmh_to_ms(wind_gust_max) if wind_gust_max is not None else agg.get("wind_gust_ms"),
-                "precip_hours": precip_hours if precip_hours is not None else agg.get("precip_hours"),
-                "sunrise": sunrise,
-                "sunset": sunset,
-                "uv_index": uv_index if uv_index is not None else agg.get("uv_index"),
-                "weather_desc": describe_weather(
-                    rain_mm if rain_mm is not None else agg.get("rain_mm"),
-                    agg.get("cloud_cover_pct")
-                ),
-                "source": "open_meteo"
-            }
-
-            # Chỉ merge các field bổ sung từ agg nếu chưa có trong rec
-            for k, v in agg.items():
-                if k not in rec or rec[k] is None:
-                    rec[k] = v
-
-            records.append(rec)
-
-        return pd.DataFrame(records)
+            return ForecastTable(utc_offset_s=utc_offset_s)
+
+        days = list(times[:forecast_days])
+        n = len(days)
+        agg, has_hourly = _daily_aggregates(h, days, data.get("utc_offset_seconds") or 0)
+
+        # Lấy trực tiếp từ daily JSON (ưu tiên tuyệt đối)
+        rain_mm = _prefer_daily(_get_array(d, "precipitation_sum", n), agg["rain_mm"])
+        wind_speed_max = _get_array(d, "windspeed_10m_max", n)
+        wind_gust_max = _get_array(d, "windgusts_10m_max", n)
+
+        precip_daily = _get_array(d, "precipitation_hours", n)
+        precip_hours = _prefer_daily(precip_daily, agg["precip_hours"])
+        if np.isnan(precip_daily).all() and not np.isnan(precip_hours).any():
+            # Toàn bộ lấy từ số giờ mưa đếm được → cột số nguyên
+            precip_hours = precip_hours.astype(np.int64)
+
+        cols = {
+            # timeformat=unixtime: ts là epoch của 00:00 giờ địa phương (int64)
+            "ts": np.asarray(days, dtype=np.int64) if is_epoch(days[0]) else [f"{ts}T00:00" for ts in days],
+            "temp_min": _prefer_daily(_get_array(d, "temperature_2m_min", n), agg["temp_min"]),
+            "temp_max": _prefer_daily(_get_array(d, "temperature_2m_max", n), agg["temp_max"]),
+            "rain_mm": rain_mm,
+            "rain_hourly_mm": agg["rain_hourly_mm"],
+            "wind_speed_max_ms": _prefer_daily(round_array(wind_speed_max / 3.6, 2), agg["wind_speed_ms"]),
+            "wind_gust_max_ms": _prefer_daily(round_array(wind_gust_max / 3.6, 2), agg["wind_gust_ms"]),
+            "precip_hours": precip_hours,
+            "sunrise": [_get_daily_value(d, "sunrise", i) for i in range(n)],
+            "sunset": [_get_daily_value(d, "sunset", i) for i in range(n)],
+            "uv_index": _prefer_daily(_get_array(d, "uv_index_max", n), agg["uv_index"]),
+            "weather_desc": describe_weather_array(rain_mm, agg["cloud_cover_pct"]),
+            "source": ["open_meteo"] * n,
+        }
+
+        # Các field bổ sung từ aggregate (chỉ có khi ít nhất một ngày có dữ liệu hourly)
+        if has_hourly.any():
+            for name, _, _ in _AGG_FIELDS:
+                if name not in cols:
+                    cols[name] = agg[name]
+
+        return ForecastTable(
+            {k: as_column(v) if isinstance(v, np.ndarray) else v for k, v in cols.items()}, utc_offset_s
+        )
 
     except Exception as e:
         handle_service_error("parse_daily", "daily", e, alert_type="data")
-        return pd.DataFrame()
\ No newline at end of file
+        return ForecastTable(utc_offset_s=utc_offset_s)
+
+def parse_daily(data: dict, forecast_days: int = 10) -> pd.DataFrame:
+    """Bản DataFrame của parse_daily_table (cho các caller cần pandas)."""
+    return parse_daily_table(data, forecast_days).to_pandas()
@@ -0,0 +1,194 @@
+# services/open_meteo/decode.py
+import json
+import logging
+import time
+from typing import Any, Dict, List, Optional, TypedDict, Union
+
+logger = logging.getLogger("WeatherService")
+
+# Bộ giải mã JSON nhanh (tùy chọn): orjson nếu đã cài, không thì json chuẩn
+try:
+    import orjson
+
+    def loads(body: Union[bytes, str]) -> Any:
+        return orjson.loads(body)
+
+    JSON_DECODER = "orjson"
+except ImportError:  # pragma: no cover - phụ thuộc môi trường
+    def loads(body: Union[bytes, str]) -> Any:
+        return json.loads(body)
+
+    JSON_DECODER = "json"
+
+
+# ===== Schema payload forecast của Open-Meteo =====
+class CurrentWeather(TypedDict, total=False):
+    time: Union[str, int]
+    temperature: float
+    windspeed: float
+    winddirection: float
+    weathercode: int
+
+
+class ForecastPayload(TypedDict, total=False):
+    latitude: float
+    longitude: float
+    utc_offset_seconds: int
+    timezone: str
+    current_weather: CurrentWeather
+    hourly: Dict[str, List[Any]]     # "time" + mỗi biến một list cùng độ dài
+    daily: Dict[str, List[Any]]
+
+
+class PayloadError(ValueError):
+    """Payload Open-Meteo sai cấu trúc (bị loại trước khi vào cache)."""
+
+
+_NUMBER = (int, float)
+_TIME = (str, int)
+
+
+def _check_block(payload: dict, name: str) -> None:
+    """Khối hourly/daily: dict có "time" là list, mọi biến là list cùng độ dài.
+    Chỉ kiểm tra độ dài và phần tử đầu của mỗi list (O(số biến), không duyệt từng giờ)."""
+    block = payload.get(name)
+    if block is None:
+        return
+    if not isinstance(block, dict):
+        raise PayloadError(f"{name}: phải là object")
+    times = block.get("time")
+    if not isinstance(times, list):
+        raise PayloadError(f"{name}.time: thiếu hoặc không phải list")
+    n = len(times)
+    if n and not isinstance(times[0], _TIME):
+        raise PayloadError(f"{name}.time: phần tử không phải chuỗi ISO/epoch")
+    for key, vals in block.items():
+        if key == "time":
+            continue
+        if not isinstance(vals, list):
+            raise PayloadError(f"{name}.{key}: không phải list")
+        if len(vals) != n:
+            raise PayloadError(f"{name}.{key}: dài {len(vals)}, time dài {n}")
+        first = vals[0] if vals else None
+        # sunrise/sunset là thời gian, còn lại là số (None = thiếu dữ liệu)
+        if first is not None and not isinstance(first, _TIME if key in ("sunrise", "sunset") else _NUMBER):
+            raise PayloadError(f"{name}.{key}: phần tử không hợp lệ ({type(first).__name__})")
+
+
+def validate_forecast(payload: Any) -> ForecastPayload:
+    """Kiểm tra nhanh cấu trúc một payload forecast; PayloadError nếu sai."""
+    if not isinstance(payload, dict):
+        raise PayloadError(f"payload phải là object, nhận {type(payload).__name__}")
+    if payload.get("error"):
+        raise PayloadError(f"Open-Meteo báo lỗi: {payload.get('reason')}")
+    if not any(k in payload for k in ("hourly", "daily", "current_weather")):
+        raise PayloadError("payload thiếu hourly/daily/current_weather")
+    offset = payload.get("utc_offset_seconds")
+    if offset is not None and not isinstance(offset, int):
+        raise PayloadError("utc_offset_seconds không phải số nguyên")
+    cw = payload.get("current_weather")
+    if cw is not None and not isinstance(cw, dict):
+        raise PayloadError("current_weather phải là object")
+    _check_block(payload, "hourly")
+    _check_block(payload, "daily")
+    return payload
+
+
+def decode_forecast(body: Union[bytes, str], expect=dict) -> Union[ForecastPayload, List[ForecastPayload]]:
+    """
+    Giải mã body JSON của Open-Meteo (orjson nếu có) và kiểm tra cấu trúc.
+    Request nhiều tọa độ trả về list payload, mỗi phần tử được kiểm tra riêng.
+    Các biến giữ dạng list (payload trong cache dùng chung cho trục thời gian,
+    tổng hợp mưa và các endpoint trả raw JSON); parser đổi sang NumPy một bước.
+    """
+    data = loads(body)
+    if not isinstance(data, expect):
+        raise PayloadError("Invalid JSON response")
+    if isinstance(data, list):
+        for item in data:
+            validate_forecast(item)
+    else:
+        validate_forecast(data)
+    return data
+
+
+# ===== Benchmark trên payload 10 ngày đã ghi lại =====
+def _timeit(fn, body: bytes, repeat: int) -> float:
+    fn(body)
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn(body)
+    return (time.perf_counter() - t0) / repeat * 1e6
+
+
+def benchmark(paths: List[str], repeat: int = 200) -> List[Dict[str, Any]]:
+    """So sánh đường cũ (json.loads như resp.json()) với decode_forecast,
+    riêng bước giải mã và cả giải mã + parse hourly/daily (µs mỗi payload)."""
+    from services.open_meteo.daily import parse_daily_table
+    from services.open_meteo.hourly import parse_hourly_table
+
+    def parse(data: dict) -> None:
+        parse_hourly_table(data)
+        parse_daily_table(data)
+
+    rows = []
+    for path in paths:
+        with open(path, "rb") as f:
+            body = f.read()
+        rows.append({
+            "file": path,
+            "bytes": len(body),
+            "json_us": _timeit(json.loads, body, repeat),
+            "decode_us": _timeit(decode_forecast, body, repeat),
+            "json_parse_us": _timeit(lambda b: parse(json.loads(b)), body, max(1, repeat // 10)),
+            "decode_parse_us": _timeit(lambda b: parse(decode_forecast(b)), body, max(1, repeat // 10)),
+        })
+    return rows
+
+
+def record_payload(lat: float, lon: float, path: str) -> int:
+    """Ghi nguyên body JSON của một lần gọi forecast (10 ngày) ra file để benchmark."""
+    from services import config
+    from services.http_client import get_session
+    from services.open_meteo.utils import build_api_url
+
+    resp = get_session().get(build_api_url(lat, lon, config.FORECAST_DAYS), timeout=config.API_TIMEOUT)
+    resp.raise_for_status()
+    decode_forecast(resp.content)
+    with open(path, "wb") as f:
+        f.write(resp.content)
+    return len(resp.content)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="python -m services.open_meteo.decode",
+        description="Benchmark giải mã payload Open-Meteo (json chuẩn vs decode_forecast)",
+    )
+    parser.add_argument("payloads", nargs="*", help="File body JSON forecast đã ghi lại")
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--record", metavar="PATH", help="Gọi API một lần và ghi body ra PATH")
+    parser.add_argument("--lat", type=float, default=21.0285)
+    parser.add_argument("--lon", type=float, default=105.8542)
+    args = parser.parse_args(argv)
+
+    if args.record:
+        size = record_payload(args.lat, args.lon, args.record)
+        print(f"Đã ghi {size} bytes vào {args.record}")
+    paths = args.payloads + ([args.record] if args.record else [])
+    if not paths:
+        parser.error("cần ít nhất một file payload (hoặc --record PATH)")
+
+    print(f"decoder: {JSON_DECODER}")
+    for r in benchmark(paths, args.repeat):
+        print(
+            f"{r['file']} ({r['bytes']} B): "
+            f"json {r['json_us']:.0f} µs → decode {r['decode_us']:.0f} µs | "
+            f"json+parse {r['json_parse_us']:.0f} µs → decode+parse {r['decode_parse_us']:.0f} µs"
+        )
+
+
+if __name__ == "__main__":
+    main()
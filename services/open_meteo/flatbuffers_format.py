@@ -0,0 +1,162 @@
+# services/open_meteo/flatbuffers_format.py
+import logging
+import urllib.parse
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from services import config
+from services.http_client import get_async_client, get_session
+from .decode import PayloadError, validate_forecast
+from .utils import DAILY_VARS, HOURLY_VARS, _forecast_params, safe_round
+
+logger = logging.getLogger("WeatherService")
+
+# openmeteo_sdk (tùy chọn): đọc trực tiếp bản tin FlatBuffers, không cần parse JSON
+try:
+    from openmeteo_sdk.WeatherApiResponse import WeatherApiResponse
+except ImportError:  # pragma: no cover - phụ thuộc môi trường
+    WeatherApiResponse = None
+
+FORMAT_FLATBUFFERS = "flatbuffers"
+
+# current_weather (JSON cũ) ↔ biến current tương ứng khi dùng FlatBuffers
+CURRENT_VARS = [
+    ("temperature", "temperature_2m"),
+    ("windspeed", "windspeed_10m"),
+    ("winddirection", "winddirection_10m"),
+    ("weathercode", "weathercode"),
+]
+# Biến daily trả về dạng int64 (epoch giây)
+_INT64_VARS = ("sunrise", "sunset")
+
+_warned_missing_sdk = False
+
+
+def flatbuffers_enabled() -> bool:
+    """OPEN_METEO_FORMAT=flatbuffers và đã cài openmeteo_sdk; thiếu SDK thì cảnh báo một lần, dùng JSON."""
+    global _warned_missing_sdk
+    if config.OPEN_METEO_FORMAT != FORMAT_FLATBUFFERS:
+        return False
+    if WeatherApiResponse is None:
+        if not _warned_missing_sdk:
+            logger.warning("[open_meteo] OPEN_METEO_FORMAT=flatbuffers nhưng chưa cài 'openmeteo_sdk', dùng JSON")
+            _warned_missing_sdk = True
+        return False
+    return True
+
+
+def build_flatbuffers_url(points: List[Tuple[float, float]], forecast_days: int = 10) -> str:
+    """URL forecast dạng FlatBuffers cho một hoặc nhiều điểm (cùng biến hourly/daily với JSON)."""
+    params = _forecast_params(forecast_days)
+    params.pop("current_weather", None)
+    params.pop("timeformat", None)   # FlatBuffers luôn trả thời gian epoch
+    params["current"] = ",".join(name for _, name in CURRENT_VARS)
+    params["format"] = FORMAT_FLATBUFFERS
+    base = "https://api.open-meteo.com/v1/forecast"
+    query = {
+        "latitude": ",".join(str(safe_round(lat, 6)) for lat, _ in points),
+        "longitude": ",".join(str(safe_round(lon, 6)) for _, lon in points),
+        **params,
+    }
+    return f"{base}?{urllib.parse.urlencode(query)}"
+
+
+def _values(var, name: str, n: int) -> list:
+    """Giá trị một biến → list Python như JSON: float32 làm tròn 3 chữ số, NaN → None."""
+    raw = var.ValuesInt64AsNumpy() if name in _INT64_VARS else var.ValuesAsNumpy()
+    if not isinstance(raw, np.ndarray):
+        # Biến không có mảng giá trị (SDK trả 0)
+        return [None] * n
+    if name in _INT64_VARS:
+        return raw.tolist()
+    vals = np.round(raw.astype(np.float64), 3)
+    out = vals.tolist()
+    if np.isnan(vals).any():
+        out = [None if v != v else v for v in out]
+    return out
+
+
+def _block(section, names: List[str]) -> Dict[str, list]:
+    """VariablesWithTime → {"time": [...], biến: [...]}; biến trả về đúng thứ tự đã yêu cầu."""
+    if section.VariablesLength() != len(names):
+        raise PayloadError(f"FlatBuffers trả {section.VariablesLength()} biến, yêu cầu {len(names)}")
+    times = list(range(section.Time(), section.TimeEnd(), section.Interval()))
+    block = {"time": times}
+    for i, name in enumerate(names):
+        block[name] = _values(section.Variables(i), name, len(times))
+    return block
+
+
+def _to_payload(resp) -> Dict[str, Any]:
+    """Một WeatherApiResponse → payload cùng cấu trúc JSON timeformat=unixtime."""
+    tz = resp.Timezone()
+    payload: Dict[str, Any] = {
+        "latitude": round(resp.Latitude(), 4),
+        "longitude": round(resp.Longitude(), 4),
+        "elevation": round(resp.Elevation(), 1),
+        "utc_offset_seconds": resp.UtcOffsetSeconds(),
+        "timezone": tz.decode() if isinstance(tz, bytes) else tz,
+    }
+    current = resp.Current()
+    if current is not None:
+        if current.VariablesLength() != len(CURRENT_VARS):
+            raise PayloadError("FlatBuffers: số biến current không khớp")
+        cw = {"time": current.Time(), "interval": current.Interval()}
+        for i, (key, _) in enumerate(CURRENT_VARS):
+            val = float(current.Variables(i).Value())
+            cw[key] = None if val != val else round(val, 3)
+        payload["current_weather"] = cw
+    hourly = resp.Hourly()
+    if hourly is not None:
+        payload["hourly"] = _block(hourly, HOURLY_VARS)
+    daily = resp.Daily()
+    if daily is not None:
+        payload["daily"] = _block(daily, DAILY_VARS)
+    return validate_forecast(payload)
+
+
+def decode_flatbuffers(body: bytes) -> List[Dict[str, Any]]:
+    """Body FlatBuffers (chuỗi message có tiền tố độ dài 4 byte, mỗi điểm một message) → list payload."""
+    payloads, pos, total = [], 0, len(body)
+    while pos < total:
+        if pos + 4 > total:
+            raise PayloadError("FlatBuffers: body bị cắt cụt")
+        length = int.from_bytes(body[pos:pos + 4], "little")
+        if length <= 0 or pos + 4 + length > total:
+            raise PayloadError("FlatBuffers: độ dài message không hợp lệ")
+        payloads.append(_to_payload(WeatherApiResponse.GetRootAs(body, pos + 4)))
+        pos += 4 + length
+    return payloads
+
+
+def _checked(payloads: List[dict], points: List[Tuple[float, float]]) -> List[dict]:
+    if len(payloads) != len(points):
+        raise PayloadError(f"FlatBuffers trả {len(payloads)} điểm, yêu cầu {len(points)}")
+    return payloads
+
+
+def fetch_flatbuffers(points: List[Tuple[float, float]], forecast_days: int = None) -> Optional[List[dict]]:
+    """Gọi forecast dạng FlatBuffers (sync); None nếu lỗi để caller quay về JSON."""
+    url = build_flatbuffers_url(points, forecast_days or config.FORECAST_DAYS)
+    try:
+        logger.info(f"[fetch_forecast] Call API (flatbuffers): {url}")
+        resp = get_session().get(url, timeout=config.API_TIMEOUT)
+        resp.raise_for_status()
+        return _checked(decode_flatbuffers(resp.content), points)
+    except Exception as e:
+        logger.warning(f"[fetch_forecast] FlatBuffers lỗi, chuyển sang JSON: {e}")
+        return None
+
+
+async def fetch_flatbuffers_async(points: List[Tuple[float, float]], forecast_days: int = None) -> Optional[List[dict]]:
+    """Bản asyncio của fetch_flatbuffers."""
+    url = build_flatbuffers_url(points, forecast_days or config.FORECAST_DAYS)
+    try:
+        logger.info(f"[fetch_forecast] Call API (flatbuffers): {url}")
+        resp = await get_async_client().get(url, timeout=config.API_TIMEOUT)
+        resp.raise_for_status()
+        return _checked(decode_flatbuffers(resp.content), points)
+    except Exception as e:
+        logger.warning(f"[fetch_forecast] FlatBuffers lỗi, chuyển sang JSON: {e}")
+        return None
@@ -0,0 +1,33 @@
+# services/open_meteo/grid.py
+import math
+from typing import Optional, Tuple
+
+from services import config
+
+
+def _grid_step(step: Optional[float]) -> float:
+    return float(config.GRID_SNAP_DEG if step is None else step)
+
+
+def snap_to_grid(lat: float, lon: float, step: Optional[float] = None) -> Tuple[float, float]:
+    """
+    Quy tọa độ về nút lưới mô hình gần nhất (GFS/ICON 0.1°–0.25°).
+    Các phường/xã nằm cùng một ô lưới sẽ dùng chung request và cache.
+    step <= 0 thì giữ nguyên tọa độ.
+    """
+    step = _grid_step(step)
+    lat = float(lat)
+    lon = float(lon)
+    if step <= 0:
+        return lat, lon
+    # round(..., 6) để tránh sai số dấu phẩy động kiểu 21.200000000000003
+    snapped_lat = round(math.floor(lat / step + 0.5) * step, 6)
+    snapped_lon = round(math.floor(lon / step + 0.5) * step, 6)
+    return max(-90.0, min(90.0, snapped_lat)), max(-180.0, min(180.0, snapped_lon))
+
+
+def grid_cell_key(lat: float, lon: float, step: Optional[float] = None) -> str:
+    """Khóa chuẩn của ô lưới, ví dụ '21.0,105.9@0.1'."""
+    step = _grid_step(step)
+    snapped_lat, snapped_lon = snap_to_grid(lat, lon, step)
+    return f"{snapped_lat},{snapped_lon}@{step}"
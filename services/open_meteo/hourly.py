@@ -1,61 +1,75 @@
 # services/open_meteo/hourly.py
+import numpy as np
 import pandas as pd
-from .utils import _get, describe_weather, kmh_to_ms
 from services.error_handler import handle_service_error
+from .table import ForecastTable
+from .timeaxis import LOCAL_UTC_OFFSET_S, is_epoch
 from .utils import (
-    _get,
-    safe_round,
-    safe_float,
-    describe_weather,
-    _nearest_hour_index,
-    kmh_to_ms,
+    _get_array,
+    as_column,
+    describe_weather_array,
+    kmh_to_ms_array,
 )
 
-def parse_hourly(data: dict, forecast_days: int = 10) -> pd.DataFrame:
-    """Parse dữ liệu hourly trong khoảng forecast_days, có fallback cho mưa."""
+# (cột đầu ra, biến hourly Open-Meteo, số chữ số làm tròn)
+HOURLY_COLUMNS = [
+    ("temp_c", "temperature_2m", 2),
+    ("apparent_temp_c", "apparent_temperature", 2),
+    ("dewpoint_c", "dewpoint_2m", 2),
+    ("precip_prob_pct", "precipitation_probability", 0),
+    ("humidity_pct", "relative_humidity_2m", 0),
+    ("wind_direction", "winddirection_10m", 0),
+    ("cloud_low_pct", "cloudcover_low", 0),
+    ("cloud_mid_pct", "cloudcover_mid", 0),
+    ("cloud_high_pct", "cloudcover_high", 0),
+    ("mslp_hpa", "pressure_msl", 1),
+    ("solar_radiation_wm2", "shortwave_radiation", 1),
+    ("uv_index", "uv_index", 1),
+]
+
+# Thứ tự cột giữ nguyên như bản parse theo từng dòng trước đây
+COLUMN_ORDER = [
+    "ts", "temp_c", "apparent_temp_c", "dewpoint_c", "rain_mm", "precip_prob_pct",
+    "humidity_pct", "wind_speed_ms", "wind_direction", "wind_gust_ms", "cloud_cover_pct",
+    "cloud_low_pct", "cloud_mid_pct", "cloud_high_pct", "mslp_hpa", "solar_radiation_wm2",
+    "uv_index", "weather_desc", "source",
+]
+
+def parse_hourly_table(data: dict, forecast_days: int = 10) -> ForecastTable:
+    """Parse dữ liệu hourly trong khoảng forecast_days thành ForecastTable, có fallback cho mưa.
+    Mỗi biến được đổi thành một cột numpy trong một bước (không lặp theo giờ)."""
+    utc_offset_s = data.get("utc_offset_seconds", LOCAL_UTC_OFFSET_S)
     try:
         h = data.get("hourly", {}) or {}
         times = h.get("time", []) or []
         if not times:
-            return pd.DataFrame()
-
-        records = []
-        for i, ts in enumerate(times[:forecast_days * 24]):
-            ws_kmh = _get(h, "windspeed_10m", i, 2)
-            gust_kmh = _get(h, "windgusts_10m", i, 2)
-
-            # Ưu tiên lấy rain, fallback sang precipitation
-            rain_val = _get(h, "rain", i, 2)
-            if rain_val is None:
-                rain_val = _get(h, "precipitation", i, 2)
-
-            cloud_val = _get(h, "cloudcover", i, 0)
-
-            record = {
-                "ts": ts,
-                "temp_c": _get(h, "temperature_2m", i, 2),
-                "apparent_temp_c": _get(h, "apparent_temperature", i, 2),
-                "dewpoint_c": _get(h, "dewpoint_2m", i, 2),
-                "rain_mm": rain_val,
-                "precip_prob_pct": _get(h, "precipitation_probability", i, 0),
-                "humidity_pct": _get(h, "relative_humidity_2m", i, 0),
-                "wind_speed_ms": kmh_to_ms(ws_kmh, 2),
-                "wind_direction": _get(h, "winddirection_10m", i, 0),
-                "wind_gust_ms": kmh_to_ms(gust_kmh, 2),
-                "cloud_cover_pct": cloud_val,
-                "cloud_low_pct": _get(h, "cloudcover_low", i, 0),
-                "cloud_mid_pct": _get(h, "cloudcover_mid", i, 0),
-                "cloud_high_pct": _get(h, "cloudcover_high", i, 0),
-                "mslp_hpa": _get(h, "pressure_msl", i, 1),
-                "solar_radiation_wm2": _get(h, "shortwave_radiation", i, 1),
-                "uv_index": _get(h, "uv_index", i, 1),
-                "weather_desc": describe_weather(rain_val, cloud_val),
-                "source": "open_meteo"
-            }
-            records.append(record)
-
-        return pd.DataFrame(records)
+            return ForecastTable(utc_offset_s=utc_offset_s)
+
+        ts = times[:forecast_days * 24]
+        n = len(ts)
+        cols = {name: _get_array(h, key, n, nd) for name, key, nd in HOURLY_COLUMNS}
+
+        # Ưu tiên lấy rain, fallback sang precipitation (theo từng giờ)
+        rain = _get_array(h, "rain", n, 2)
+        rain = np.where(np.isnan(rain), _get_array(h, "precipitation", n, 2), rain)
+        cloud = _get_array(h, "cloudcover", n, 0)
+
+        cols["rain_mm"] = rain
+        cols["cloud_cover_pct"] = cloud
+        cols["wind_speed_ms"] = kmh_to_ms_array(_get_array(h, "windspeed_10m", n, 2))
+        cols["wind_gust_ms"] = kmh_to_ms_array(_get_array(h, "windgusts_10m", n, 2))
+        cols = {k: as_column(v) for k, v in cols.items()}
+        # timeformat=unixtime: giữ trục thời gian dạng epoch int64, chỉ đổi sang ISO khi xuất
+        cols["ts"] = np.asarray(ts, dtype=np.int64) if is_epoch(ts[0]) else np.array(ts, dtype=object)
+        cols["weather_desc"] = describe_weather_array(rain, cloud)
+        cols["source"] = np.full(n, "open_meteo", dtype=object)
+
+        return ForecastTable({k: cols[k] for k in COLUMN_ORDER}, utc_offset_s)
 
     except Exception as e:
         handle_service_error("parse_hourly", "hourly", e, alert_type="data")
-        return pd.DataFrame()
\ No newline at end of file
+        return ForecastTable(utc_offset_s=utc_offset_s)
+
+def parse_hourly(data: dict, forecast_days: int = 10) -> pd.DataFrame:
+    """Bản DataFrame của parse_hourly_table (cho các caller cần pandas)."""
+    return parse_hourly_table(data, forecast_days).to_pandas()
@@ -2,24 +2,80 @@
 import logging
 import time
 import requests
+import numpy as np
 import pandas as pd
-from datetime import timedelta
+from datetime import datetime, timedelta, timezone
+from typing import List, Tuple
 
 from services import config
 from services.error_handler import handle_service_error
-from services.open_meteo.utils import build_api_url
+from services.http_client import get_session
+from services.open_meteo.utils import build_api_url, build_batch_api_url
+from services.open_meteo.decode import PayloadError, decode_forecast
+from services.open_meteo.flatbuffers_format import fetch_flatbuffers, fetch_flatbuffers_async, flatbuffers_enabled
+from services.open_meteo.cache import forecast_cache, forecast_cache_key
+from services.open_meteo.compact import expand_payload
+from services.open_meteo.grid import snap_to_grid
 from services.open_meteo.report import generate_weather_report
-from services.open_meteo.current import parse_current
-from services.open_meteo.hourly import parse_hourly
-from services.open_meteo.daily import parse_daily
+from services.open_meteo.current import parse_current_table
+from services.open_meteo.hourly import parse_hourly_table
+from services.open_meteo.daily import parse_daily_table
+from services.open_meteo.table import ForecastTable
+from services.open_meteo.timeaxis import LOCAL_UTC_OFFSET_S
+from services.rain_openmeteo import summarize_precipitation
+from services.weather_sources import fetch_json
 
 # Logger chung
 logger = logging.getLogger("WeatherService")
 
-# ===== Hàm gọi API với retry và headers =====
+# ===== Hàm gọi API có cache =====
+def fetch_forecast_with_age(lat: float, lon: float) -> tuple:
+    """Trả về (payload, data_age_s). Bản ghi hết hạn nhưng còn trong cửa sổ
+    stale-while-revalidate được trả ngay và làm mới ở nền.
+    Payload ở dạng lưu trong cache (CompactPayload khi nén) cho parser đọc thẳng."""
+    grid_lat, grid_lon = snap_to_grid(lat, lon)
+    return forecast_cache.get_or_load_with_age(
+        forecast_cache_key(grid_lat, grid_lon),
+        lambda: _fetch_forecast_upstream(grid_lat, grid_lon),
+    )
+
+def prefetch_forecast(lat: float, lon: float) -> bool:
+    """Làm mới payload của ô lưới chứa (lat, lon) vào cache, bất kể TTL còn hay hết."""
+    grid_lat, grid_lon = snap_to_grid(lat, lon)
+    return forecast_cache.refresh(
+        forecast_cache_key(grid_lat, grid_lon),
+        lambda: _fetch_forecast_upstream(grid_lat, grid_lon),
+    )
+
 def fetch_forecast(lat: float, lon: float) -> dict:
-    """Gọi Open-Meteo API, trả về dict JSON hoặc {} nếu lỗi."""
+    """Trả về payload dự báo từ cache in-process; gọi Open-Meteo khi miss/hết hạn.
+    Tọa độ được quy về ô lưới mô hình nên các điểm lân cận dùng chung payload."""
+    return expand_payload(fetch_forecast_with_age(lat, lon)[0])
+
+# ===== Đường asyncio (httpx, không chiếm thread trong lúc chờ upstream) =====
+async def fetch_forecast_with_age_async(lat: float, lon: float) -> tuple:
+    """Bản asyncio của fetch_forecast_with_age: dùng chung cache, single-flight và SWR."""
+    grid_lat, grid_lon = snap_to_grid(lat, lon)
+    return await forecast_cache.get_or_load_with_age_async(
+        forecast_cache_key(grid_lat, grid_lon),
+        lambda: _fetch_forecast_upstream_async(grid_lat, grid_lon),
+    )
+
+async def fetch_forecast_async(lat: float, lon: float) -> dict:
+    """Bản asyncio của fetch_forecast."""
+    return expand_payload((await fetch_forecast_with_age_async(lat, lon))[0])
+
+async def _fetch_forecast_upstream_async(lat: float, lon: float) -> dict:
+    if flatbuffers_enabled():
+        payloads = await fetch_flatbuffers_async([(lat, lon)])
+        if payloads:
+            return payloads[0]
     url = build_api_url(lat, lon, config.FORECAST_DAYS)
+    return await fetch_json(url, context="fetch_forecast", decode=decode_forecast) or {}
+
+# ===== Hàm gọi API với retry và headers =====
+def _request_json(url: str, expect=dict):
+    """Gọi Open-Meteo API với retry/backoff, trả JSON (đúng kiểu expect, đã kiểm tra cấu trúc) hoặc None nếu lỗi."""
     headers = {
         "User-Agent": config.API_USER_AGENT,
         "Accept": "application/json"
@@ -28,7 +84,7 @@ def fetch_forecast(lat: float, lon: float) -> dict:
     for attempt in range(config.MAX_RETRIES):
         try:
             logger.info(f"[fetch_forecast] Call API: {url} (attempt {attempt+1})")
-            resp = requests.get(url, headers=headers, timeout=config.API_TIMEOUT)
+            resp = get_session().get(url, headers=headers, timeout=config.API_TIMEOUT)
 
             # Nếu server lỗi 5xx thì retry
             if resp.status_code >= 500:
@@ -38,10 +94,7 @@ def fetch_forecast(lat: float, lon: float) -> dict:
                     continue
 
             resp.raise_for_status()
-            data = resp.json()
-            if not isinstance(data, dict):
-                raise ValueError("Invalid JSON response")
-            return data
+            return decode_forecast(resp.content, expect=expect)
 
         except (requests.Timeout, requests.ConnectionError) as e:
             logger.error(f"[fetch_forecast] Network error: {e}", exc_info=True)
@@ -49,48 +102,207 @@ def fetch_forecast(lat: float, lon: float) -> dict:
                 time.sleep(1.5 * (2 ** attempt))
                 continue
             handle_service_error("fetch_forecast", "network", e, alert_type="network")
-            return {}
+            return None
 
         except requests.RequestException as e:
             logger.error(f"[fetch_forecast] HTTP error: {e}", exc_info=True)
             handle_service_error("fetch_forecast", "http_error", e, alert_type="network")
-            return {}
+            return None
+
+        except PayloadError as e:
+            # Payload sai cấu trúc: không retry, không đưa vào cache
+            logger.error(f"[fetch_forecast] Invalid payload: {e}")
+            handle_service_error("fetch_forecast", "invalid_payload", e, alert_type="data")
+            return None
 
         except Exception as e:
             logger.exception("[fetch_forecast] Unexpected error", exc_info=True)
             handle_service_error("fetch_forecast", "unexpected", e, alert_type="data")
-            return {}
+            return None
+
+    return None
+
+def _fetch_forecast_upstream(lat: float, lon: float) -> dict:
+    """Gọi Open-Meteo API, trả về dict JSON hoặc {} nếu lỗi.
+    OPEN_METEO_FORMAT=flatbuffers: thử FlatBuffers trước, lỗi thì gọi lại dạng JSON."""
+    if flatbuffers_enabled():
+        payloads = fetch_flatbuffers([(lat, lon)])
+        if payloads:
+            return payloads[0]
+    return _request_json(build_api_url(lat, lon, config.FORECAST_DAYS)) or {}
+
+def _fetch_forecast_batch_upstream(points: List[Tuple[float, float]]) -> List[dict]:
+    """Một request cho nhiều điểm; trả danh sách payload cùng thứ tự ({} nếu lỗi)."""
+    if flatbuffers_enabled():
+        payloads = fetch_flatbuffers(points)
+        if payloads:
+            return payloads
+    data = _request_json(build_batch_api_url(points, config.FORECAST_DAYS), expect=(list, dict))
+    if isinstance(data, dict):
+        data = [data]
+    if not data or len(data) != len(points):
+        logger.warning(f"[fetch_forecast_batch] Phản hồi không khớp số điểm: {len(data or [])}/{len(points)}")
+        return [{} for _ in points]
+    return [d if isinstance(d, dict) else {} for d in data]
+
+# ===== Gọi API theo lô nhiều điểm =====
+def fetch_forecast_batch(points: List[Tuple[float, float]], chunk_size: int = None, force: bool = False) -> List[dict]:
+    """
+    Lấy forecast cho N điểm bằng request nhiều tọa độ của Open-Meteo.
+    - Quy về ô lưới và bỏ trùng; ô còn hạn trong cache được dùng lại (trừ khi force=True)
+    - Chia thành các lô chunk_size (mặc định FORECAST_BATCH_SIZE), mỗi lô một request
+    - Ghi từng payload vào cache theo ô lưới
+    Trả về danh sách payload (dạng lưu trong cache) theo đúng thứ tự points ({} nếu điểm đó lỗi).
+    """
+    cells = {}
+    for lat, lon in points:
+        cells.setdefault(snap_to_grid(lat, lon), None)
+
+    pending = []
+    for cell in cells:
+        cached = None if force else forecast_cache.get(forecast_cache_key(*cell))
+        if cached is not None:
+            cells[cell] = cached
+        else:
+            pending.append(cell)
+
+    size = max(1, int(chunk_size or config.FORECAST_BATCH_SIZE))
+    for i in range(0, len(pending), size):
+        chunk = pending[i:i + size]
+        for cell, payload in zip(chunk, _fetch_forecast_batch_upstream(chunk)):
+            if payload:
+                payload = forecast_cache.set(forecast_cache_key(*cell), payload)
+            cells[cell] = payload
+
+    return [cells[snap_to_grid(lat, lon)] or {} for lat, lon in points]
+
+# ===== Gói dữ liệu dự báo dùng chung trong một request =====
+class ForecastBundle:
+    """
+    Gói dữ liệu dự báo cho một request: gọi API đúng một lần,
+    parse lazily từng section (current/hourly/daily) từ cùng một payload.
+    Section được giữ dạng ForecastTable; DataFrame chỉ dựng khi gọi section().
+    """
+
+    SECTIONS = ("current", "hourly", "daily")
+
+    def __init__(self, lat: float, lon: float, data: dict = None, forecast_days: int = None):
+        self.lat = lat
+        self.lon = lon
+        self.forecast_days = forecast_days or config.FORECAST_DAYS
+        self._data = data
+        self._tables = {}
+        self._sections = {}
+        self._rain_summary = None
+        self.data_age_s = 0.0 if data is not None else None
+
+    @property
+    def data(self) -> dict:
+        """Payload như lưu trong cache (CompactPayload khi nén, parser đọc thẳng);
+        chỉ gọi API ở lần truy cập đầu tiên."""
+        if self._data is None:
+            data, age_s = fetch_forecast_with_age(self.lat, self.lon)
+            self._data = data or {}
+            self.data_age_s = round(age_s, 1) if data and age_s is not None else None
+        return self._data
+
+    async def load_async(self) -> "ForecastBundle":
+        """Tải payload trên event loop (không chặn thread); các bước parse sau đó
+        chỉ còn là CPU nên có thể đẩy sang threadpool."""
+        if self._data is None:
+            data, age_s = await fetch_forecast_with_age_async(self.lat, self.lon)
+            self._data = data or {}
+            self.data_age_s = round(age_s, 1) if data and age_s is not None else None
+        return self
+
+    @property
+    def is_empty(self) -> bool:
+        return not self.data
+
+    def memo(self, name: str, build, variant=None):
+        """Kết quả dẫn xuất từ payload, gắn vào bản ghi forecast_cache nên các request sau
+        (cùng ô lưới, cùng payload) dùng lại thay vì parse/tính lại; xem ForecastCache.memo."""
+        data = self.data
+        if not data:
+            return build()
+        key = forecast_cache_key(*snap_to_grid(self.lat, self.lon), self.forecast_days)
+        return forecast_cache.memo(key, data, name, build, variant)
+
+    def table(self, name: str) -> ForecastTable:
+        """Trả về ForecastTable của section, parse một lần cho mỗi payload đã cache."""
+        if name not in self.SECTIONS:
+            raise ValueError(f"Section không hợp lệ: {name}")
+        if name not in self._tables:
+            # Bảng giữ trong cache ở dạng gọn (float32/mã chuỗi), bung khi đọc cột/xuất
+            self._tables[name] = self.memo(f"table:{name}", lambda: self._parse(name).compact())
+        return self._tables[name]
+
+    def _parse(self, name: str) -> ForecastTable:
+        data = self.data
+        if not data:
+            table = ForecastTable()
+        elif name == "current":
+            table = parse_current_table(data)
+        elif name == "hourly":
+            table = parse_hourly_table(data, forecast_days=self.forecast_days)
+        else:
+            table = parse_daily_table(data, forecast_days=self.forecast_days)
+        return table if isinstance(table, ForecastTable) else ForecastTable()
+
+    def section(self, name: str) -> pd.DataFrame:
+        """Trả về DataFrame của section (đổi từ table() ở lần gọi đầu rồi giữ lại)."""
+        if name not in self._sections:
+            self._sections[name] = self.table(name).to_pandas()
+        return self._sections[name]
+
+    @property
+    def current(self) -> pd.DataFrame:
+        return self.section("current")
+
+    @property
+    def hourly(self) -> pd.DataFrame:
+        return self.section("hourly")
+
+    @property
+    def daily(self) -> pd.DataFrame:
+        return self.section("daily")
+
+    @property
+    def rain_summary(self) -> dict:
+        """Tổng hợp mưa current/24h/10d tính từ cùng payload (không gọi API riêng)."""
+        if self._rain_summary is None:
+            # Phụ thuộc giờ hiện tại: giữ theo giờ, sang giờ mới thì tính lại
+            hour = datetime.now(timezone(timedelta(seconds=LOCAL_UTC_OFFSET_S))).strftime("%Y-%m-%dT%H")
+            self._rain_summary = self.memo("rain_summary", lambda: summarize_precipitation(self.data), variant=hour)
+        return self._rain_summary
 
-    return {}
 
 # ===== Hàm đọc cache theo section =====
-def read_cache(lat: float, lon: float, section: str = None) -> pd.DataFrame:
-    """Đọc dữ liệu từ API và parse theo section (current/hourly/daily)."""
-    data = fetch_forecast(lat, lon)
-    if not data:
+def read_cache(lat: float, lon: float, section: str = None, bundle: ForecastBundle = None) -> pd.DataFrame:
+    """Đọc dữ liệu từ API và parse theo section (current/hourly/daily).
+    Truyền bundle để dùng lại payload đã tải trong cùng request."""
+    bundle = bundle or ForecastBundle(lat, lon)
+    if bundle.is_empty:
         return pd.DataFrame()
 
     try:
-        if section == "current":
-            return parse_current(data)
-        elif section == "hourly":
-            return parse_hourly(data, forecast_days=config.FORECAST_DAYS)
-        elif section == "daily":
-            return parse_daily(data, forecast_days=config.FORECAST_DAYS)
+        if section in ForecastBundle.SECTIONS:
+            return bundle.section(section)
         else:
             logger.warning("[read_cache] Section không xác định, trả về raw JSON")
-            return pd.DataFrame([{"raw_json": data}])
+            return pd.DataFrame([{"raw_json": expand_payload(bundle.data)}])
     except Exception as e:
         handle_service_error("read_cache", section or "unknown", e, alert_type="data")
         return pd.DataFrame()
 
 # ===== Hàm tổng hợp summary =====
-def get_cache_summary(lat: float, lon: float) -> dict:
+def get_cache_summary(lat: float, lon: float, bundle: ForecastBundle = None) -> dict:
     """Tạo báo cáo tổng hợp về dữ liệu current/hourly/daily."""
+    bundle = bundle or ForecastBundle(lat, lon)
     summary = {}
-    for section in ["current", "hourly", "daily"]:
+    for section in ForecastBundle.SECTIONS:
         try:
-            df = read_cache(lat, lon, section=section)
+            df = read_cache(lat, lon, section=section, bundle=bundle)
             if df.empty:
                 summary[section] = {"record_count": 0, "is_empty": True, "sample": None}
             else:
@@ -121,7 +333,7 @@ def get_cache_summary(lat: float, lon: float) -> dict:
     return summary
 
 # ===== Hàm cộng dồn mưa 24h =====
-def sum_rain_next_24h(df_hourly: pd.DataFrame, now_iso: str):
+def sum_rain_next_24h(df_hourly, now_iso: str):
     """
     Cộng dồn mưa từ thời điểm now đến 24h tới.
     Ưu tiên rain_mm, fallback showers, cuối cùng precipitation.
@@ -129,10 +341,31 @@ def sum_rain_next_24h(df_hourly: pd.DataFrame, now_iso: str):
     if df_hourly is None or df_hourly.empty or not now_iso:
         return None
 
-    now = pd.to_datetime(now_iso)
-    end = now + timedelta(hours=24)
+    if isinstance(df_hourly, ForecastTable):
+        # Mốc không offset là giờ địa phương của payload, khớp với cách so bên dưới
+        now = pd.to_datetime(now_iso).to_pydatetime()
+        window = df_hourly.window(now, now + timedelta(hours=24))
+        if window.empty:
+            return None
+        rain_vals = None
+        for col in ("rain_mm", "showers", "precipitation"):
+            if col in window and (rain_vals is None or pd.isna(rain_vals).all()):
+                rain_vals = window[col]
+        return round(float(np.nansum(rain_vals.astype(float))), 2) if rain_vals is not None else None
 
-    mask = (pd.to_datetime(df_hourly["ts"]) >= now) & (pd.to_datetime(df_hourly["ts"]) < end)
+    now = pd.to_datetime(now_iso)
+    ts = df_hourly["ts"]
+    if pd.api.types.is_numeric_dtype(ts):
+        # timeformat=unixtime: so trực tiếp trên epoch int64, now không offset coi là giờ địa phương
+        if now.tzinfo is None:
+            now = now.tz_localize(config.API_TZ)
+        start_s = int(now.timestamp())
+        values = ts.to_numpy()
+        mask = (values >= start_s) & (values < start_s + 24 * 3600)
+    else:
+        end = now + timedelta(hours=24)
+        ts = pd.to_datetime(ts)
+        mask = (ts >= now) & (ts < end)
     window = df_hourly.loc[mask]
     if window.empty:
         return None
@@ -167,7 +400,14 @@ def check_daily_hourly_consistency(daily_mm, hourly_sum_mm, ts_day):
 
 # ===== Export rõ ràng =====
 __all__ = [
+    "ForecastBundle",
+    "ForecastTable",
     "fetch_forecast",
+    "fetch_forecast_async",
+    "fetch_forecast_batch",
+    "fetch_forecast_with_age",
+    "fetch_forecast_with_age_async",
+    "prefetch_forecast",
     "read_cache",
     "get_cache_summary",
     "sum_rain_next_24h",
@@ -0,0 +1,221 @@
+# services/open_meteo/projection.py
+import urllib.parse
+from typing import Any, Dict, Hashable, Iterable, Optional, Tuple
+
+from services import config
+from services.weather_sources import fetch_json
+from .cache import forecast_cache, make_cache_key
+from .compact import CompactPayload, PackedSeries
+from .decode import decode_forecast
+from .grid import snap_to_grid
+from .timeaxis import is_epoch
+from .utils import DAILY_VARS, HOURLY_VARS, safe_round
+
+BASE_URL = "https://api.open-meteo.com/v1/forecast"
+TIMEZONE = "Asia/Ho_Chi_Minh"
+
+ISO = "iso"
+UNIXTIME = "unixtime"
+
+
+def payload_timeformat(payload: Any) -> Optional[str]:
+    """Định dạng thời gian thực tế của payload ("iso"/"unixtime"), None nếu không xác định."""
+    if not isinstance(payload, (dict, CompactPayload)):
+        return None
+    cw = payload.get("current_weather")
+    if isinstance(cw, dict) and cw.get("time") is not None:
+        return UNIXTIME if is_epoch(cw["time"]) else ISO
+    for name in ("hourly", "daily"):
+        times = (payload.get(name) or {}).get("time")
+        if times:
+            return UNIXTIME if is_epoch(times[0]) else ISO
+    return None
+
+
+def _trim_block(block: Any, names: frozenset, n: int) -> Dict[str, list]:
+    """Giữ "time" + các biến names (theo thứ tự payload), cắt còn n phần tử đầu (PackedSeries vẫn ở dạng gọn)."""
+    if not isinstance(block, dict):
+        return {}
+    return {k: v[:n] if isinstance(v, (list, PackedSeries)) else v
+            for k, v in block.items() if k == "time" or k in names}
+
+
+class Projection:
+    """
+    Phần dữ liệu Open-Meteo mà một endpoint cần: biến hourly/daily, current_weather, số ngày
+    và định dạng thời gian (None = chấp nhận cả ISO lẫn epoch, gọi mới thì theo OPEN_METEO_UNIXTIME).
+    - params()/url(): URL nhỏ nhất cho đúng phần dữ liệu đó
+    - cache_key(): cùng dạng khóa với forecast_cache_key
+    - covered_by(): payload đã cache (tập lớn hơn) có đáp ứng được không
+    """
+
+    __slots__ = ("hourly", "daily", "current", "days", "timeformat")
+
+    def __init__(self, hourly: Iterable[str] = (), daily: Iterable[str] = (), current: bool = False,
+                 days: int = 1, timeformat: Optional[str] = None):
+        self.hourly = frozenset(hourly)
+        self.daily = frozenset(daily)
+        self.current = bool(current)
+        self.days = max(1, int(days))
+        self.timeformat = timeformat
+
+    def __repr__(self) -> str:
+        return (f"Projection(hourly={sorted(self.hourly)}, daily={sorted(self.daily)}, "
+                f"current={self.current}, days={self.days}, timeformat={self.timeformat})")
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Projection) and self._fields() == other._fields()
+
+    def __hash__(self) -> int:
+        return hash(self._fields())
+
+    def _fields(self) -> tuple:
+        return self.hourly, self.daily, self.current, self.days, self.timeformat
+
+    def with_days(self, days: int) -> "Projection":
+        return Projection(self.hourly, self.daily, self.current, days, self.timeformat)
+
+    def union(self, other: "Projection") -> "Projection":
+        """Projection nhỏ nhất bao cả hai (một request thay cho hai)."""
+        timeformat = self.timeformat if self.timeformat == other.timeformat else (self.timeformat or other.timeformat)
+        return Projection(self.hourly | other.hourly, self.daily | other.daily, self.current or other.current,
+                          max(self.days, other.days), timeformat)
+
+    def request_timeformat(self) -> str:
+        if self.timeformat:
+            return self.timeformat
+        return UNIXTIME if config.OPEN_METEO_UNIXTIME else ISO
+
+    # ===== URL & khóa cache =====
+    def params(self) -> Dict[str, Any]:
+        """Tham số query (không gồm tọa độ), biến theo thứ tự chuẩn của HOURLY_VARS/DAILY_VARS."""
+        params: Dict[str, Any] = {}
+        if self.hourly:
+            params["hourly"] = ",".join(_ordered(self.hourly, HOURLY_VARS))
+        if self.daily:
+            params["daily"] = ",".join(_ordered(self.daily, DAILY_VARS))
+        if self.current:
+            params["current_weather"] = "true"
+        params["timezone"] = TIMEZONE
+        params["forecast_days"] = self.days
+        if self.request_timeformat() == UNIXTIME:
+            params["timeformat"] = UNIXTIME
+        return params
+
+    def url(self, lat: float, lon: float) -> str:
+        query = {"latitude": safe_round(lat, 6) or lat, "longitude": safe_round(lon, 6) or lon, **self.params()}
+        return f"{BASE_URL}?{urllib.parse.urlencode(query)}"
+
+    def cache_key(self, lat: float, lon: float) -> Tuple:
+        variables = [f"hourly:{v}" for v in self.hourly] + [f"daily:{v}" for v in self.daily]
+        if self.current:
+            variables.append("current_weather")
+        variables.append(f"days:{self.days}")
+        if self.request_timeformat() == UNIXTIME:
+            variables.append("timeformat:unixtime")
+        return make_cache_key(lat, lon, variables)
+
+    @classmethod
+    def from_key(cls, key: Hashable) -> Optional["Projection"]:
+        """Dựng lại Projection từ khóa cache (make_cache_key); None nếu khóa không phải forecast."""
+        if not isinstance(key, tuple) or len(key) != 3 or not isinstance(key[2], tuple):
+            return None
+        hourly, daily, current, days = [], [], False, None
+        for token in key[2]:
+            if not isinstance(token, str):
+                return None
+            kind, _, name = token.partition(":")
+            if kind == "hourly":
+                hourly.append(name)
+            elif kind == "daily":
+                daily.append(name)
+            elif token == "current_weather":
+                current = True
+            elif kind == "days" and name.isdigit():
+                days = int(name)
+        if days is None:
+            return None
+        return cls(hourly, daily, current, days)
+
+    # ===== Dùng payload đã cache =====
+    def covered_by(self, key: Hashable, payload: Any) -> bool:
+        """Payload (khóa key) chứa đủ biến, đủ số ngày và đúng định dạng thời gian yêu cầu."""
+        other = Projection.from_key(key)
+        if other is None or other.days < self.days:
+            return False
+        if not (self.hourly <= other.hourly and self.daily <= other.daily) or (self.current and not other.current):
+            return False
+        return self.timeformat is None or payload_timeformat(payload) == self.timeformat
+
+    def apply(self, payload: Any) -> Dict[str, Any]:
+        """Cắt payload (tập lớn hơn, dict hoặc CompactPayload) về đúng biến/số ngày; giữ nguyên
+        các trường meta. List/PackedSeries được cắt mới, payload trong cache không bị sửa."""
+        out: Dict[str, Any] = {}
+        for key, value in payload.items():
+            if key in ("current_weather", "current_weather_units"):
+                if self.current:
+                    out[key] = value
+            elif key in ("hourly", "hourly_units"):
+                if self.hourly:
+                    out[key] = _trim_block(value, self.hourly, self.days * 24) if key == "hourly" \
+                        else {k: v for k, v in value.items() if k == "time" or k in self.hourly}
+            elif key in ("daily", "daily_units"):
+                if self.daily:
+                    out[key] = _trim_block(value, self.daily, self.days) if key == "daily" \
+                        else {k: v for k, v in value.items() if k == "time" or k in self.daily}
+            else:
+                out[key] = value
+        return out
+
+
+def _ordered(names: frozenset, order: list) -> list:
+    known = [v for v in order if v in names]
+    return known + sorted(names.difference(order))
+
+
+# ===== Fetch theo projection (qua forecast_cache) =====
+def _cached(lat: float, lon: float, projection: Projection) -> Optional[Tuple[Any, float]]:
+    """Payload còn hạn cùng ô lưới đáp ứng được projection (khóa đúng hoặc tập lớn hơn)."""
+    key = projection.cache_key(lat, lon)
+    hit = forecast_cache.find_fresh((key[0], key[1]), projection.covered_by, prefer=key)
+    if hit is None:
+        return None
+    hit_key, data, age = hit
+    return (data if hit_key == key else projection.apply(data)), age
+
+
+def fetch_projected_with_age(lat: float, lon: float, projection: Projection) -> Tuple[Optional[dict], Optional[float]]:
+    """Lấy đúng phần dữ liệu projection cần: dùng payload đã cache nếu có (kể cả payload rộng hơn),
+    không thì gọi URL nhỏ nhất và cache theo khóa của projection.
+    Payload ở dạng lưu trong cache (có thể chứa PackedSeries): trả JSON thô thì qua expand_payload."""
+    from services.open_meteo.open_meteo import _request_json
+
+    grid_lat, grid_lon = snap_to_grid(lat, lon)
+    hit = _cached(grid_lat, grid_lon, projection)
+    if hit is not None:
+        return hit
+    url = projection.url(grid_lat, grid_lon)
+    return forecast_cache.get_or_load_with_age(projection.cache_key(grid_lat, grid_lon), lambda: _request_json(url))
+
+
+async def fetch_projected_with_age_async(lat: float, lon: float, projection: Projection) -> Tuple[Optional[dict], Optional[float]]:
+    """Bản asyncio của fetch_projected_with_age (httpx, cùng cache)."""
+    grid_lat, grid_lon = snap_to_grid(lat, lon)
+    hit = _cached(grid_lat, grid_lon, projection)
+    if hit is not None:
+        return hit
+    url = projection.url(grid_lat, grid_lon)
+    return await forecast_cache.get_or_load_with_age_async(
+        projection.cache_key(grid_lat, grid_lon),
+        lambda: fetch_json(url, context="fetch_forecast", decode=decode_forecast),
+    )
+
+
+def fetch_projected(lat: float, lon: float, projection: Projection) -> Optional[dict]:
+    return fetch_projected_with_age(lat, lon, projection)[0]
+
+
+__all__ = [
+    "ISO", "UNIXTIME", "Projection",
+    "fetch_projected", "fetch_projected_with_age", "fetch_projected_with_age_async", "payload_timeformat",
+]
@@ -0,0 +1,89 @@
+# services/open_meteo/singleflight.py
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class _Call:
+    """Một lần gọi upstream đang chạy, các caller trùng khóa chờ trên event này."""
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Gộp các lời gọi đồng thời cùng khóa thành một lần gọi upstream duy nhất.
+    - do(): cho handler sync chạy trên threadpool
+    - do_async(): cho đường asyncio (các coroutine cùng event loop)
+    Mọi caller nhận cùng kết quả (hoặc cùng exception) của lần gọi dẫn đầu.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._tasks: Dict[Hashable, "asyncio.Task"] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.leaders += 1
+                leader = True
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    async def do_async(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        with self._lock:
+            task = self._tasks.get(key)
+            if task is not None and not task.done():
+                self.coalesced += 1
+            else:
+                task = asyncio.ensure_future(fn())
+                self._tasks[key] = task
+                self.leaders += 1
+                task.add_done_callback(lambda t, k=key: self._forget_task(k, t))
+        # shield: một caller bị hủy không làm hủy lần gọi chung của các caller khác
+        return await asyncio.shield(task)
+
+    def _forget_task(self, key: Hashable, task: "asyncio.Task") -> None:
+        with self._lock:
+            if self._tasks.get(key) is task:
+                del self._tasks[key]
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls) + len(self._tasks)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "leaders": self.leaders,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._calls) + len(self._tasks),
+            }
@@ -0,0 +1,313 @@
+# services/open_meteo/table.py
+import sys
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+from pytz import timezone
+
+from .compact import PackedSeries, pack_array
+from .timeaxis import LOCAL_UTC_OFFSET_S, TimeLike, _fixed_tz, is_epoch
+
+# Múi giờ ICT
+ICT = timezone("Asia/Bangkok")
+
+# Cột thời gian có thể ở dạng epoch (timeformat=unixtime), đổi sang ISO giờ địa phương khi xuất
+TIME_FIELDS = ("ts", "sunrise", "sunset")
+
+
+def as_array(values) -> np.ndarray:
+    """list/ndarray/Series → ndarray 1 chiều; chuỗi và giá trị hỗn hợp giữ dtype object như pandas."""
+    if isinstance(values, pd.Series):
+        values = values.to_numpy()
+    if isinstance(values, np.ndarray):
+        return values if values.dtype.kind not in "US" else values.astype(object)
+    values = list(values)
+    arr = np.asarray(values) if values else np.array([], dtype=object)
+    if arr.dtype.kind in "USO" or arr.ndim != 1:
+        numbers = [v for v in values if v is not None]
+        if numbers and len(numbers) < len(values) and all(is_epoch(v) for v in numbers):
+            # Số lẫn None → float với NaN (như pandas suy kiểu từ list)
+            return np.array([np.nan if v is None else v for v in values], dtype=float)
+        arr = np.empty(len(values), dtype=object)
+        arr[:] = values
+    return arr
+
+
+def _to_seconds(value: TimeLike, utc_offset_s: int) -> Optional[float]:
+    """Một mốc thời gian → epoch giây; chuỗi/datetime không offset coi là giờ địa phương của payload."""
+    if is_epoch(value):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=_fixed_tz(utc_offset_s))
+        return value.timestamp()
+    return None
+
+
+def _iso_minutes(seconds: np.ndarray, utc_offset_s: int) -> np.ndarray:
+    """Mảng epoch giây → chuỗi 'YYYY-MM-DDTHH:MM' giờ địa phương (NaN → None)."""
+    vals = np.asarray(seconds, dtype=float)
+    ok = ~np.isnan(vals)
+    out = np.full(len(vals), None, dtype=object)
+    if ok.any():
+        local = (vals[ok] + utc_offset_s).astype(np.int64).astype("datetime64[s]")
+        out[ok] = np.datetime_as_string(local, unit="m")
+    return out
+
+
+def _iso_aware(values: np.ndarray, utc_offset_s: int) -> np.ndarray:
+    """Mảng datetime64 (mốc UTC) → chuỗi isoformat có offset, giống Timestamp.isoformat() (NaT → None)."""
+    vals = values.astype("datetime64[s]")
+    ok = ~np.isnat(vals)
+    out = np.full(len(vals), None, dtype=object)
+    if ok.any():
+        sign = "+" if utc_offset_s >= 0 else "-"
+        hh, mm = divmod(abs(int(utc_offset_s)) // 60, 60)
+        local = np.datetime_as_string(vals[ok] + np.timedelta64(int(utc_offset_s), "s"), unit="s")
+        out[ok] = np.char.add(local.astype(str), f"{sign}{hh:02d}:{mm:02d}").astype(object)
+    return out
+
+
+def _py_value(values: np.ndarray, i: int):
+    if isinstance(values, PackedSeries):
+        return values.item(i)
+    if values.dtype.kind == "O":
+        return values[i]
+    if values.dtype.kind == "M":
+        return pd.Timestamp(values[i]).tz_localize("UTC") if not np.isnat(values[i]) else pd.NaT
+    return values[i].item()
+
+
+def _expand(values) -> np.ndarray:
+    return values.to_numpy() if isinstance(values, PackedSeries) else values
+
+
+class ForecastTable:
+    """
+    Bảng dự báo gọn nhẹ: mỗi cột là một mảng NumPy cùng độ dài, giữ thứ tự cột.
+    Dùng trên đường nóng thay cho DataFrame; chỉ đổi sang pandas khi gọi to_pandas().
+    - Cắt theo vị trí/khoảng thời gian trả về bảng mới dùng chung (view) mảng gốc
+    - Cột thời gian "ts" giữ nguyên kiểu của payload (chuỗi ISO hoặc epoch int64)
+    - compact(): cột số lưu float32, cột chuỗi lặp lại (weather_desc, source) lưu mã;
+      đọc cột/xuất dữ liệu tự bung về float64/chuỗi như ban đầu
+    """
+
+    __slots__ = ("_cols", "_n", "utc_offset_s", "_ts_s")
+
+    def __init__(self, columns: Dict[str, Iterable] = None, utc_offset_s: int = LOCAL_UTC_OFFSET_S):
+        cols = {name: as_array(values) for name, values in (columns or {}).items()}
+        lengths = {len(v) for v in cols.values()}
+        if len(lengths) > 1:
+            raise ValueError(f"Các cột phải cùng độ dài: {sorted(lengths)}")
+        self._cols = cols
+        self._n = lengths.pop() if lengths else 0
+        self.utc_offset_s = utc_offset_s
+        self._ts_s = None
+
+    @classmethod
+    def _wrap(cls, cols: Dict[str, np.ndarray], n: int, utc_offset_s: int) -> "ForecastTable":
+        # Dựng nhanh từ các mảng đã chuẩn hóa (không kiểm tra lại)
+        table = cls.__new__(cls)
+        table._cols, table._n, table.utc_offset_s, table._ts_s = cols, n, utc_offset_s, None
+        return table
+
+    @classmethod
+    def from_records(cls, records: List[dict], utc_offset_s: int = LOCAL_UTC_OFFSET_S) -> "ForecastTable":
+        names = list(dict.fromkeys(k for r in records for k in r))
+        return cls({k: [r.get(k) for r in records] for k in names}, utc_offset_s)
+
+    @classmethod
+    def from_pandas(cls, df: pd.DataFrame, utc_offset_s: int = LOCAL_UTC_OFFSET_S) -> "ForecastTable":
+        if df is None or df.empty:
+            return cls(utc_offset_s=utc_offset_s)
+        return cls({str(c): df[c].to_numpy() for c in df.columns}, utc_offset_s)
+
+    # ===== Truy cập =====
+    def __len__(self) -> int:
+        return self._n
+
+    @property
+    def empty(self) -> bool:
+        return self._n == 0 or not self._cols
+
+    @property
+    def columns(self) -> List[str]:
+        return list(self._cols)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._cols
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return _expand(self._cols[name])
+
+    def get(self, name: str, default=None):
+        values = self._cols.get(name)
+        return default if values is None else _expand(values)
+
+    def __repr__(self) -> str:
+        return f"ForecastTable(rows={self._n}, columns={self.columns})"
+
+    @property
+    def nbytes(self) -> int:
+        """Ước lượng bộ nhớ các cột (cột object tính theo phần tử đầu)."""
+        total = 0
+        for v in self._cols.values():
+            total += v.nbytes
+            if not isinstance(v, PackedSeries) and v.dtype.kind == "O" and len(v):
+                total += len(v) * sys.getsizeof(v[0])
+        return total
+
+    def with_column(self, name: str, values) -> "ForecastTable":
+        """Bảng mới có thêm (hoặc thay) một cột; các cột khác dùng chung mảng."""
+        arr = as_array(values)
+        if self._cols and len(arr) != self._n:
+            raise ValueError(f"Cột {name} dài {len(arr)}, bảng có {self._n} dòng")
+        cols = dict(self._cols)
+        cols[name] = arr
+        return ForecastTable._wrap(cols, len(arr), self.utc_offset_s)
+
+    def compact(self) -> "ForecastTable":
+        """Bảng mới lưu gọn để giữ lâu trong cache (cột thời gian giữ nguyên); chỉ nén
+        khi bung lại được đúng giá trị cũ."""
+        cols = {}
+        for k, v in self._cols.items():
+            packed = None if k in TIME_FIELDS or k == "ts_local" or isinstance(v, PackedSeries) else pack_array(v)
+            cols[k] = packed if packed is not None else v
+        return ForecastTable._wrap(cols, self._n, self.utc_offset_s)
+
+    def row(self, i: int) -> dict:
+        """Một dòng dạng dict giá trị Python (giống df.iloc[i].to_dict())."""
+        return {k: _py_value(v, i) for k, v in self._cols.items()}
+
+    def iter_rows(self) -> Iterator[dict]:
+        for i in range(self._n):
+            yield self.row(i)
+
+    # ===== Cắt bảng =====
+    def take(self, index) -> "ForecastTable":
+        """Chọn dòng theo slice/mảng index/mặt nạ bool."""
+        cols = {k: v[index] for k, v in self._cols.items()}
+        n = len(next(iter(cols.values()))) if cols else 0
+        return ForecastTable._wrap(cols, n, self.utc_offset_s)
+
+    def head(self, n: int) -> "ForecastTable":
+        return self.take(slice(0, max(0, n)))
+
+    def ts_seconds(self) -> np.ndarray:
+        """Cột ts dưới dạng epoch giây (float, NaN nếu không parse được); tính một lần rồi giữ lại."""
+        if self._ts_s is None:
+            ts = self.get("ts")
+            if ts is None:
+                self._ts_s = np.full(self._n, np.nan)
+            elif ts.dtype.kind in "iuf":
+                self._ts_s = ts.astype(float)
+            else:
+                secs = [_to_seconds(v, self.utc_offset_s) for v in ts]
+                self._ts_s = np.array([np.nan if s is None else s for s in secs], dtype=float)
+        return self._ts_s
+
+    def window(self, start: TimeLike = None, end: TimeLike = None) -> "ForecastTable":
+        """Các dòng có ts trong [start, end); mốc không offset coi là giờ địa phương của payload.
+        Trục đã sắp xếp thì cắt bằng searchsorted (view), ngược lại dùng mặt nạ."""
+        secs = self.ts_seconds()
+        lo = _to_seconds(start, self.utc_offset_s) if start is not None else -np.inf
+        hi = _to_seconds(end, self.utc_offset_s) if end is not None else np.inf
+        if lo is None or hi is None:
+            return self.take(slice(0, 0))
+        if not np.isnan(secs).any() and bool(np.all(secs[1:] >= secs[:-1])):
+            i, j = np.searchsorted(secs, [lo, hi], side="left")
+            return self.take(slice(int(i), int(j)))
+        return self.take((secs >= lo) & (secs < hi))
+
+    # ===== Xuất dữ liệu =====
+    def _export_columns(self, utc_offset_s: int) -> Dict[str, np.ndarray]:
+        out = {}
+        for k, v in self._cols.items():
+            v = _expand(v)
+            if k in TIME_FIELDS and v.dtype.kind in "iuf":
+                out[k] = _iso_minutes(v, utc_offset_s)
+            elif v.dtype.kind == "M":
+                out[k] = _iso_aware(v, utc_offset_s)
+            else:
+                out[k] = v
+        return out
+
+    def to_columns(self, utc_offset_s: int = LOCAL_UTC_OFFSET_S) -> Dict[str, list]:
+        """dict tên cột → list giá trị Python; cột thời gian epoch/datetime đổi sang chuỗi ISO."""
+        return {k: v.tolist() for k, v in self._export_columns(utc_offset_s).items()}
+
+    def to_records(self, utc_offset_s: int = LOCAL_UTC_OFFSET_S) -> List[dict]:
+        """list[dict] theo dòng (giống df.to_dict(orient="records")), thời gian đổi sang ISO như to_columns()."""
+        cols = self.to_columns(utc_offset_s)
+        names = list(cols)
+        return [dict(zip(names, vals)) for vals in zip(*cols.values())]
+
+    def to_pandas(self, tz=None) -> pd.DataFrame:
+        """Đổi sang DataFrame (chỉ khi cần các phép pandas). Cột datetime64 (mốc UTC)
+        được gắn múi giờ tz (mặc định UTC)."""
+        data = {}
+        for k, v in self._cols.items():
+            v = _expand(v)
+            if v.dtype.kind == "M":
+                s = pd.Series(v.astype("datetime64[ns]")).dt.tz_localize("UTC")
+                data[k] = s.dt.tz_convert(tz) if tz is not None else s
+            else:
+                data[k] = v
+        return pd.DataFrame(data)
+
+
+def as_frame(data, tz=None) -> pd.DataFrame:
+    """DataFrame hoặc ForecastTable → DataFrame (None → DataFrame rỗng)."""
+    if isinstance(data, ForecastTable):
+        return data.to_pandas(tz=tz)
+    if data is None:
+        return pd.DataFrame()
+    return data
+
+
+def to_datetime_series(s: pd.Series) -> pd.Series:
+    """Series thời gian → datetime: epoch giây thành UTC tz-aware, chuỗi ISO parse như cũ."""
+    if pd.api.types.is_numeric_dtype(s):
+        return pd.to_datetime(s, unit="s", utc=True, errors="coerce")
+    return pd.to_datetime(s, errors="coerce")
+
+
+def to_timestamp(val):
+    """Một giá trị thời gian → pd.Timestamp (epoch giây đổi sang giờ ICT); NaT nếu không hợp lệ."""
+    if is_epoch(val):
+        return pd.Timestamp(float(val), unit="s", tz="UTC").tz_convert(ICT)
+    return pd.to_datetime(val, errors="coerce")
+
+
+def local_time_column(table: ForecastTable) -> Optional[np.ndarray]:
+    """Cột ts → datetime64[ns] mốc UTC: epoch là thời điểm thực; chuỗi ISO không offset là giờ
+    địa phương của payload (trừ utc_offset_s) nên hai chế độ timeformat cho cùng mốc thời gian."""
+    ts = table.get("ts")
+    if ts is None:
+        return None
+    if ts.dtype.kind in "iuf":
+        vals = ts.astype(float)
+        out = np.full(len(vals), np.datetime64("NaT"), dtype="datetime64[ns]")
+        ok = ~np.isnan(vals)
+        out[ok] = vals[ok].astype(np.int64).astype("datetime64[s]")
+        return out
+    try:
+        wall = np.array(ts, dtype="datetime64[s]")
+        return (wall - np.timedelta64(int(table.utc_offset_s or 0), "s")).astype("datetime64[ns]")
+    except (ValueError, TypeError):
+        # Chuỗi có offset/không hợp lệ: dùng pandas để parse giống bản DataFrame
+        s = pd.to_datetime(pd.Series(ts), errors="coerce", utc=True)
+        return s.dt.tz_localize(None).to_numpy(dtype="datetime64[ns]")
+
+
+__all__ = [
+    "ICT", "ForecastTable", "TIME_FIELDS", "as_array", "as_frame", "local_time_column",
+    "to_datetime_series", "to_timestamp",
+]
@@ -0,0 +1,146 @@
+# services/open_meteo/timeaxis.py
+import math
+from bisect import bisect_left
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Sequence, Union
+
+import numpy as np
+
+from .compact import SharedTimes
+
+HOUR_S = 3600
+
+# Payload dùng timezone=Asia/Ho_Chi_Minh (UTC+7, không có giờ mùa hè)
+LOCAL_UTC_OFFSET_S = 7 * 3600
+
+TimeLike = Union[str, int, float, datetime, None]
+
+
+def is_epoch(value) -> bool:
+    """Giá trị thời gian dạng epoch giây (timeformat=unixtime)."""
+    return isinstance(value, (int, float, np.integer, np.floating)) and not isinstance(value, (bool, np.bool_))
+
+
+def epoch_to_iso(value, utc_offset_s: int = LOCAL_UTC_OFFSET_S, fmt: str = "%Y-%m-%dT%H:%M"):
+    """Epoch giây → chuỗi giờ địa phương cùng định dạng ISO của Open-Meteo; giá trị khác giữ nguyên.
+    Chỉ dùng ở biên xuất JSON/văn bản."""
+    if not is_epoch(value) or value != value:
+        return value
+    return datetime.fromtimestamp(float(value), _fixed_tz(utc_offset_s)).strftime(fmt)
+
+
+def _fixed_tz(utc_offset_s: int) -> timezone:
+    return timezone(timedelta(seconds=int(utc_offset_s or 0)))
+
+
+def _parse(value: TimeLike, utc_offset_s: int = 0) -> Optional[datetime]:
+    if isinstance(value, datetime):
+        return value
+    if is_epoch(value):
+        # Epoch là thời điểm thực; gắn offset của payload để giờ đồng hồ là giờ địa phương
+        return datetime.fromtimestamp(float(value), _fixed_tz(utc_offset_s))
+    if not isinstance(value, str) or not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+def _utc_s(dt: datetime) -> float:
+    """Mốc UTC (giây); chuỗi không offset coi như UTC (giống pd.to_datetime(..., utc=True))."""
+    return (dt if dt.tzinfo is not None else dt.replace(tzinfo=timezone.utc)).timestamp()
+
+
+def _wall_s(dt: datetime) -> float:
+    """Giờ đồng hồ (bỏ offset), dùng để so khớp theo khóa giờ 'YYYY-MM-DDTHH:00'."""
+    return dt.replace(tzinfo=timezone.utc).timestamp()
+
+
+def _floor_hour(seconds: float) -> int:
+    return int(seconds // HOUR_S) * HOUR_S
+
+
+class HourlyAxis:
+    """
+    Trục thời gian hourly của một payload Open-Meteo, parse một lần khi dựng.
+    - Lưới đều bước 1 giờ (trường hợp thường gặp): chỉ giữ mốc đầu,
+      index tính bằng số học O(1)
+    - Lưới không đều: giữ toàn bộ mốc thời gian, tìm nhị phân
+    """
+
+    __slots__ = ("n", "aware", "regular", "utc_offset_s", "_start_utc", "_start_wall", "_valid", "_sorted", "_hour_keys")
+
+    def __init__(self, times: Sequence[TimeLike], utc_offset_s: int = 0):
+        self.n = len(times)
+        self._valid: Optional[List[tuple]] = None
+        self._sorted = True
+        self._hour_keys = None
+        self._start_utc = self._start_wall = None
+        self.utc_offset_s = utc_offset_s
+
+        # Parse và kiểm tra một lần khi dựng trục (trục được cache theo payload)
+        parsed = [_parse(t, utc_offset_s) for t in times]
+        first = parsed[0] if parsed else None
+        self.aware = first is not None and first.tzinfo is not None
+        utc = [_utc_s(dt) if dt is not None else None for dt in parsed]
+        self.regular = bool(parsed) and all(
+            dt is not None and (dt.tzinfo is not None) == self.aware for dt in parsed
+        ) and all(
+            b - a == HOUR_S for a, b in zip(utc, utc[1:])
+        ) and all(
+            _wall_s(b) - _wall_s(a) == HOUR_S for a, b in zip(parsed, parsed[1:])
+        )
+
+        if self.regular:
+            self._start_utc = utc[0]
+            self._start_wall = _wall_s(first)
+        elif self.n:
+            self._valid = [(v, i) for i, v in enumerate(utc) if v is not None]
+            self._sorted = all(a[0] <= b[0] for a, b in zip(self._valid, self._valid[1:]))
+            self._hour_keys = {}
+            for i, dt in enumerate(parsed):
+                if dt is not None:
+                    self._hour_keys.setdefault(_floor_hour(_wall_s(dt)), i)
+
+    def nearest(self, target: TimeLike) -> int:
+        """Index có thời điểm gần target nhất (bằng nhau thì lấy index nhỏ hơn); -1 nếu không xác định."""
+        dt = _parse(target, self.utc_offset_s)
+        if dt is None or not self.n:
+            return -1
+        t = _utc_s(dt)
+        if self.regular:
+            x = (t - self._start_utc) / HOUR_S
+            return min(self.n - 1, max(0, math.ceil(x - 0.5)))
+
+        valid = self._valid
+        if not valid:
+            return -1
+        if not self._sorted:
+            return min(valid, key=lambda p: (abs(p[0] - t), p[1]))[1]
+        pos = bisect_left(valid, (t, -1))
+        candidates = [valid[j] for j in (pos - 1, pos) if 0 <= j < len(valid)]
+        return min(candidates, key=lambda p: (abs(p[0] - t), p[1]))[1]
+
+    def hour_index(self, target: TimeLike) -> int:
+        """Index đầu tiên cùng khóa giờ đồng hồ với target (bỏ qua offset); -1 nếu không có."""
+        dt = _parse(target, self.utc_offset_s)
+        if dt is None or not self.n:
+            return -1
+        key = _floor_hour(_wall_s(dt))
+        if self.regular:
+            i = (key - _floor_hour(self._start_wall)) // HOUR_S
+            return int(i) if 0 <= i < self.n else -1
+        return self._hour_keys.get(key, -1)
+
+
+def hourly_axis(times: Sequence[TimeLike], utc_offset_s: int = 0) -> HourlyAxis:
+    """Trả về HourlyAxis của list times. List "time" của payload trong cache (SharedTimes) giữ
+    luôn trục đã parse nên các request sau dùng lại, và trục bị bỏ cùng payload khi cache loại;
+    list thường thì parse mới. utc_offset_s (utc_offset_seconds của payload) chỉ có tác dụng với trục epoch."""
+    if not isinstance(times, SharedTimes):
+        return HourlyAxis(times, utc_offset_s)
+    axis = times.axes.get(utc_offset_s)
+    if axis is None:
+        axis = times.axes[utc_offset_s] = HourlyAxis(times, utc_offset_s)
+    return axis
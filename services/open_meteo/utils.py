@@ -1,7 +1,12 @@
 # services/open_meteo/utils.py
 import urllib.parse
+import numpy as np
 import pandas as pd
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
+
+from services import config
+from .compact import PackedSeries
+from .timeaxis import hourly_axis
 
 # ===== Tiện ích số liệu =====
 def safe_round(val: Any, ndigits: int = 2) -> Optional[float]:
@@ -27,11 +32,11 @@ def safe_float(val: Any, default: Optional[float] = None) -> Optional[float]:
         return default
 
 def _get(h: Dict[str, Any], key: str, idx: int, ndigits: Optional[int] = None) -> Any:
-    """Lấy h[key][idx] an toàn, hỗ trợ làm tròn."""
+    """Lấy h[key][idx] an toàn, hỗ trợ làm tròn (đọc thẳng PackedSeries của payload gọn)."""
     arr = h.get(key, [])
-    if not isinstance(arr, (list, tuple)) or idx is None or idx < 0 or idx >= len(arr):
+    if not isinstance(arr, (list, tuple, PackedSeries)) or idx is None or idx < 0 or idx >= len(arr):
         return None
-    val = arr[idx]
+    val = arr.item(idx) if isinstance(arr, PackedSeries) else arr[idx]
     return safe_round(val, ndigits) if ndigits is not None else val
 
 def kmh_to_ms(val: Any, ndigits: int = 2) -> Optional[float]:
@@ -45,6 +50,56 @@ def kmh_to_ms(val: Any, ndigits: int = 2) -> Optional[float]:
     except Exception:
         return None
 
+# ===== Tiện ích số liệu dạng mảng (cho parser vector hóa) =====
+def round_array(vals: np.ndarray, ndigits: int = 2) -> np.ndarray:
+    """Làm tròn mảng cho kết quả giống hệt round() của Python từng phần tử (NaN giữ nguyên).
+    np.round (nhân 10**ndigits rồi làm tròn chẵn) chỉ lệch với round() ở giá trị sát mốc .5
+    (vd. 1.15 thực là 1.1499…): các phần tử đó được làm tròn lại bằng round()."""
+    vals = np.asarray(vals, dtype=float)
+    out = np.round(vals, ndigits)
+    scaled = np.abs(vals) * 10.0 ** ndigits
+    with np.errstate(invalid="ignore"):
+        near = (np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6) | (scaled >= 1e9)
+    for i in np.flatnonzero(near).tolist():
+        out[i] = round(float(vals[i]), ndigits)
+    return out
+
+def _get_array(h: Dict[str, Any], key: str, n: int, ndigits: Optional[int] = None) -> np.ndarray:
+    """Bản mảng của _get: cột h[key][:n] dạng float64, NaN ở vị trí None/không hợp lệ/thiếu."""
+    out = np.full(n, np.nan)
+    arr = h.get(key)
+    if isinstance(arr, PackedSeries) and arr.kind != "cat":
+        arr = arr[:n].to_numpy()
+    elif isinstance(arr, PackedSeries):
+        arr = arr[:n].tolist()
+    if not isinstance(arr, (list, tuple, np.ndarray)) or n <= 0:
+        return out
+    vals = arr[:n]
+    try:
+        col = np.asarray(vals, dtype=float)
+    except (TypeError, ValueError):
+        col = np.array([safe_float(v, np.nan) for v in vals], dtype=float)
+    out[:len(col)] = col
+    return round_array(out, ndigits) if ndigits is not None else out
+
+def kmh_to_ms_array(vals: np.ndarray, ndigits: int = 2) -> np.ndarray:
+    """Bản mảng của kmh_to_ms (NaN giữ nguyên)."""
+    return round_array(vals / 3.6, ndigits)
+
+def describe_weather_array(rain_mm: np.ndarray, cloud_pct: np.ndarray) -> np.ndarray:
+    """Bản mảng của describe_weather (np.select, cùng ngưỡng và thứ tự ưu tiên)."""
+    r = np.nan_to_num(rain_mm, nan=0.0)
+    c = np.where(np.isnan(cloud_pct), 50.0, cloud_pct)
+    conditions = [r >= 20, r >= 10, r >= 2, r >= 0.2, c >= 80, c >= 50]
+    choices = ["Mưa rất to", "Mưa to", "Mưa vừa", "Có mưa", "Nhiều mây", "Có mây"]
+    return np.select(conditions, choices, default="Trời quang").astype(object)
+
+def as_column(vals: np.ndarray) -> np.ndarray:
+    """Cột toàn NaN trả về object None, giống DataFrame dựng từ list dict toàn None."""
+    if vals.dtype.kind == "f" and np.isnan(vals).all():
+        return np.full(len(vals), None, dtype=object)
+    return vals
+
 # ===== Mô tả thời tiết =====
 def describe_weather(rain_mm: Optional[float], cloud_pct: Optional[float]) -> str:
     """Sinh mô tả ngắn dựa trên lượng mưa (mm) và độ mây (%)."""
@@ -59,51 +114,63 @@ def describe_weather(rain_mm: Optional[float], cloud_pct: Optional[float]) -> st
     return "Trời quang"
 
 # ===== Thời gian & chỉ số gần nhất =====
-def _nearest_hour_index(times: List[str], current_iso: str) -> int:
-    """Tìm index giờ gần nhất với ISO hiện tại; trả -1 nếu không xác định."""
-    if not times or not current_iso:
+def _nearest_hour_index(times: List[Any], current_iso: Any, utc_offset_s: int = 0) -> int:
+    """Tìm index giờ gần nhất với ISO (hoặc epoch) hiện tại; trả -1 nếu không xác định.
+    Trục thời gian được parse một lần và dùng lại cho cùng payload (xem timeaxis)."""
+    if not times or current_iso is None or current_iso == "":
         return -1
     try:
-        t_series = pd.to_datetime(pd.Series(times), errors="coerce", utc=True)
-        t_current = pd.to_datetime(current_iso, errors="coerce", utc=True)
-        if pd.isna(t_current) or t_series.isna().all():
-            return -1
-        diffs = (t_series - t_current).abs()
-        # idxmin trên Series trả index; cần kiểm tra NaT
-        valid = diffs.dropna()
-        if valid.empty:
-            return -1
-        idx = int(valid.idxmin())
-        return idx
+        return hourly_axis(times, utc_offset_s).nearest(current_iso)
     except Exception:
         return -1
 
 # ===== URL gọi API =====
+HOURLY_VARS = [
+    "temperature_2m","apparent_temperature","dewpoint_2m",
+    "precipitation","rain","precipitation_probability",
+    "relative_humidity_2m",
+    "windspeed_10m","windgusts_10m","winddirection_10m",
+    "cloudcover","cloudcover_low","cloudcover_mid","cloudcover_high",
+    "pressure_msl","shortwave_radiation","uv_index"
+]
+DAILY_VARS = [
+    "temperature_2m_min","temperature_2m_max",
+    "precipitation_sum","precipitation_hours",
+    "windspeed_10m_max","windgusts_10m_max",
+    "sunrise","sunset","uv_index_max"
+]
+
+def _forecast_params(forecast_days: int) -> Dict[str, Any]:
+    """Tham số chung (biến hourly/daily, timezone, số ngày) cho mọi URL forecast."""
+    params = {
+        "hourly": ",".join(HOURLY_VARS),
+        "daily": ",".join(DAILY_VARS),
+        "current_weather": "true",
+        "timezone": "Asia/Ho_Chi_Minh",
+        "forecast_days": int(forecast_days),
+    }
+    if config.OPEN_METEO_UNIXTIME:
+        params["timeformat"] = "unixtime"
+    return params
+
 def build_api_url(lat: float, lon: float, forecast_days: int = 10) -> str:
     """Xây dựng URL Open-Meteo với tham số cần thiết."""
     base = "https://api.open-meteo.com/v1/forecast"
-    hourly = ",".join([
-        "temperature_2m","apparent_temperature","dewpoint_2m",
-        "precipitation","rain","precipitation_probability",
-        "relative_humidity_2m",
-        "windspeed_10m","windgusts_10m","winddirection_10m",
-        "cloudcover","cloudcover_low","cloudcover_mid","cloudcover_high",
-        "pressure_msl","shortwave_radiation","uv_index"
-    ])
-    daily = ",".join([
-        "temperature_2m_min","temperature_2m_max",
-        "precipitation_sum","precipitation_hours",
-        "windspeed_10m_max","windgusts_10m_max",
-        "sunrise","sunset","uv_index_max"
-    ])
     params = {
         "latitude": safe_round(lat, 6) or lat,
         "longitude": safe_round(lon, 6) or lon,
-        "hourly": hourly,
-        "daily": daily,
-        "current_weather": "true",
-        "timezone": "Asia/Ho_Chi_Minh",
-        "forecast_days": int(forecast_days),
+        **_forecast_params(forecast_days),
+    }
+    return f"{base}?{urllib.parse.urlencode(params)}"
+
+def build_batch_api_url(points: List[Tuple[float, float]], forecast_days: int = 10) -> str:
+    """URL Open-Meteo cho nhiều điểm: latitude/longitude là danh sách phân cách bằng dấu phẩy,
+    API trả về mảng forecast theo đúng thứ tự điểm."""
+    base = "https://api.open-meteo.com/v1/forecast"
+    params = {
+        "latitude": ",".join(str(safe_round(lat, 6)) for lat, _ in points),
+        "longitude": ",".join(str(safe_round(lon, 6)) for _, lon in points),
+        **_forecast_params(forecast_days),
     }
     return f"{base}?{urllib.parse.urlencode(params)}"
 
@@ -0,0 +1,120 @@
+# services/prefetch.py
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+
+from apscheduler.triggers.cron import CronTrigger
+
+from services import config
+from services.state import state
+from services.scheduler import get_scheduler
+from services.open_meteo.grid import grid_cell_key
+from services.open_meteo.open_meteo import fetch_forecast_batch
+from vietnam_provinces import PROVINCES
+from vietnam_wards import WARDS
+
+logger = logging.getLogger("WeatherService")
+
+PREFETCH_JOB_ID = "prefetch_cycle"
+_stats_lock = threading.Lock()
+
+
+def prefetch_targets(hot_wards: List[str] = None) -> List[Dict]:
+    """
+    Danh sách điểm cần làm nóng cache: toàn bộ tỉnh/thành + phường/xã nóng
+    ("*" = toàn bộ phường/xã). Gộp theo ô lưới để mỗi ô chỉ tải một lần.
+    """
+    hot_wards = config.PREFETCH_HOT_WARDS if hot_wards is None else hot_wards
+    if "*" in hot_wards:
+        hot_wards = list(WARDS.keys())
+    candidates = []
+    for name, info in PROVINCES.items():
+        candidates.append({"name": name, "lat": info.get("lat"), "lon": info.get("lon"), "type": "province"})
+    for key in hot_wards:
+        ward = WARDS.get(key)
+        if not ward:
+            logger.warning(f"[prefetch] Không tìm thấy ward trong PREFETCH_HOT_WARDS: {key}")
+            continue
+        candidates.append({"name": key, "lat": ward.get("lat"), "lon": ward.get("lon"), "type": "ward"})
+
+    targets, seen = [], set()
+    for c in candidates:
+        if c["lat"] is None or c["lon"] is None:
+            continue
+        cell = grid_cell_key(c["lat"], c["lon"])
+        if cell in seen:
+            continue
+        seen.add(cell)
+        targets.append({**c, "cell": cell})
+    return targets
+
+
+def prefetch_chunk(points: List[Dict]) -> None:
+    """Job làm mới một lô điểm bằng một request nhiều tọa độ; lỗi chỉ ghi log."""
+    try:
+        payloads = fetch_forecast_batch([(p["lat"], p["lon"]) for p in points], force=True)
+        ok = sum(1 for p in payloads if p)
+        with _stats_lock:
+            stats = state.setdefault("prefetch", {})
+            stats["refreshed"] = stats.get("refreshed", 0) + ok
+            stats["failed"] = stats.get("failed", 0) + len(points) - ok
+        if ok < len(points):
+            logger.warning(f"[prefetch] {len(points) - ok}/{len(points)} điểm không làm mới được")
+    except Exception as e:
+        logger.warning(f"[prefetch] Lỗi khi làm mới lô {len(points)} điểm: {e}")
+
+
+def run_prefetch_cycle() -> int:
+    """
+    Chia các điểm thành lô FORECAST_BATCH_SIZE (một request/lô) và rải đều các lô
+    trong PREFETCH_SPREAD_S giây để không bắn hàng loạt request cùng lúc vào Open-Meteo.
+    """
+    scheduler = get_scheduler()
+    targets = prefetch_targets()
+    if not targets:
+        return 0
+
+    size = max(1, config.FORECAST_BATCH_SIZE)
+    chunks = [targets[i:i + size] for i in range(0, len(targets), size)]
+    now = datetime.now(timezone.utc)
+    step = max(0.0, float(config.PREFETCH_SPREAD_S)) / len(chunks)
+    with _stats_lock:
+        state["prefetch"] = {
+            "last_cycle": now.strftime("%Y-%m-%dT%H:%M:%S"),
+            "targets": len(targets),
+            "chunks": len(chunks),
+            "spread_s": config.PREFETCH_SPREAD_S,
+            "refreshed": 0,
+            "failed": 0,
+        }
+    for i, chunk in enumerate(chunks):
+        scheduler.add_job(
+            prefetch_chunk,
+            "date",
+            run_date=now + timedelta(seconds=i * step),
+            args=[chunk],
+            id=f"prefetch:chunk:{i}",
+            replace_existing=True,
+        )
+
+    logger.info(
+        f"[prefetch] Đã lên lịch làm mới {len(targets)} ô lưới ({len(chunks)} request) "
+        f"trong {config.PREFETCH_SPREAD_S}s"
+    )
+    return len(targets)
+
+
+def register_prefetch_jobs() -> None:
+    """Đăng ký chu kỳ prefetch theo giờ cập nhật model (cron) + một lượt ngay khi khởi động."""
+    if not config.PREFETCH_ENABLED:
+        logger.info("[prefetch] PREFETCH_ENABLED=false, bỏ qua")
+        return
+    scheduler = get_scheduler()
+    scheduler.add_job(
+        run_prefetch_cycle,
+        CronTrigger(hour=config.PREFETCH_CRON_HOUR, minute=config.PREFETCH_CRON_MINUTE, timezone=config.API_TZ),
+        id=PREFETCH_JOB_ID,
+        replace_existing=True,
+    )
+    scheduler.add_job(run_prefetch_cycle, id=f"{PREFETCH_JOB_ID}_startup", replace_existing=True)
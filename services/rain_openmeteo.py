@@ -1,64 +1,45 @@
 # services/rain_openmeteo.py
 import logging
-import requests
 from datetime import datetime
 from typing import List, Dict, Any
 from pytz import timezone
 
+from services.open_meteo.compact import as_list
+from services.open_meteo.projection import Projection, fetch_projected
+from services.open_meteo.timeaxis import hourly_axis, epoch_to_iso
+
 logger = logging.getLogger(__name__)
 
 ICT = timezone("Asia/Bangkok")
-BASE_URL = "https://api.open-meteo.com/v1/forecast"
 
-
-def _hour_key(iso_str: str) -> str:
-    """
-    Chuẩn hóa chuỗi thời gian ISO thành khóa theo giờ: 'YYYY-MM-DDTHH:00'.
-    - Dùng để so khớp bền vững giữa thời gian hệ thống (có offset) và thời gian API (có/không offset).
-    - Ví dụ: '2025-12-12T13:00+07:00' hoặc '2025-12-12T13:00' -> '2025-12-12T13:00'
-    """
-    try:
-        dt = datetime.fromisoformat(iso_str)
-        return dt.strftime("%Y-%m-%dT%H:00")
-    except Exception:
-        # Fallback: cắt thủ công theo vị trí giờ nếu định dạng lạ
-        # Hỗ trợ chuỗi dạng 'YYYY-MM-DDTHH:MM...' -> lấy đến phút
-        if "T" in iso_str and len(iso_str) >= 16:
-            return iso_str[:16]
-        return iso_str
+# Phần dữ liệu mỗi hàm cần (payload forecast đầy đủ đã cache cũng đáp ứng được)
+RAIN_HOURLY_PROJECTION = Projection(hourly=["precipitation"], days=2)
+RAIN_DAILY_PROJECTION = Projection(daily=["precipitation_sum"], days=10)
+RAIN_SUMMARY_PROJECTION = RAIN_HOURLY_PROJECTION.union(RAIN_DAILY_PROJECTION)
 
 
-def _closest_index_iso(times: List[str], target_iso: str) -> int:
+def _closest_index_iso(times: List[Any], target_iso: str, utc_offset_s: int = 0) -> int:
     """
     Tìm index có thời gian gần nhất với target_iso trong danh sách ISO-8601.
-    So sánh theo datetime.parse (đầy đủ offset nếu có). Nếu danh sách rỗng, trả về 0.
+    So sánh theo thời gian thực khi target và trục cùng có/không offset; nếu không,
+    so khớp theo khóa giờ. Nếu danh sách rỗng hoặc không khớp, trả về 0.
     """
     if not times:
         return 0
     try:
         target_dt = datetime.fromisoformat(target_iso)
     except Exception:
-        # Nếu target_iso parse lỗi, thử theo khóa giờ đầu tiên
         target_dt = None
 
-    # Nếu parse được, dùng khoảng cách thời gian thực
-    if target_dt is not None:
-        try:
-            return min(
-                range(len(times)),
-                key=lambda i: abs(datetime.fromisoformat(times[i]) - target_dt)
-            )
-        except Exception:
-            pass
+    axis = hourly_axis(times, utc_offset_s)
+    if target_dt is not None and (target_dt.tzinfo is not None) == axis.aware:
+        idx = axis.nearest(target_dt)
+        if idx >= 0:
+            return idx
 
-    # Fallback: so khớp theo khóa giờ
-    tkey = _hour_key(target_iso)
-    # Nếu có khóa giờ trùng khớp, ưu tiên index đầu tiên trùng
-    for i, ts in enumerate(times):
-        if _hour_key(ts) == tkey:
-            return i
-    # Nếu không trùng, trả về 0
-    return 0
+    # Fallback: so khớp theo khóa giờ, không có thì trả về 0
+    idx = axis.hour_index(target_dt)
+    return idx if idx >= 0 else 0
 
 
 def _build_now_iso_local_hour() -> str:
@@ -69,45 +50,74 @@ def _build_now_iso_local_hour() -> str:
     return datetime.now(ICT).replace(minute=0, second=0, microsecond=0).isoformat()
 
 
-def get_precipitation_current(lat: float, lon: float) -> float:
-    """
-    Lấy lượng mưa tại đúng giờ hiện tại (theo timezone=auto).
-    Nếu không có điểm đúng giờ, lấy điểm gần nhất theo thời gian.
-    """
-    try:
-        url = (
-            f"{BASE_URL}?latitude={lat}&longitude={lon}"
-            f"&hourly=precipitation&forecast_days=2&timezone=auto"
-        )
-        resp = requests.get(url, timeout=15)
-        resp.raise_for_status()
-        data: Dict[str, Any] = resp.json()
+def _current_from_series(times: List[Any], precip: List[Any], utc_offset_s: int = 0) -> float:
+    """Lượng mưa tại giờ hiện tại (ICT) từ chuỗi hourly đã tải sẵn."""
+    if not times or not precip:
+        return 0.0
 
-        times = data.get("hourly", {}).get("time", []) or []
-        precip = data.get("hourly", {}).get("precipitation", []) or []
+    # Ưu tiên khớp theo khóa giờ hiện tại ICT (bền vững với offset), tính trên trục đã parse sẵn
+    now_iso = _build_now_iso_local_hour()
+    idx = hourly_axis(times, utc_offset_s).hour_index(now_iso)
 
-        if not times or not precip:
-            return 0.0
+    # Nếu không khớp, dùng index gần nhất
+    if idx < 0:
+        idx = _closest_index_iso(times, now_iso, utc_offset_s)
 
-        # Khóa giờ hiện tại theo ICT
-        now_iso = _build_now_iso_local_hour()
-        now_key = _hour_key(now_iso)
+    if idx < 0 or idx >= len(precip) or precip[idx] is None:
+        return 0.0
+
+    return float(precip[idx])
+
+
+def _24h_from_series(times: List[Any], precip: List[Any], utc_offset_s: int = 0) -> dict:
+    """24 giá trị mưa theo giờ bắt đầu từ giờ hiện tại (ICT) từ chuỗi hourly đã tải sẵn."""
+    if not times or not precip:
+        hourly = [0.0] * 24
+        return {"hourly": hourly, "total_24h": float(sum(hourly))}
+
+    # Tìm vị trí bắt đầu theo khóa giờ hiện tại ICT
+    now_iso = _build_now_iso_local_hour()
+    start_idx = hourly_axis(times, utc_offset_s).hour_index(now_iso)
 
-        # Ưu tiên khớp theo khóa giờ (bền vững với offset)
-        idx = None
-        for i, ts in enumerate(times):
-            if _hour_key(ts) == now_key:
-                idx = i
-                break
+    if start_idx < 0:
+        start_idx = _closest_index_iso(times, now_iso, utc_offset_s)
 
-        # Nếu không khớp, dùng index gần nhất
-        if idx is None:
-            idx = _closest_index_iso(times, now_iso)
+    # Cắt 24 phần tử liên tiếp từ vị trí bắt đầu
+    hourly_slice = precip[start_idx:start_idx + 24]
 
-        if idx < 0 or idx >= len(precip):
-            return 0.0
+    # Đảm bảo đủ 24 phần tử
+    hourly = [float(x) if x is not None else 0.0 for x in hourly_slice]
+    if len(hourly) < 24:
+        hourly.extend([0.0] * (24 - len(hourly)))
+
+    total_24h = float(sum(hourly))
+    return {"hourly": hourly, "total_24h": total_24h}
+
+
+def _10d_from_series(times: List[Any], precip: List[Any], utc_offset_s: int = 0) -> List[dict]:
+    """Danh sách 10 ngày {"date", "precipitation"} từ chuỗi daily đã tải sẵn (ngày epoch đổi về YYYY-MM-DD)."""
+    forecast: List[dict] = []
+    for i in range(10):
+        if i < len(times) and i < len(precip):
+            forecast.append(
+                {"date": epoch_to_iso(times[i], utc_offset_s, "%Y-%m-%d"), "precipitation": float(precip[i]) if precip[i] is not None else 0.0}
+            )
+        else:
+            forecast.append({"date": None, "precipitation": 0.0})
+    return forecast
+
+
+def get_precipitation_current(lat: float, lon: float) -> float:
+    """
+    Lấy lượng mưa tại đúng giờ hiện tại (giờ Việt Nam).
+    Nếu không có điểm đúng giờ, lấy điểm gần nhất theo thời gian.
+    """
+    try:
+        data: Dict[str, Any] = fetch_projected(lat, lon, RAIN_HOURLY_PROJECTION) or {}
 
-        return float(precip[idx])
+        times = data.get("hourly", {}).get("time", []) or []
+        precip = as_list(data.get("hourly", {}).get("precipitation", []) or [])
+        return _current_from_series(times, precip, data.get("utc_offset_seconds") or 0)
     except Exception as e:
         logger.error(f"Open-Meteo current error: {e}")
         return 0.0
@@ -125,45 +135,11 @@ def get_precipitation_24h(lat: float, lon: float) -> dict:
       }
     """
     try:
-        url = (
-            f"{BASE_URL}?latitude={lat}&longitude={lon}"
-            f"&hourly=precipitation&forecast_days=2&timezone=auto"
-        )
-        resp = requests.get(url, timeout=15)
-        resp.raise_for_status()
-        data: Dict[str, Any] = resp.json()
+        data: Dict[str, Any] = fetch_projected(lat, lon, RAIN_HOURLY_PROJECTION) or {}
 
         times = data.get("hourly", {}).get("time", []) or []
-        precip = data.get("hourly", {}).get("precipitation", []) or []
-
-        if not times or not precip:
-            hourly = [0.0] * 24
-            return {"hourly": hourly, "total_24h": float(sum(hourly))}
-
-        # Khóa giờ hiện tại theo ICT
-        now_iso = _build_now_iso_local_hour()
-        now_key = _hour_key(now_iso)
-
-        # Tìm vị trí bắt đầu theo khóa giờ
-        start_idx = None
-        for i, ts in enumerate(times):
-            if _hour_key(ts) == now_key:
-                start_idx = i
-                break
-
-        if start_idx is None:
-            start_idx = _closest_index_iso(times, now_iso)
-
-        # Cắt 24 phần tử liên tiếp từ vị trí bắt đầu
-        hourly_slice = precip[start_idx:start_idx + 24]
-
-        # Đảm bảo đủ 24 phần tử
-        hourly = [float(x) for x in hourly_slice]
-        if len(hourly) < 24:
-            hourly.extend([0.0] * (24 - len(hourly)))
-
-        total_24h = float(sum(hourly))
-        return {"hourly": hourly, "total_24h": total_24h}
+        precip = as_list(data.get("hourly", {}).get("precipitation", []) or [])
+        return _24h_from_series(times, precip, data.get("utc_offset_seconds") or 0)
     except Exception as e:
         logger.error(f"Open-Meteo 24h error: {e}")
         hourly = [0.0] * 24
@@ -177,27 +153,11 @@ def get_precipitation_10d(lat: float, lon: float) -> List[dict]:
     Trả về: danh sách 10 phần tử dạng {"date": str|None, "precipitation": float}
     """
     try:
-        url = (
-            f"{BASE_URL}?latitude={lat}&longitude={lon}"
-            f"&daily=precipitation_sum&forecast_days=10&timezone=auto"
-        )
-        resp = requests.get(url, timeout=15)
-        resp.raise_for_status()
-        data: Dict[str, Any] = resp.json()
+        data: Dict[str, Any] = fetch_projected(lat, lon, RAIN_DAILY_PROJECTION) or {}
 
         times = data.get("daily", {}).get("time", []) or []
-        precip = data.get("daily", {}).get("precipitation_sum", []) or []
-
-        forecast: List[dict] = []
-        for i in range(10):
-            if i < len(times) and i < len(precip):
-                forecast.append(
-                    {"date": times[i], "precipitation": float(precip[i])}
-                )
-            else:
-                forecast.append({"date": None, "precipitation": 0.0})
-
-        return forecast
+        precip = as_list(data.get("daily", {}).get("precipitation_sum", []) or [])
+        return _10d_from_series(times, precip, data.get("utc_offset_seconds") or 0)
     except Exception as e:
         logger.error(f"Open-Meteo 10d error: {e}")
         return [{"date": None, "precipitation": 0.0} for _ in range(10)]
@@ -213,23 +173,49 @@ def get_precipitation_summary(lat: float, lon: float) -> dict:
     - error: None nếu thành công, hoặc chuỗi mô tả lỗi
     """
     try:
-        current = get_precipitation_current(lat, lon)
-        summary_24h = get_precipitation_24h(lat, lon)
-        next_10days = get_precipitation_10d(lat, lon)
+        # Một request (hourly precipitation + daily precipitation_sum) thay cho ba
+        data = fetch_projected(lat, lon, RAIN_SUMMARY_PROJECTION)
+        if not data:
+            raise ValueError("Open-Meteo không trả dữ liệu mưa")
+        return summarize_precipitation(data)
+    except Exception as e:
+        logger.error(f"Open-Meteo summary error: {e}")
+        return {
+            "current": 0.0,
+            "24h": 0.0,
+            "hourly": [0.0] * 24,
+            "10d": [{"date": None, "precipitation": 0.0} for _ in range(10)],
+            "error": str(e),
+        }
+
+
+def summarize_precipitation(data: Dict[str, Any]) -> dict:
+    """
+    Tổng hợp lượng mưa (cùng cấu trúc với get_precipitation_summary) từ payload
+    Open-Meteo đã tải sẵn (hourly.precipitation + daily.precipitation_sum),
+    không phát sinh thêm request nào.
+    """
+    try:
+        hourly = (data or {}).get("hourly", {}) or {}
+        daily = (data or {}).get("daily", {}) or {}
+        h_times = hourly.get("time", []) or []
+        h_precip = as_list(hourly.get("precipitation", []) or [])
+        offset = (data or {}).get("utc_offset_seconds") or 0
+        summary_24h = _24h_from_series(h_times, h_precip, offset)
 
         return {
-            "current": current,
+            "current": _current_from_series(h_times, h_precip, offset),
             "24h": summary_24h["total_24h"],
             "hourly": summary_24h["hourly"],
-            "10d": next_10days,
+            "10d": _10d_from_series(daily.get("time", []) or [], as_list(daily.get("precipitation_sum", []) or []), offset),
             "error": None,
         }
     except Exception as e:
-        logger.error(f"Open-Meteo summary error: {e}")
+        logger.error(f"Open-Meteo summary (payload) error: {e}")
         return {
             "current": 0.0,
             "24h": 0.0,
             "hourly": [0.0] * 24,
             "10d": [{"date": None, "precipitation": 0.0} for _ in range(10)],
             "error": str(e),
-        }
\ No newline at end of file
+        }
@@ -0,0 +1,41 @@
+# services/scheduler.py
+import logging
+from typing import Optional
+
+from apscheduler.schedulers.background import BackgroundScheduler
+
+from services import config
+
+logger = logging.getLogger("WeatherService")
+
+# Scheduler nền dùng chung cho toàn tiến trình (prefetch, các tác vụ định kỳ khác)
+_scheduler: Optional[BackgroundScheduler] = None
+
+
+def get_scheduler() -> BackgroundScheduler:
+    """Trả về scheduler dùng chung, tạo mới nếu chưa có (chưa start)."""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = BackgroundScheduler(
+            timezone=config.API_TZ,
+            job_defaults={"coalesce": True, "max_instances": 1, "misfire_grace_time": 300},
+        )
+    return _scheduler
+
+
+def start_scheduler() -> BackgroundScheduler:
+    """Khởi động scheduler (gọi từ startup hook của app)."""
+    scheduler = get_scheduler()
+    if not scheduler.running:
+        scheduler.start()
+        logger.info("⏱️ Background scheduler started")
+    return scheduler
+
+
+def shutdown_scheduler() -> None:
+    """Dừng scheduler (gọi từ shutdown hook của app)."""
+    global _scheduler
+    if _scheduler is not None and _scheduler.running:
+        _scheduler.shutdown(wait=False)
+        logger.info("⏱️ Background scheduler stopped")
+    _scheduler = None
@@ -1,8 +1,11 @@
 # services/storm_alert.py
 import pandas as pd
-import requests
-from bs4 import BeautifulSoup
-import feedparser
+
+from services import config
+from services.alert_rules import DAILY, AlertRule, RuleSet
+from services.nchmf import parse_html, parse_rss
+from services.http_client import get_session
+from services.utils import as_dataframe
 
 # Ngưỡng dấu hiệu áp thấp/bão
 LOW_PRESSURE_FORMATION = 1000   # hPa (áp thấp hình thành)
@@ -11,16 +14,17 @@ STORM_WIND_ALERT = 17           # m/s ~ cấp gió bão
 STORM_WIND_EXTREME = 25         # m/s ~ gió bão rất mạnh
 STORM_RAIN_ALERT = 100          # mm/ngày (mưa cực lớn)
 
-# URL mặc định của NCHMF (có thể thay đổi theo trang RSS/HTML thực tế)
-NCHMF_URL = "https://www.nchmf.gov.vn/"
-NCHMF_RSS = "https://www.nchmf.gov.vn/rss/bao-canh-bao.xml"
+# Mưa cực lớn theo ngày (mặt nạ trên cả cột rain_mm)
+STORM_RULES = RuleSet([
+    AlertRule("STORM_RAIN", DAILY, "rain_mm", ">=", STORM_RAIN_ALERT,
+              "🌧️ {time}: mưa cực lớn {value:.1f} mm", ts_format="%d/%m"),
+])
 
-def _fmt_date(ts_val) -> str:
-    """Định dạng ngày dd/mm từ ts hoặc ts_local."""
-    try:
-        return pd.to_datetime(ts_val).strftime("%d/%m")
-    except Exception:
-        return str(ts_val)
+# URL NCHMF (cấu hình qua NCHMF_URL / NCHMF_STORM_RSS)
+NCHMF_URL = config.NCHMF_URL
+NCHMF_RSS = config.NCHMF_STORM_RSS
+# Từ khóa lọc tin bão/áp thấp (tiêu đề đã lowercase)
+STORM_KEYWORDS = ("cảnh báo", "bão", "áp thấp")
 
 def classify_wind(wind: float) -> str:
     """Phân loại cấp gió và giật theo thang đơn giản."""
@@ -36,13 +40,11 @@ def fetch_nchmf_alerts_html(url=NCHMF_URL):
     """Lấy cảnh báo từ HTML trang NCHMF."""
     alerts = []
     try:
-        resp = requests.get(url, timeout=10)
+        resp = get_session().get(url, timeout=config.NCHMF_TIMEOUT)
         resp.raise_for_status()
-        soup = BeautifulSoup(resp.text, "html.parser")
-        for item in soup.select("div.news-item, li"):
-            title = item.get_text(strip=True)
-            if any(k in title.lower() for k in ["cảnh báo", "bão", "áp thấp"]):
-                alerts.append(title)
+        for item in parse_html(resp.text, url):
+            if any(k in item.title.lower() for k in STORM_KEYWORDS):
+                alerts.append(item.title)
     except Exception as e:
         alerts.append(f"Lỗi khi lấy dữ liệu NCHMF HTML: {e}")
     return alerts
@@ -51,11 +53,11 @@ def fetch_nchmf_alerts_rss(rss_url=NCHMF_RSS):
     """Lấy cảnh báo từ RSS feed của NCHMF."""
     alerts = []
     try:
-        feed = feedparser.parse(rss_url)
-        for entry in feed.entries:
-            title = entry.title
-            if any(k in title.lower() for k in ["cảnh báo", "bão", "áp thấp"]):
-                alerts.append(title)
+        resp = get_session().get(rss_url, timeout=config.NCHMF_TIMEOUT)
+        resp.raise_for_status()
+        for item in parse_rss(resp.content, rss_url):
+            if any(k in item.title.lower() for k in STORM_KEYWORDS):
+                alerts.append(item.title)
     except Exception as e:
         alerts.append(f"Lỗi khi lấy RSS NCHMF: {e}")
     return alerts
@@ -92,12 +94,10 @@ def check_storm_alert(current: dict, daily_df: pd.DataFrame, official_alerts=Non
 
     # 4) Mưa theo ngày
     heavy_rain_detected = False
+    daily_df = as_dataframe(daily_df)
     if isinstance(daily_df, pd.DataFrame) and not daily_df.empty and "rain_mm" in daily_df.columns:
-        heavy_rain_days = daily_df[daily_df["rain_mm"] >= STORM_RAIN_ALERT]
-        for _, row in heavy_rain_days.iterrows():
-            date_txt = _fmt_date(row.get("ts_local") or row.get("ts"))
-            rain_val = row.get("rain_mm", 0.0)
-            signals.append(f"🌧️ {date_txt}: mưa cực lớn {rain_val:.1f} mm")
+        for record in STORM_RULES.evaluate_table(DAILY, daily_df):
+            signals.append(record.message)
             heavy_rain_detected = True
 
     # 5) Phân loại khẳng định
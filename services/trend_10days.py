@@ -3,9 +3,9 @@ import pandas as pd
 from pytz import timezone
 
 from services.utils import (
-    safe_float, choose_weather_icon, _fmt_mm, _fmt_hum, fmt_unit,
-    HEAT_ALERT, COLD_ALERT, WIND_ALERT, RAIN_ALERT, UV_ALERT
+    safe_float, choose_weather_icon, _fmt_mm, _fmt_hum, fmt_unit, to_datetime_series, as_dataframe,
 )
+from services.alert_rules import DAILY, TREND_STATS
 from services.meteorology import compute_all_metrics
 
 # Múi giờ ICT
@@ -17,14 +17,14 @@ def _ensure_ts_local(df: pd.DataFrame) -> pd.DataFrame:
     if "ts_local" in df.columns:
         s = pd.to_datetime(df["ts_local"], errors="coerce")
         if getattr(s.dt, "tz", None) is None:
-            s = s.dt.tz_localize("UTC")
+            s = s.dt.tz_localize(ICT)
         df = df.copy()
         df["ts_local"] = s.dt.tz_convert(ICT)
         return df
     elif "ts" in df.columns:
-        s = pd.to_datetime(df["ts"], errors="coerce")
+        s = to_datetime_series(df["ts"])
         if getattr(s.dt, "tz", None) is None:
-            s = s.dt.tz_localize("UTC")
+            s = s.dt.tz_localize(ICT)
         df = df.copy()
         df["ts_local"] = s.dt.tz_convert(ICT)
         return df
@@ -127,6 +127,7 @@ def generate_trend_10days(
 ):
     """Sinh bản tin xu hướng 10 ngày từ hourly_df, đồng bộ với rain_service và meteorology."""
     bulletin, dfd_10 = [], pd.DataFrame()
+    hourly_df = as_dataframe(hourly_df)
     if hourly_df is None or hourly_df.empty: 
         return [], dfd_10, {}
 
@@ -154,6 +155,8 @@ def generate_trend_10days(
         "realfeel_cold_days": 0, "heat_index_high_days": 0,
     }
 
+    stat_cols = {name: [] for name in ("rain_total", "temp_max", "temp_min", "wind_avg", "uv", "realfeel", "heat_index")}
+
     dfd_10 = daily_df.copy()
     for i, row in enumerate(dfd_10.itertuples()):
         date_txt = row.ts_local.strftime("%d/%m")
@@ -186,22 +189,14 @@ def generate_trend_10days(
             f"☁️ {cloud_txt} | 📈 {fmt_unit(mslp_d,'hPa')} | 🔆 {fmt_unit(solar_d,'W/m²')} | 🌞 UV: {fmt_unit(uv_d,'')}"
         )
 
-        # Cộng dồn thống kê
-        if isinstance(rain_total, (int, float)) and pd.notnull(rain_total):
-            if rain_total > 0: stats["rain_days"] += 1
-            if rain_total >= RAIN_ALERT: stats["heavy_rain_days"] += 1
-        if isinstance(row.temp_max, (int, float)) and pd.notnull(row.temp_max) and row.temp_max >= HEAT_ALERT:
-            stats["sunny_days"] += 1
-        if isinstance(row.temp_min, (int, float)) and pd.notnull(row.temp_min) and row.temp_min <= COLD_ALERT:
-            stats["cold_days"] += 1
-        if isinstance(wind_avg, (int, float)) and pd.notnull(wind_avg) and wind_avg >= WIND_ALERT:
-            stats["windy_days"] += 1
-        if isinstance(uv_d, (int, float)) and pd.notnull(uv_d) and uv_d >= UV_ALERT:
-            stats["uv_high_days"] += 1
-        if metrics["realfeel"] is not None and metrics["realfeel"] <= 10.0:
-            stats["realfeel_cold_days"] += 1
-        if metrics["heat_index"] is not None and metrics["heat_index"] >= 40.0:
-            stats["heat_index_high_days"] += 1
+        # Giá trị theo ngày cho thống kê (đếm bằng TREND_RULES sau vòng lặp)
+        for name, val in (("rain_total", rain_total), ("temp_max", row.temp_max), ("temp_min", row.temp_min),
+                          ("wind_avg", wind_avg), ("uv", uv_d), ("realfeel", metrics["realfeel"]),
+                          ("heat_index", metrics["heat_index"])):
+            stat_cols[name].append(val if isinstance(val, (int, float)) else None)
+
+    for code, n in TREND_STATS.count(DAILY, stat_cols).items():
+        stats[code] = int(n)
 
     # 👉 Thống kê tổng hợp
     bulletin.append("")
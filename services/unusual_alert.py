@@ -1,9 +1,13 @@
 # services/unusual_alert.py
+import re
+
+import numpy as np
 import pandas as pd
-import requests
-import feedparser
-from bs4 import BeautifulSoup
-from services.utils import TEMP_EXTREME, WIND_EXTREME, RAIN_EXTREME, PRESSURE_LOW
+from services import config
+from services.alert_rules import DAILY, HOURLY, EXTREME_ALERTS
+from services.nchmf import parse_html, parse_rss
+from services.http_client import get_session
+from services.utils import to_timestamp, as_dataframe
 
 # Danh sách hiện tượng bất thường cần cảnh báo
 UNUSUAL_EVENTS = [
@@ -12,21 +16,27 @@ UNUSUAL_EVENTS = [
     "bầu trời xuất hiện vật lạ","ánh sáng bất thường","mưa thiên thạch",
     "sương muối","hạn hán cực đoan","cháy rừng",
 ]
+# Một regex cho mọi hiện tượng: lọc nhanh chuỗi không chứa hiện tượng nào
+_EVENTS_RE = re.compile("|".join(re.escape(ev) for ev in UNUSUAL_EVENTS))
+
+def _match_events(text: str) -> list:
+    """Các hiện tượng xuất hiện trong text (đã lowercase), theo thứ tự UNUSUAL_EVENTS."""
+    if not _EVENTS_RE.search(text):
+        return []
+    return [ev for ev in UNUSUAL_EVENTS if ev in text]
 
 # Nguồn ngoài (ví dụ NCHMF, USGS, NASA)
-NCHMF_RSS = "https://www.nchmf.gov.vn/rss/canh-bao-bat-thuong.xml"
-NCHMF_URL = "https://www.nchmf.gov.vn/"
+NCHMF_RSS = config.NCHMF_UNUSUAL_RSS
+NCHMF_URL = config.NCHMF_URL
 
 def fetch_unusual_alerts_html(url=NCHMF_URL):
     alerts = []
     try:
-        resp = requests.get(url, timeout=10)
+        resp = get_session().get(url, timeout=config.NCHMF_TIMEOUT)
         resp.raise_for_status()
-        soup = BeautifulSoup(resp.text, "html.parser")
-        for item in soup.select("div.news-item, li"):
-            title = item.get_text(strip=True)
-            if any(ev in title.lower() for ev in UNUSUAL_EVENTS):
-                alerts.append(title)
+        for item in parse_html(resp.text, url):
+            if _EVENTS_RE.search(item.title.lower()):
+                alerts.append(item.title)
     except Exception as e:
         alerts.append(f"Lỗi khi lấy dữ liệu HTML: {e}")
     return alerts
@@ -34,15 +44,48 @@ def fetch_unusual_alerts_html(url=NCHMF_URL):
 def fetch_unusual_alerts_rss(rss_url=NCHMF_RSS):
     alerts = []
     try:
-        feed = feedparser.parse(rss_url)
-        for entry in feed.entries:
-            title = entry.title
-            if any(ev in title.lower() for ev in UNUSUAL_EVENTS):
-                alerts.append(title)
+        resp = get_session().get(rss_url, timeout=config.NCHMF_TIMEOUT)
+        resp.raise_for_status()
+        for item in parse_rss(resp.content, rss_url):
+            if _EVENTS_RE.search(item.title.lower()):
+                alerts.append(item.title)
     except Exception as e:
         alerts.append(f"Lỗi khi lấy RSS: {e}")
     return alerts
 
+def _row_alerts(df: pd.DataFrame, scope: str, label: str) -> list:
+    """
+    Cảnh báo theo từng dòng của hourly/daily: ngưỡng số liệu theo EXTREME_ALERTS (mặt nạ trên
+    cả cột), hiện tượng trong weather_desc dò một lần cho mỗi mô tả khác nhau.
+    Mỗi dòng: hiện tượng trước, rồi các ngưỡng theo thứ tự luật.
+    """
+    by_row = {}
+    for record in EXTREME_ALERTS.evaluate_table(scope, df, label=label):
+        by_row.setdefault(record.index, []).append(record.message)
+
+    # Hiện tượng theo mô tả: mã hóa cột rồi dò trên các giá trị khác nhau
+    events = {}
+    if "weather_desc" in df.columns:
+        codes, uniques = pd.factorize(df["weather_desc"], use_na_sentinel=False)
+        matched = [_match_events(str(v).lower()) for v in uniques]
+        if any(matched):
+            has_event = np.array([bool(m) for m in matched], dtype=bool)
+            events = {i: matched[codes[i]] for i in np.flatnonzero(has_event[codes]).tolist()}
+    if not events:
+        return [msg for i in sorted(by_row) for msg in by_row[i]]
+
+    ts_local = df["ts_local"] if "ts_local" in df.columns else None
+    ts_raw = df["ts"] if "ts" in df.columns else None
+    alerts = []
+    for i in sorted(by_row.keys() | events.keys()):
+        if i in events:
+            ts_val = (ts_local.iloc[i] if ts_local is not None else None) or (ts_raw.iloc[i] if ts_raw is not None else None)
+            ts = to_timestamp(ts_val)
+            ts_str = ts.strftime("%d/%m %H:%M") if ts is not pd.NaT else str(ts_val)
+            alerts.extend(f"⚠️ {label} {ts_str}: dự báo có {event}" for event in events[i])
+        alerts.extend(by_row.get(i, ()))
+    return alerts
+
 def check_unusual_alert(current: dict, hourly_df: pd.DataFrame, daily_df: pd.DataFrame, official_alerts=None) -> str:
     """
     Khẳng định hiện tượng bất thường dựa trên:
@@ -54,45 +97,20 @@ def check_unusual_alert(current: dict, hourly_df: pd.DataFrame, daily_df: pd.Dat
         return "⚠️ CẢNH BÁO CHÍNH THỨC:\n- " + "\n- ".join(official_alerts)
 
     alerts = []
+    hourly_df, daily_df = as_dataframe(hourly_df), as_dataframe(daily_df)
 
-    # 2) Kiểm tra số liệu hiện tại
-    temp = current.get("temp_c")
-    wind = current.get("wind_speed_ms")
-    rain = current.get("rain_mm")
-    pressure = current.get("mslp_hpa")
-
-    if isinstance(temp, (int, float)) and temp >= TEMP_EXTREME:
-        alerts.append(f"🌡️ Nhiệt độ bất thường {temp:.1f}°C ≥ {TEMP_EXTREME}°C")
-    if isinstance(wind, (int, float)) and wind >= WIND_EXTREME:
-        alerts.append(f"💨 Gió cực mạnh {wind:.1f} m/s ≥ {WIND_EXTREME} m/s")
-    if isinstance(rain, (int, float)) and rain >= RAIN_EXTREME:
-        alerts.append(f"🌧️ Mưa cực lớn {rain:.1f} mm ≥ {RAIN_EXTREME} mm/ngày")
-    if isinstance(pressure, (int, float)) and pressure <= PRESSURE_LOW:
-        alerts.append(f"📉 Áp suất bất thường {pressure:.0f} hPa ≤ {PRESSURE_LOW} hPa")
+    # 2) Kiểm tra số liệu hiện tại (luật EXTREME_CURRENT_RULES)
+    alerts.extend(r.message for r in EXTREME_ALERTS.evaluate_current(current))
 
     # 3) Kiểm tra mô tả thời tiết hiện tại
     desc = str(current.get("weather_desc", "")).lower()
-    for event in UNUSUAL_EVENTS:
-        if event in desc:
-            alerts.append(f"⚠️ Hiện tượng bất thường phát hiện: {event.capitalize()}")
+    for event in _match_events(desc):
+        alerts.append(f"⚠️ Hiện tượng bất thường phát hiện: {event.capitalize()}")
 
-    # 4) Kiểm tra dữ liệu theo giờ/ngày (tương tự storm_alert)
-    for df, label in [(hourly_df, "theo giờ"), (daily_df, "theo ngày")]:
+    # 4) Kiểm tra dữ liệu theo giờ/ngày (tương tự storm_alert), theo cột thay vì từng dòng
+    for df, scope, label in [(hourly_df, HOURLY, "theo giờ"), (daily_df, DAILY, "theo ngày")]:
         if isinstance(df, pd.DataFrame) and not df.empty:
-            for _, row in df.iterrows():
-                desc_row = str(row.get("weather_desc", "")).lower()
-                ts_val = row.get("ts_local") or row.get("ts")
-                ts = pd.to_datetime(ts_val, errors="coerce")
-                ts_str = ts.strftime("%d/%m %H:%M") if ts is not pd.NaT else str(ts_val)
-                for event in UNUSUAL_EVENTS:
-                    if event in desc_row:
-                        alerts.append(f"⚠️ {label} {ts_str}: dự báo có {event}")
-                if "temp_c" in row and row["temp_c"] >= TEMP_EXTREME:
-                    alerts.append(f"🌡️ {label} {ts_str}: nhiệt độ bất thường {row['temp_c']:.1f}°C")
-                if "wind_speed_ms" in row and row["wind_speed_ms"] >= WIND_EXTREME:
-                    alerts.append(f"💨 {label} {ts_str}: gió cực mạnh {row['wind_speed_ms']:.1f} m/s")
-                if "rain_mm" in row and row["rain_mm"] >= RAIN_EXTREME:
-                    alerts.append(f"🌧️ {label} {ts_str}: mưa cực lớn {row['rain_mm']:.1f} mm")
+            alerts.extend(_row_alerts(df, scope, label))
 
     if not alerts:
         return "✅ Không phát hiện hiện tượng bất thường."
@@ -1,43 +1,18 @@
 # services/utils.py
 import logging
 import pandas as pd
-from pytz import timezone
 
-logger = logging.getLogger("WeatherUtils")
+from services.alert_thresholds import (
+    HEAT_ALERT, RAIN_ALERT, WIND_ALERT, HUMIDITY_HIGH, HUMIDITY_LOW, COLD_ALERT,
+    MSLP_HIGH, MSLP_LOW, SOLAR_ALERT, UV_ALERT,
+)
+from services.alert_rules import CURRENT_ALERTS
+from services.open_meteo.table import (
+    ICT, TIME_FIELDS, ForecastTable, as_frame, local_time_column, to_datetime_series, to_timestamp,
+)
+from services.open_meteo.timeaxis import is_epoch
 
-# ===== Ngưỡng cảnh báo (chuẩn Việt Nam) =====
-HEAT_ALERT = 32.0         # Nắng nóng (≥32°C đã oi bức)
-RAIN_ALERT = 10.0         # Mưa lớn (≥10 mm/ngày dễ gây ngập úng)
-WIND_ALERT = 8.0          # Gió mạnh (≥8 m/s bắt đầu gây nguy hiểm ngoài trời)
-HUMIDITY_HIGH = 80.0      # Độ ẩm cao (≥80% gây oi bức, dễ cảm lạnh)
-HUMIDITY_LOW = 40.0       # Độ ẩm thấp (≤40% gây khô da)
-COLD_ALERT = 20.0         # Trời lạnh (≤20°C đã lạnh với người VN)
-MSLP_HIGH = 1020.0        # Áp suất cao
-MSLP_LOW = 1008.0         # Áp suất thấp
-SOLAR_ALERT = 600.0       # Bức xạ mặt trời mạnh (≥600 W/m²)
-UV_ALERT = 4.0            # UV cao (≥4 đã cần cảnh báo ở VN)
-
-# ===== Ngưỡng cảnh báo bất thường =====
-TEMP_EXTREME = 40.0       # °C, nhiệt độ cực cao
-WIND_EXTREME = 25.0       # m/s, gió cực mạnh
-RAIN_EXTREME = 100.0      # mm/ngày, mưa cực lớn
-PRESSURE_LOW = 990.0      # hPa, áp suất thấp bất thường
-
-ALERT_DESCRIPTIONS = {
-    "HEAT_ALERT": "🔥 Nắng nóng oi bức nguy hiểm",
-    "RAIN_ALERT": "🌧️ Mưa lớn dễ gây ngập úng",
-    "WIND_ALERT": "💨 Gió mạnh, nguy hiểm ngoài trời",
-    "HUMIDITY_HIGH": "💧 Độ ẩm cao bất thường, dễ gây cảm lạnh",
-    "HUMIDITY_LOW": "🏜️ Độ ẩm thấp bất thường, dễ gây khô da",
-    "COLD_ALERT": "❄️ Trời lạnh bất thường",
-    "MSLP_HIGH": "📈 Áp suất cao bất thường",
-    "MSLP_LOW": "📉 Áp suất thấp bất thường",
-    "SOLAR_ALERT": "🔆 Bức xạ mặt trời mạnh",
-    "UV_ALERT": "☀️ Chỉ số UV cao",
-}
-
-# Múi giờ ICT
-ICT = timezone("Asia/Bangkok")
+logger = logging.getLogger("WeatherUtils")
 
 # ===== Hàm tiện ích =====
 def safe_float(val, default=0.0):
@@ -47,30 +22,64 @@ def safe_float(val, default=0.0):
     except (TypeError, ValueError):
         return default
 
+def _iso_time(val):
+    ts = to_timestamp(val)
+    return ts.strftime("%Y-%m-%dT%H:%M") if not pd.isna(ts) else None
+
+def _iso_time_fields(record: dict) -> dict:
+    """Đổi các trường thời gian epoch của một bản ghi sang chuỗi ISO giờ địa phương."""
+    if not record:
+        return record
+    out = dict(record)
+    for key in TIME_FIELDS:
+        if is_epoch(out.get(key)):
+            out[key] = _iso_time(out[key])
+    return out
+
 def _safe_df_records(df: pd.DataFrame) -> list[dict]:
-    """Chuyển DataFrame thành list[dict] an toàn."""
+    """Chuyển DataFrame/ForecastTable thành list[dict] an toàn (cột thời gian epoch được đổi sang ISO giờ địa phương)."""
     if df is None or df.empty:
         return []
     try:
+        if isinstance(df, ForecastTable):
+            return df.to_records()
+        epoch_cols = [c for c in TIME_FIELDS if c in df.columns and pd.api.types.is_numeric_dtype(df[c])]
+        if epoch_cols:
+            df = df.copy()
+            for c in epoch_cols:
+                s = to_datetime_series(df[c]).dt.tz_convert(ICT)
+                df[c] = s.dt.strftime("%Y-%m-%dT%H:%M").astype(object).where(s.notna(), None)
         return df.to_dict(orient="records")
     except Exception as e:
         logger.warning(f"Lỗi khi chuyển DataFrame sang records: {e}")
         return []
 
+def as_dataframe(data) -> pd.DataFrame:
+    """DataFrame hoặc ForecastTable → DataFrame; cột datetime của bảng được gắn múi giờ ICT.
+    Các module bản tin gọi ở đầu hàm để nhận được cả hai kiểu."""
+    return as_frame(data, tz=ICT)
+
 def _ensure_ts_local(df: pd.DataFrame) -> pd.DataFrame:
-    """Chuẩn hóa DataFrame để có cột ts_local dạng timezone-aware ICT."""
+    """Chuẩn hóa DataFrame để có cột ts_local dạng timezone-aware ICT.
+    Với ForecastTable: thêm cột ts_local datetime64 (mốc UTC), gắn ICT khi to_pandas(tz=ICT)."""
     if df is None or df.empty:
         return df
+    if isinstance(df, ForecastTable):
+        if "ts_local" in df:
+            return df
+        ts_local = local_time_column(df)
+        return df.with_column("ts_local", ts_local) if ts_local is not None else df
 
     if "ts_local" in df.columns:
         s = pd.to_datetime(df["ts_local"], errors="coerce")
     elif "ts" in df.columns:
-        s = pd.to_datetime(df["ts"], errors="coerce")
+        s = to_datetime_series(df["ts"])
     else:
         return df
 
     if getattr(s.dt, "tz", None) is None:
-        s = s.dt.tz_localize("UTC")
+        # Chuỗi ISO không offset của Open-Meteo là giờ địa phương (timezone=Asia/Ho_Chi_Minh)
+        s = s.dt.tz_localize(ICT)
     df = df.copy()
     df["ts_local"] = s.dt.tz_convert(ICT)
     return df
@@ -201,49 +210,6 @@ def generate_comment(
 
 # ===== Sinh cảnh báo =====
 def detect_alerts(current: dict) -> list[str]:
-    """Sinh danh sách cảnh báo dựa trên dữ liệu hiện tại (ngưỡng chế độ Việt Nam)."""
-    alerts = []
-
-    temp = safe_float(current.get("temp_c"), default=None)
-    wind = safe_float(current.get("wind_speed_ms"), default=None)
-    rain = safe_float(current.get("rain_24h"), default=None)
-    uv = safe_float(current.get("uv_index"), default=None)
-    solar = safe_float(current.get("solar_wm2"), default=None)
-    mslp = safe_float(current.get("mslp"), default=None)
-    hum = safe_float(current.get("humidity_pct"), default=None)
-
-    # Nhiệt độ
-    if temp is not None and temp >= HEAT_ALERT:
-        alerts.append(f"{ALERT_DESCRIPTIONS['HEAT_ALERT']} ({temp:.1f}°C)")
-    if temp is not None and temp <= COLD_ALERT:
-        alerts.append(f"{ALERT_DESCRIPTIONS['COLD_ALERT']} ({temp:.1f}°C)")
-
-    # Gió
-    if wind is not None and wind >= WIND_ALERT:
-        alerts.append(f"{ALERT_DESCRIPTIONS['WIND_ALERT']} ({wind:.1f} m/s)")
-
-    # Mưa
-    if rain is not None and rain >= RAIN_ALERT:
-        alerts.append(f"{ALERT_DESCRIPTIONS['RAIN_ALERT']} ({rain:.1f} mm)")
-
-    # UV
-    if uv is not None and uv >= UV_ALERT:
-        alerts.append(f"{ALERT_DESCRIPTIONS['UV_ALERT']} ({uv:.1f})")
-
-    # Bức xạ mặt trời
-    if solar is not None and solar >= SOLAR_ALERT:
-        alerts.append(f"{ALERT_DESCRIPTIONS['SOLAR_ALERT']} ({solar:.1f} W/m²)")
-
-    # Áp suất
-    if mslp is not None and mslp < MSLP_LOW:
-        alerts.append(f"{ALERT_DESCRIPTIONS['MSLP_LOW']} ({mslp:.1f} hPa)")
-    if mslp is not None and mslp > MSLP_HIGH:
-        alerts.append(f"{ALERT_DESCRIPTIONS['MSLP_HIGH']} ({mslp:.1f} hPa)")
-
-    # Độ ẩm
-    if hum is not None and hum >= HUMIDITY_HIGH:
-        alerts.append(f"{ALERT_DESCRIPTIONS['HUMIDITY_HIGH']} ({hum:.0f}%)")
-    if hum is not None and hum <= HUMIDITY_LOW:
-        alerts.append(f"{ALERT_DESCRIPTIONS['HUMIDITY_LOW']} ({hum:.0f}%)")
-
-    return alerts
\ No newline at end of file
+    """Sinh danh sách cảnh báo dựa trên dữ liệu hiện tại (ngưỡng chế độ Việt Nam).
+    Luật khai báo trong services.alert_rules.CURRENT_RULES."""
+    return [r.message for r in CURRENT_ALERTS.evaluate_current(current)]
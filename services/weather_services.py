@@ -1,10 +1,15 @@
 # services/weather_services.py
 import json
-import requests
 import time
 from pathlib import Path
 from requests.exceptions import Timeout, RequestException
+from services import config
 from services.error_handler import handle_service_error
+from services.http_client import get_session
+from services.open_meteo.cache import forecast_cache, forecast_cache_key
+from services.open_meteo.compact import expand_payload
+from services.open_meteo.grid import snap_to_grid
+from services.open_meteo.utils import _forecast_params
 
 
 class RegionIndex:
@@ -50,28 +55,29 @@ class WeatherService:
                        backoff_factor: int = 2) -> dict:
         """
         Gọi API Open-Meteo với retry khi timeout + backoff.
+        Dùng chung cache in-process với open_meteo.fetch_forecast (cùng tập biến).
         """
+        grid_lat, grid_lon = snap_to_grid(lat, lon)
+        cache_key = forecast_cache_key(grid_lat, grid_lon, 10)
+        cached = forecast_cache.get(cache_key)
+        if cached is not None:
+            return {
+                "status": "ok",
+                "level": "info",
+                "data": expand_payload(cached),
+                "message": "Dữ liệu lấy từ cache"
+            }
+
+        # Cùng tham số với build_api_url (kể cả timeformat) để payload khớp khóa cache dùng chung
         params = {
-            "latitude": lat,
-            "longitude": lon,
-            "hourly": (
-                "temperature_2m,apparent_temperature,dewpoint_2m,precipitation,rain,"
-                "precipitation_probability,relative_humidity_2m,windspeed_10m,windgusts_10m,"
-                "winddirection_10m,cloudcover,cloudcover_low,cloudcover_mid,cloudcover_high,"
-                "pressure_msl,shortwave_radiation,uv_index"
-            ),
-            "daily": (
-                "temperature_2m_min,temperature_2m_max,precipitation_sum,precipitation_hours,"
-                "windspeed_10m_max,windgusts_10m_max,sunrise,sunset,uv_index_max"
-            ),
-            "current_weather": "true",
-            "timezone": "Asia/Ho_Chi_Minh",
-            "forecast_days": "10"
+            "latitude": grid_lat,
+            "longitude": grid_lon,
+            **_forecast_params(10),
         }
 
         for attempt in range(1, max_retries + 1):
             try:
-                resp = requests.get(WeatherService.BASE_URL, params=params, timeout=timeout)
+                resp = get_session().get(WeatherService.BASE_URL, params=params, timeout=timeout)
                 resp.raise_for_status()
                 try:
                     data = resp.json()
@@ -83,6 +89,9 @@ class WeatherService:
                         "message": "API trả về dữ liệu không hợp lệ (không phải JSON)",
                         "hint": "Kiểm tra dịch vụ Open-Meteo"
                     }
+                # Khóa của OPEN_METEO_FORMAT khác json là payload giải mã từ định dạng đó: không ghi đè bằng JSON
+                if isinstance(data, dict) and data and config.OPEN_METEO_FORMAT == "json":
+                    forecast_cache.set(cache_key, data)
                 return {
                     "status": "ok",
                     "level": "info",
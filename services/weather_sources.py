@@ -1,41 +1,106 @@
 # services/weather_sources.py
+import asyncio
+import logging
+from typing import Callable, Dict, Any, Optional
+
 import httpx
-from typing import Dict, Any
+
+from services import config
+from services.error_handler import handle_service_error
+from services.http_client import get_async_client
+from services.open_meteo.decode import PayloadError
+
+logger = logging.getLogger("WeatherService")
 
 OPEN_METEO_FORECAST = "https://api.open-meteo.com/v1/forecast"
 WINDY_POINT_FORECAST = "https://api.windy.com/api/point-forecast/v2"
 WINDY_API_KEY = "YOUR_WINDY_KEY"
 
+async def fetch_json(url: str, params: Optional[Dict[str, Any]] = None, expect=dict,
+                     timeout: Optional[float] = None, context: str = "fetch_json",
+                     decode: Optional[Callable[..., Any]] = None):
+    """Bản asyncio của _request_json: GET JSON với retry/backoff, trả None nếu lỗi.
+    decode(body, expect=...) thay cho resp.json() khi cần giải mã/kiểm tra riêng."""
+    client = get_async_client()
+    headers = {"Accept": "application/json"}
+    for attempt in range(config.MAX_RETRIES):
+        try:
+            logger.info(f"[{context}] Call API: {url} (attempt {attempt+1})")
+            resp = await client.get(url, params=params, headers=headers, timeout=timeout or config.API_TIMEOUT)
+
+            # Nếu server lỗi 5xx thì retry
+            if resp.status_code >= 500:
+                logger.warning(f"[{context}] Server error {resp.status_code}")
+                if attempt < config.MAX_RETRIES - 1:
+                    await asyncio.sleep(1.5 * (2 ** attempt))
+                    continue
+
+            resp.raise_for_status()
+            if decode is not None:
+                return decode(resp.content, expect=expect)
+            data = resp.json()
+            if not isinstance(data, expect):
+                raise ValueError("Invalid JSON response")
+            return data
+
+        except (httpx.TimeoutException, httpx.NetworkError) as e:
+            logger.error(f"[{context}] Network error: {e}")
+            if attempt < config.MAX_RETRIES - 1:
+                await asyncio.sleep(1.5 * (2 ** attempt))
+                continue
+            handle_service_error(context, "network", e, alert_type="network")
+            return None
+
+        except httpx.HTTPError as e:
+            logger.error(f"[{context}] HTTP error: {e}")
+            handle_service_error(context, "http_error", e, alert_type="network")
+            return None
+
+        except PayloadError as e:
+            # Payload sai cấu trúc: không retry, không đưa vào cache
+            logger.error(f"[{context}] Invalid payload: {e}")
+            handle_service_error(context, "invalid_payload", e, alert_type="data")
+            return None
+
+        except Exception as e:
+            logger.exception(f"[{context}] Unexpected error")
+            handle_service_error(context, "unexpected", e, alert_type="data")
+            return None
+
+    return None
+
 async def fetch_openmeteo(lat: float, lon: float) -> Dict[str, Any]:
-    async with httpx.AsyncClient(timeout=10) as client:
-        resp = await client.get(
-            OPEN_METEO_FORECAST,
-            params={
-                "latitude": lat,
-                "longitude": lon,
-                "current": "temperature_2m,precipitation,wind_speed_10m,relative_humidity_2m,pressure_msl",
-                "hourly": "temperature_2m,precipitation,wind_speed_10m,relative_humidity_2m,pressure_msl",
-                "daily": "temperature_2m_max,temperature_2m_min,precipitation_sum,uv_index_max"
-            }
-        )
-        resp.raise_for_status()
-        return resp.json()
+    client = get_async_client()
+    resp = await client.get(
+        OPEN_METEO_FORECAST,
+        params={
+            "latitude": lat,
+            "longitude": lon,
+            "current": "temperature_2m,precipitation,wind_speed_10m,relative_humidity_2m,pressure_msl",
+            "hourly": "temperature_2m,precipitation,wind_speed_10m,relative_humidity_2m,pressure_msl",
+            "daily": "temperature_2m_max,temperature_2m_min,precipitation_sum,uv_index_max"
+        },
+        timeout=10,
+    )
+    resp.raise_for_status()
+    return resp.json()
 
 async def fetch_windy(lat: float, lon: float) -> Dict[str, Any]:
-    async with httpx.AsyncClient(timeout=10) as client:
-        resp = await client.post(
-            WINDY_POINT_FORECAST,
-            json={
-                "lat": lat,
-                "lon": lon,
-                "model": "gfs",
-                "parameters": ["temp", "wind", "pressure", "rh", "precip"],
-                "levels": ["surface"],
-                "key": WINDY_API_KEY
-            }
-        )
-        resp.raise_for_status()
-        return resp.json()
+    client = get_async_client()
+    resp = await client.post(
+        WINDY_POINT_FORECAST,
+        json={
+            "lat": lat,
+            "lon": lon,
+            "model": "gfs",
+            "parameters": ["temp", "wind", "pressure", "rh", "precip"],
+            "levels": ["surface"],
+            "key": WINDY_API_KEY
+        },
+        timeout=10,
+    )
+    resp.raise_for_status()
+    return resp.json()
 
 async def get_weather(lat: float, lon: float) -> Dict[str, Any]:
     """Trả về dữ liệu hợp nhất từ Open-Meteo và Windy: current + daily"""
@@ -0,0 +1,89 @@
+# tests/fixtures/open_meteo/build_flatbuffers.py
+"""
+Dựng lại body FlatBuffers (forecast_*.fb) từ body JSON timeformat=unixtime cùng thư mục,
+đúng schema WeatherApiResponse của openmeteo_sdk: mỗi điểm một message có tiền tố độ dài,
+biến hourly/daily theo thứ tự HOURLY_VARS/DAILY_VARS, current theo CURRENT_VARS.
+
+    python -m tests.fixtures.open_meteo.build_flatbuffers
+"""
+import json
+from pathlib import Path
+
+import flatbuffers
+import numpy as np
+
+from services.open_meteo.flatbuffers_format import CURRENT_VARS
+from services.open_meteo.utils import DAILY_VARS, HOURLY_VARS
+
+FIXTURES = Path(__file__).resolve().parent
+_INT64_VARS = ("sunrise", "sunset")
+
+
+def _variable(b: flatbuffers.Builder, values=None, value=None, int64: bool = False) -> int:
+    """VariableWithValues: value (current) hoặc values/values_int64 (hourly/daily), None → NaN."""
+    vec = None
+    if values is not None:
+        if int64:
+            vec = b.CreateNumpyVector(np.array(values, dtype=np.int64))
+        else:
+            vec = b.CreateNumpyVector(np.array([np.nan if v is None else v for v in values], dtype=np.float32))
+    b.StartObject(5)
+    if value is not None:
+        b.PrependFloat32Slot(2, value, 0.0)
+    if vec is not None:
+        b.PrependUOffsetTRelativeSlot(4 if int64 else 3, vec, 0)
+    return b.EndObject()
+
+
+def _section(b: flatbuffers.Builder, start: int, end: int, interval: int, variables: list) -> int:
+    """VariablesWithTime: time, time_end, interval + vector biến."""
+    b.StartVector(4, len(variables), 4)
+    for offset in reversed(variables):
+        b.PrependUOffsetTRelative(offset)
+    vec = b.EndVector()
+    b.StartObject(4)
+    b.PrependInt64Slot(0, start, 0)
+    b.PrependInt64Slot(1, end, 0)
+    b.PrependInt32Slot(2, interval, 0)
+    b.PrependUOffsetTRelativeSlot(3, vec, 0)
+    return b.EndObject()
+
+
+def message(payload: dict) -> bytes:
+    """Một payload JSON (unixtime) → một message WeatherApiResponse có tiền tố độ dài."""
+    b = flatbuffers.Builder(1 << 16)
+    h, d, cw = payload["hourly"], payload["daily"], payload["current_weather"]
+
+    hourly_vars = [_variable(b, h[name]) for name in HOURLY_VARS]
+    hourly = _section(b, h["time"][0], h["time"][-1] + 3600, 3600, hourly_vars)
+    daily_vars = [_variable(b, d[name], int64=name in _INT64_VARS) for name in DAILY_VARS]
+    daily = _section(b, d["time"][0], d["time"][-1] + 86400, 86400, daily_vars)
+    current_vars = [_variable(b, value=float(cw[key])) for key, _ in CURRENT_VARS]
+    current = _section(b, cw["time"], cw["time"] + cw.get("interval", 900), cw.get("interval", 900), current_vars)
+    tz = b.CreateString(payload["timezone"])
+
+    b.StartObject(15)
+    b.PrependFloat32Slot(0, payload["latitude"], 0)
+    b.PrependFloat32Slot(1, payload["longitude"], 0)
+    b.PrependFloat32Slot(2, payload["elevation"], 0)
+    b.PrependInt32Slot(6, payload["utc_offset_seconds"], 0)
+    b.PrependUOffsetTRelativeSlot(7, tz, 0)
+    b.PrependUOffsetTRelativeSlot(9, current, 0)
+    b.PrependUOffsetTRelativeSlot(10, daily, 0)
+    b.PrependUOffsetTRelativeSlot(11, hourly, 0)
+    b.FinishSizePrefixed(b.EndObject())
+    return bytes(b.Output())
+
+
+def build(name: str) -> Path:
+    """forecast_<name>.json (một payload hoặc list payload) → forecast_<name>.fb."""
+    data = json.loads((FIXTURES / f"forecast_{name}.json").read_text())
+    payloads = data if isinstance(data, list) else [data]
+    out = FIXTURES / f"forecast_{name}.fb"
+    out.write_bytes(b"".join(message(p) for p in payloads))
+    return out
+
+
+if __name__ == "__main__":
+    for name in ("single", "multi"):
+        print(build(name))
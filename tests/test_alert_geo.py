@@ -0,0 +1,72 @@
+# tests/test_alert_geo.py
+import time
+import unittest
+from unittest import mock
+
+from services import alert_geo
+from services.nchmf import HTML, RSS, STORM, UNUSUAL, FeedItem, OfficialAlert, OfficialAlertStore, _alert_id
+
+HANOI = (21.03, 105.85)
+HUE = (16.46, 107.59)
+SAPA = (22.34, 103.84)
+
+ALERTS = [
+    (STORM, RSS, "Tin bão khẩn cấp (Cơn bão số 5)",
+     "Vị trí tâm bão ở vào khoảng 17,2 độ Vĩ Bắc; 108,9 độ Kinh Đông. Gió mạnh cấp 11."),
+    (STORM, RSS, "Tin áp thấp nhiệt đới trên Biển Đông", "Áp thấp nhiệt đới trên khu vực giữa Biển Đông."),
+    (UNUSUAL, RSS, "Cảnh báo mưa đá, dông tố tại Lào Cai, Yên Bái", ""),
+    (STORM, HTML, "Tin bão tại Hà Nội", ""),
+]
+
+
+def _store() -> OfficialAlertStore:
+    store = OfficialAlertStore(feeds=[], ttl_s=3600)
+    now = time.time()
+    for category, kind, title, summary in ALERTS:
+        aid = _alert_id(category, title)
+        store._alerts[aid] = OfficialAlert(aid, category, FeedItem(title, summary=summary), f"{kind}_feed", now, kind)
+    store.version = 1
+    return store
+
+
+class AlertGeoTest(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(alert_geo, "official_store", _store())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        alert_geo._index = None
+        self.addCleanup(setattr, alert_geo, "_index", None)
+
+    def test_is_located(self):
+        located = {a.title: alert_geo.is_located(a) for a in alert_geo.official_store.alerts()}
+        self.assertEqual(located, {
+            "Tin bão khẩn cấp (Cơn bão số 5)": True,
+            "Tin áp thấp nhiệt đới trên Biển Đông": False,
+            "Cảnh báo mưa đá, dông tố tại Lào Cai, Yên Bái": True,
+            "Tin bão tại Hà Nội": False,
+        })
+
+    @unittest.skipIf(alert_geo.shapely is None, "chưa cài shapely")
+    def test_only_located_rss_alerts_match_a_point(self):
+        self.assertEqual(alert_geo.official_alerts_at(*HANOI, STORM), [])
+        self.assertEqual(alert_geo.official_alerts_at(*HUE, STORM), ["Tin bão khẩn cấp (Cơn bão số 5)"])
+        self.assertEqual(alert_geo.official_alerts_at(*SAPA, UNUSUAL), ["Cảnh báo mưa đá, dông tố tại Lào Cai, Yên Bái"])
+        self.assertEqual(alert_geo.get_alert_geo_index().stats()["unlocated"], 2)
+
+    @unittest.skipIf(alert_geo.shapely is None, "chưa cài shapely")
+    def test_bulk_matches_single(self):
+        points = [HANOI, HUE, SAPA]
+        bulk = alert_geo.official_alerts_bulk([p[0] for p in points], [p[1] for p in points])
+        for (lat, lon), titles in zip(points, bulk):
+            single = alert_geo.official_alerts_at(lat, lon, STORM) + alert_geo.official_alerts_at(lat, lon, UNUSUAL)
+            self.assertEqual(sorted(titles), sorted(single))
+
+    def test_without_index_keeps_only_located_alerts(self):
+        with mock.patch.object(alert_geo, "get_alert_geo_index", return_value=None):
+            self.assertEqual(alert_geo.official_alerts_at(*HANOI, STORM), ["Tin bão khẩn cấp (Cơn bão số 5)"])
+            self.assertEqual(alert_geo.official_alerts_bulk([HANOI[0]], [HANOI[1]], UNUSUAL),
+                             [["Cảnh báo mưa đá, dông tố tại Lào Cai, Yên Bái"]])
+
+
+if __name__ == "__main__":
+    unittest.main()
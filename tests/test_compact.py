@@ -0,0 +1,148 @@
+# tests/test_compact.py
+import gc
+import math
+import unittest
+import weakref
+
+import numpy as np
+
+from services.open_meteo import compact as compact_module
+from services.open_meteo.compact import (
+    CompactPayload, PackedSeries, SharedTimes, block_array, compact_payload, expand_payload, pack_list,
+)
+from services.open_meteo.timeaxis import hourly_axis
+
+
+def _payload() -> dict:
+    return {
+        "latitude": 21.0,
+        "longitude": 105.75,
+        "current_weather": {"temperature": 30.2, "weathercode": 3, "time": 1751335200},
+        "hourly": {
+            "time": [1751302800 + 3600 * i for i in range(6)],
+            "temperature_2m": [25.1, 25.0, None, 26.35, 27.0, -1.5],
+            "weathercode": [0, 1, 2, 3, 61, 95],
+            "precipitation": [None] * 6,
+            "mixed": [1, 2.5, 3, None, 4, 5],
+            "weather_desc": ["Nắng", "Mây", None, "Mưa", "Mưa", "Dông"],
+        },
+        "daily": {
+            "time": ["2025-07-01", "2025-07-02"],
+            "temperature_2m_max": [33.0, 34.25],
+            "sunrise": ["2025-07-01T05:17", "2025-07-02T05:17"],
+        },
+    }
+
+
+class PackListTest(unittest.TestCase):
+    def assert_round_trip(self, values, kind):
+        packed = pack_list(values)
+        self.assertIsInstance(packed, PackedSeries)
+        self.assertEqual(packed.kind, kind)
+        out = packed.tolist()
+        self.assertEqual(out, values)
+        self.assertEqual([type(v) for v in out], [type(v) for v in values])
+        self.assertEqual([packed.item(i) for i in range(len(values))], values)
+
+    def test_floats_with_none(self):
+        self.assert_round_trip([25.1, None, 26.35, -1.5, 0.0, None], "f32")
+
+    def test_ints(self):
+        self.assert_round_trip([0, 1, 61, 95, -3], "int")
+
+    def test_unpackable_lists_stay_lists(self):
+        for values in (
+            [],
+            [None, None],                   # toàn None
+            [1, 2.5, 3],                    # int lẫn float
+            [1, None, 3],                   # int có None
+            ["a", "b"],
+            [True, False],
+            [2 ** 40, 1],                   # vượt int32
+            [0.123456789, 1.0],             # float32 làm mất chữ số
+            [1.0, float("nan")],            # NaN thật, không phải None
+        ):
+            with self.subTest(values=values):
+                self.assertIsNone(pack_list(values))
+
+    def test_slice_keeps_packed_form(self):
+        packed = pack_list([1.5, None, 2.25, 3.0])
+        part = packed[1:3]
+        self.assertIsInstance(part, PackedSeries)
+        self.assertEqual(part.tolist(), [None, 2.25])
+        self.assertTrue(math.isnan(packed.to_numpy()[1]))
+
+
+class CompactPayloadTest(unittest.TestCase):
+    def test_expand_round_trip(self):
+        data = _payload()
+        compact = compact_payload(data)
+        self.assertIsInstance(compact, CompactPayload)
+        self.assertEqual(compact.expand(), data)
+        self.assertEqual(expand_payload(compact), data)
+        hourly = compact.get("hourly")
+        self.assertIsInstance(hourly["temperature_2m"], PackedSeries)
+        self.assertEqual(hourly["weathercode"].kind, "int")
+        self.assertEqual(hourly["precipitation"], [None] * 6)
+        self.assertEqual(hourly["mixed"], data["hourly"]["mixed"])
+        self.assertIsInstance(hourly["time"], list)
+
+    def test_expand_reused_while_alive(self):
+        compact = compact_payload(_payload())
+        first = compact.expand()
+        self.assertIs(compact.expand(), first)
+        self.assertTrue(compact.owns(first))
+        self.assertFalse(compact.owns(_payload()))
+        del first
+        gc.collect()
+        self.assertIsNone(compact._ref())
+        self.assertTrue(compact.owns(compact.expand()))
+
+    def test_expand_payload_of_trimmed_dict(self):
+        compact = compact_payload(_payload())
+        trimmed = {"latitude": 21.0, "hourly": {k: v[:3] for k, v in compact.get("hourly").items()}}
+        out = expand_payload(trimmed)
+        self.assertEqual(out["hourly"]["temperature_2m"], [25.1, 25.0, None])
+        self.assertEqual(out["hourly"]["weather_desc"], ["Nắng", "Mây", None])
+
+    def test_block_array_reads_packed_and_plain(self):
+        data = _payload()
+        for payload in (data, compact_payload(data)):
+            arr = block_array(payload, "hourly", "temperature_2m")
+            np.testing.assert_array_equal(arr, [25.1, 25.0, np.nan, 26.35, 27.0, -1.5])
+            self.assertIsNone(block_array(payload, "hourly", "missing"))
+
+    def test_non_forecast_data_unchanged(self):
+        for data in (None, [], {"status": "ok"}):
+            self.assertIs(compact_payload(data), data)
+            self.assertIs(expand_payload(data), data)
+
+
+class SharedAxisTest(unittest.TestCase):
+    def test_equal_time_lists_are_shared(self):
+        a, b = compact_payload(_payload()), compact_payload(_payload())
+        times = a.get("hourly")["time"]
+        self.assertIsInstance(times, SharedTimes)
+        self.assertIs(b.get("hourly")["time"], times)
+        self.assertIs(a.expand()["hourly"]["time"], times)
+        self.assertEqual(times, _payload()["hourly"]["time"])
+
+    def test_parsed_axis_lives_with_payload(self):
+        compact = compact_payload(_payload())
+        times = compact.get("hourly")["time"]
+        axis = hourly_axis(times, 25200)
+        self.assertIs(hourly_axis(times, 25200), axis)
+        self.assertEqual(axis.nearest(times[2]), 2)
+        ref = weakref.ref(times)
+        del compact, times, axis
+        gc.collect()
+        self.assertIsNone(ref())
+        self.assertIsNone(compact_module._shared_axes.get(tuple(_payload()["hourly"]["time"])))
+
+    def test_plain_list_is_not_cached(self):
+        times = _payload()["hourly"]["time"]
+        self.assertIsNot(hourly_axis(times, 25200), hourly_axis(times, 25200))
+
+
+if __name__ == "__main__":
+    unittest.main()
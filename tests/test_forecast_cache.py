@@ -0,0 +1,299 @@
+# tests/test_forecast_cache.py
+import asyncio
+import threading
+import time
+import unittest
+from unittest import mock
+
+from services import config
+from services.open_meteo import open_meteo, projection
+from services.open_meteo.cache import ForecastCache
+from services.open_meteo.compact import CompactPayload, expand_payload
+from services.open_meteo.grid import snap_to_grid
+from services.open_meteo.projection import ISO, UNIXTIME, Projection
+
+
+def _payload(seed: int = 0, hours: int = 24) -> dict:
+    """Payload forecast nhỏ (unixtime) đủ cho cache/compact."""
+    return {
+        "latitude": 21.0,
+        "longitude": 105.75,
+        "utc_offset_seconds": 25200,
+        "hourly": {
+            "time": [1751302800 + 3600 * i for i in range(hours)],
+            "temperature_2m": [round(25.0 + seed + 0.1 * i, 1) for i in range(hours)],
+            "precipitation": [None if i == 3 else round(0.2 * i, 1) for i in range(hours)],
+            "winddirection_10m": [(seed * 10 + i) % 360 for i in range(hours)],
+        },
+    }
+
+
+class DisabledCacheTest(unittest.TestCase):
+    """TTL = 0 hoặc max_entries = 0: không lưu gì nhưng vẫn trả payload cho caller."""
+
+    def caches(self):
+        return [ForecastCache(ttl_s=0, max_entries=10), ForecastCache(ttl_s=60, max_entries=0)]
+
+    def test_set_returns_payload_in_cached_form(self):
+        for compact in (True, False):
+            with mock.patch.object(config, "FORECAST_CACHE_COMPACT", compact):
+                for cache in self.caches():
+                    data = _payload()
+                    stored = cache.set("k", data)
+                    self.assertIsNotNone(stored)
+                    self.assertIsInstance(stored, CompactPayload if compact else dict)
+                    self.assertEqual(expand_payload(stored), data)
+                    self.assertEqual(len(cache), 0)
+                    self.assertIsNone(cache.get("k"))
+
+    def test_refresh_and_load_report_success(self):
+        for cache in self.caches():
+            self.assertTrue(cache.refresh("k", _payload))
+            data, age = cache.get_or_load_with_age("k", _payload)
+            self.assertEqual(expand_payload(data), _payload())
+            self.assertEqual(age, 0.0)
+            self.assertEqual(len(cache), 0)
+
+    def test_batch_keeps_upstream_payloads(self):
+        points = [(21.0, 105.75), (10.75, 106.75)]
+        upstream = [_payload(1), _payload(2)]
+        with mock.patch.object(open_meteo, "forecast_cache", ForecastCache(ttl_s=0, max_entries=10)), \
+                mock.patch.object(open_meteo, "_fetch_forecast_batch_upstream", return_value=upstream):
+            result = open_meteo.fetch_forecast_batch(points)
+        self.assertEqual([expand_payload(p) for p in result], upstream)
+
+
+class TtlLruTest(unittest.TestCase):
+    def test_entry_expires_after_ttl(self):
+        cache = ForecastCache(ttl_s=0.05, max_entries=10)
+        cache.set("k", _payload())
+        self.assertIsNotNone(cache.get("k"))
+        time.sleep(0.1)
+        self.assertIsNone(cache.get("k"))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_expired_entry_is_reloaded(self):
+        cache = ForecastCache(ttl_s=0.05, max_entries=10)
+        calls = []
+        loader = lambda: calls.append(1) or _payload(len(calls))
+        cache.get_or_load("k", loader)
+        cache.get_or_load("k", loader)
+        self.assertEqual(len(calls), 1)
+        time.sleep(0.1)
+        data = cache.get_or_load("k", loader)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(expand_payload(data), _payload(2))
+
+    def test_empty_result_is_not_cached(self):
+        cache = ForecastCache(ttl_s=60, max_entries=10)
+        self.assertIsNone(cache.get_or_load("k", lambda: None))
+        self.assertEqual(len(cache), 0)
+
+    def test_lru_evicts_least_recently_used(self):
+        cache = ForecastCache(ttl_s=60, max_entries=2)
+        cache.set("a", _payload(1))
+        cache.set("b", _payload(2))
+        cache.get("a")                      # a thành mới dùng nhất → b bị loại
+        cache.set("c", _payload(3))
+        self.assertEqual(list(cache._entries), ["a", "c"])
+        self.assertEqual(cache.evictions, 1)
+
+    def test_byte_budget_evicts_oldest(self):
+        one = ForecastCache(ttl_s=60, max_entries=10)
+        one.set("x", _payload())
+        size = one.bytes
+        cache = ForecastCache(ttl_s=60, max_entries=10, max_bytes=int(size * 2.5))
+        for i in range(4):
+            cache.set(i, _payload(i))
+        self.assertEqual(list(cache._entries), [2, 3])
+        self.assertLessEqual(cache.bytes, cache.max_bytes)
+        self.assertEqual(cache.evictions, 2)
+
+    def test_byte_budget_keeps_newest_entry(self):
+        cache = ForecastCache(ttl_s=60, max_entries=10, max_bytes=1)
+        cache.set("a", _payload(1))
+        cache.set("b", _payload(2))
+        self.assertEqual(list(cache._entries), ["b"])
+        self.assertIsNotNone(cache.get("b"))
+
+    def test_replace_and_invalidate_keep_byte_count(self):
+        cache = ForecastCache(ttl_s=60, max_entries=10)
+        cache.set("a", _payload(1))
+        size = cache.bytes
+        cache.set("a", _payload(2))
+        self.assertEqual(cache.bytes, size)
+        cache.invalidate("a")
+        self.assertEqual((len(cache), cache.bytes), (0, 0))
+
+
+class StaleWhileRevalidateTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = ForecastCache(ttl_s=0.05, max_entries=10, stale_grace_s=60)
+        self.cache.set("k", _payload(1))
+        time.sleep(0.1)
+
+    def wait_refresh(self):
+        deadline = time.monotonic() + 2
+        while (self.cache._refreshing or self.cache._refresh_tasks) and time.monotonic() < deadline:
+            time.sleep(0.005)
+
+    def test_stale_entry_is_served_and_refreshed_once(self):
+        calls, release = [], threading.Event()
+
+        def loader():
+            calls.append(1)
+            release.wait(2)
+            return _payload(2)
+
+        for _ in range(3):
+            data, age = self.cache.get_or_load_with_age("k", loader)
+            self.assertEqual(expand_payload(data), _payload(1))
+            self.assertGreater(age, 0.05)
+        release.set()
+        self.wait_refresh()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual((self.cache.stale_hits, self.cache.refreshes), (3, 1))
+        self.assertEqual(expand_payload(self.cache.get("k")), _payload(2))
+
+    def test_failed_refresh_keeps_stale_entry(self):
+        def loader():
+            raise ConnectionError("upstream down")
+
+        with self.assertLogs("WeatherService", "WARNING"):
+            self.cache.get_or_load("k", loader)
+            self.wait_refresh()
+        self.assertEqual(self.cache.refresh_errors, 1)
+        self.assertEqual(expand_payload(self.cache.peek("k")[0]), _payload(1))
+
+    def test_async_refresh_runs_in_background(self):
+        calls = []
+
+        async def loader():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return _payload(2)
+
+        async def main():
+            data, _ = await self.cache.get_or_load_with_age_async("k", loader)
+            self.assertEqual(len(self.cache._refresh_tasks), 1)
+            await asyncio.gather(*self.cache._refresh_tasks)
+            return data
+
+        self.assertEqual(expand_payload(asyncio.run(main())), _payload(1))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(expand_payload(self.cache.get("k")), _payload(2))
+
+    def test_past_grace_is_a_miss(self):
+        cache = ForecastCache(ttl_s=0.02, max_entries=10, stale_grace_s=0.02)
+        cache.set("k", _payload(1))
+        time.sleep(0.08)
+        data, age = cache.get_or_load_with_age("k", lambda: _payload(2))
+        self.assertEqual((expand_payload(data), age), (_payload(2), 0.0))
+
+
+class FindFreshTest(unittest.TestCase):
+    CELL = snap_to_grid(21.0, 105.75)
+
+    def setUp(self):
+        self.cache = ForecastCache(ttl_s=60, max_entries=10)
+        self.full = Projection(hourly=["temperature_2m", "precipitation"], current=False, days=2, timeformat=UNIXTIME)
+        self.cache.set(self.full.cache_key(*self.CELL), _payload(hours=48))
+
+    def test_prefer_exact_key_first(self):
+        small = Projection(hourly=["precipitation"], days=1, timeformat=UNIXTIME)
+        self.cache.set(small.cache_key(*self.CELL), _payload(5, hours=24))
+        seen = []
+        hit = self.cache.find_fresh(self.CELL, lambda k, d: seen.append(k) or True, prefer=small.cache_key(*self.CELL))
+        self.assertEqual(hit[0], small.cache_key(*self.CELL))
+        self.assertEqual(len(seen), 1)
+
+    def test_rejected_expired_or_other_cell_is_none(self):
+        self.assertIsNone(self.cache.find_fresh(self.CELL, lambda k, d: False))
+        self.assertIsNone(self.cache.find_fresh((10.75, 106.75), lambda k, d: True))
+        self.assertEqual(self.cache.misses, 0)
+        expired = ForecastCache(ttl_s=0.02, max_entries=10)
+        expired.set(self.full.cache_key(*self.CELL), _payload())
+        time.sleep(0.05)
+        self.assertIsNone(expired.find_fresh(self.CELL, lambda k, d: True))
+
+    def test_superset_payload_serves_smaller_projection(self):
+        small = Projection(hourly=["precipitation"], days=1, timeformat=UNIXTIME)
+        with mock.patch.object(projection, "forecast_cache", self.cache), \
+                mock.patch.object(open_meteo, "_request_json", side_effect=AssertionError("upstream")):
+            data, age = projection.fetch_projected_with_age(*self.CELL, small)
+        hourly = expand_payload(data)["hourly"]
+        self.assertEqual(sorted(hourly), ["precipitation", "time"])
+        self.assertEqual(hourly["precipitation"], _payload(hours=48)["hourly"]["precipitation"][:24])
+        self.assertEqual(hourly["time"], _payload(hours=24)["hourly"]["time"])
+        self.assertGreaterEqual(age, 0.0)
+        self.assertEqual(len(self.cache), 1)
+
+    def test_superset_must_cover_vars_days_and_format(self):
+        key = self.full.cache_key(*self.CELL)
+        payload = self.cache.get(key)
+        self.assertTrue(Projection(hourly=["temperature_2m"], days=2).covered_by(key, payload))
+        self.assertFalse(Projection(hourly=["windspeed_10m"], days=1).covered_by(key, payload))
+        self.assertFalse(Projection(hourly=["precipitation"], days=3).covered_by(key, payload))
+        self.assertFalse(Projection(current=True, days=1).covered_by(key, payload))
+        self.assertFalse(Projection(hourly=["precipitation"], days=1, timeformat=ISO).covered_by(key, payload))
+
+
+class MemoTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = ForecastCache(ttl_s=60, max_entries=10)
+        self.data = self.cache.set("k", _payload(1))
+        self.builds = []
+
+    def build(self, value="parsed"):
+        return lambda: self.builds.append(value) or [value] * 100
+
+    def test_built_once_per_payload(self):
+        first = self.cache.memo("k", self.data, "hourly", self.build())
+        second = self.cache.memo("k", self.data, "hourly", self.build())
+        self.assertIs(first, second)
+        self.assertEqual(self.builds, ["parsed"])
+        self.assertEqual((self.cache.derived_hits, self.cache.derived_misses), (1, 1))
+
+    def test_variant_change_rebuilds(self):
+        self.cache.memo("k", self.data, "now", self.build("h1"), variant=1)
+        self.cache.memo("k", self.data, "now", self.build("h1"), variant=1)
+        self.cache.memo("k", self.data, "now", self.build("h2"), variant=2)
+        self.assertEqual(self.builds, ["h1", "h2"])
+
+    def test_replaced_entry_invalidates_memo(self):
+        old = self.cache.memo("k", self.data, "hourly", self.build("old"))
+        fresh = self.cache.set("k", _payload(2))
+        new = self.cache.memo("k", fresh, "hourly", self.build("new"))
+        self.assertIsNot(new, old)
+        self.assertEqual(new[0], "new")
+        # Caller còn giữ payload cũ: chỉ tính lại, không ghi đè kết quả của bản ghi mới
+        stale = self.cache.memo("k", self.data, "hourly", self.build("stale"))
+        self.assertEqual(stale[0], "stale")
+        self.assertIs(self.cache.memo("k", fresh, "hourly", self.build("again")), new)
+        self.assertEqual(self.builds, ["old", "new", "stale"])
+
+    def test_memo_after_invalidate_is_not_stored(self):
+        self.cache.invalidate("k")
+        self.cache.memo("k", self.data, "hourly", self.build())
+        self.cache.memo("k", self.data, "hourly", self.build())
+        self.assertEqual(len(self.builds), 2)
+        self.assertEqual(self.cache.bytes, 0)
+
+    def test_memo_counts_toward_byte_budget(self):
+        before = self.cache.bytes
+        self.cache.memo("k", self.data, "hourly", self.build())
+        self.assertGreater(self.cache.bytes, before)
+        self.cache.invalidate("k")
+        self.assertEqual(self.cache.bytes, 0)
+
+    def test_expanded_payload_is_owned(self):
+        if not isinstance(self.data, CompactPayload):
+            self.skipTest("FORECAST_CACHE_COMPACT tắt")
+        expanded = self.data.expand()
+        self.cache.memo("k", expanded, "hourly", self.build())
+        self.cache.memo("k", self.data, "hourly", self.build())
+        self.assertEqual(len(self.builds), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
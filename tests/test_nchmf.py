@@ -0,0 +1,206 @@
+# tests/test_nchmf.py
+import hashlib
+import threading
+import time
+import unittest
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import requests
+
+from services import nchmf
+from services.nchmf import HTML, RSS, STORM, UNUSUAL, Feed, OfficialAlertStore, parse_html, parse_rss
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures" / "nchmf"
+BASE_URL = "https://www.nchmf.gov.vn/"
+
+
+def _fixture(name: str) -> bytes:
+    return (FIXTURES / name).read_bytes()
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """Phục vụ feed đã ghi lại: ETag theo nội dung, Last-Modified cố định, trả 304 khi khớp validator."""
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append((self.path, self.headers.get("If-None-Match"), self.headers.get("If-Modified-Since")))
+        route = server.routes.get(self.path)
+        if route is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        body, content_type = route
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()[:12]
+        if self.headers.get("If-None-Match") == etag or (
+            server.last_modified and self.headers.get("If-Modified-Since") == server.last_modified
+        ):
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        if server.send_etag:
+            self.send_header("ETag", etag)
+        if server.last_modified:
+            self.send_header("Last-Modified", server.last_modified)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _StubHandler)
+        self.routes = {
+            "/rss/bao.xml": (_fixture("storm.rss"), "application/rss+xml"),
+            "/rss/bat-thuong.xml": (_fixture("unusual.atom"), "application/atom+xml"),
+            "/": (_fixture("home.html"), "text/html; charset=utf-8"),
+        }
+        self.requests = []
+        self.send_etag = True
+        self.last_modified = None
+
+    def url(self, path: str) -> str:
+        return f"http://127.0.0.1:{self.server_port}{path}"
+
+
+class ParseTest(unittest.TestCase):
+    def test_rss_items(self):
+        items = parse_rss(_fixture("storm.rss"), BASE_URL)
+        self.assertEqual([i.title for i in items], [
+            "Tin bão khẩn cấp (Cơn bão số 5)",
+            "Tin áp thấp nhiệt đới trên Biển Đông",
+            "Bản tin dự báo thời tiết biển ngày 14/10",
+        ])
+        self.assertEqual(items[0].guid, "nchmf-bao-5-0600")
+        self.assertEqual(items[0].published.isoformat(), "2026-10-14T06:00:00+07:00")
+        self.assertTrue(items[0].summary.startswith("Hồi 04 giờ ngày 14/10"))
+        self.assertNotIn("<b>", items[0].summary)
+
+    def test_atom_items(self):
+        items = parse_rss(_fixture("unusual.atom"), BASE_URL)
+        self.assertEqual(len(items), 2)
+        self.assertEqual(items[0].link, "https://www.nchmf.gov.vn/kttv/vi-VN/1/canh-bao-mua-lon-lao-cai.html")
+        self.assertEqual(items[1].published.isoformat(), "2026-10-14T09:10:00+00:00")
+
+    def test_broken_feed_is_empty(self):
+        self.assertEqual(parse_rss(b""), [])
+        self.assertEqual(parse_rss(b"<html>not a feed"), [])
+
+    def test_html_skips_menu_and_nested_items(self):
+        items = parse_html(_fixture("home.html").decode("utf-8"), BASE_URL)
+        self.assertEqual([i.title for i in items], [
+            "Tin bão khẩn cấp (Cơn bão số 5)",
+            "Cảnh báo mưa lớn tại Lào Cai",
+        ])
+        self.assertEqual(items[0].link, "https://www.nchmf.gov.vn/kttv/vi-VN/1/tin-bao-khan-cap-con-bao-so-5.html")
+
+
+class FeedPollTest(unittest.TestCase):
+    def setUp(self):
+        self.server = _StubServer()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.session = requests.Session()
+
+    def tearDown(self):
+        self.session.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def store(self, *feeds, ttl_s: float = 3600) -> OfficialAlertStore:
+        return OfficialAlertStore(list(feeds), ttl_s=ttl_s)
+
+    def storm_feed(self) -> Feed:
+        return Feed("storm_rss", self.server.url("/rss/bao.xml"), RSS, (STORM,))
+
+    def unusual_feed(self) -> Feed:
+        return Feed("unusual_rss", self.server.url("/rss/bat-thuong.xml"), RSS, (UNUSUAL,))
+
+    def test_default_feeds_are_rss_only(self):
+        self.assertEqual([f.kind for f in nchmf.default_feeds()], [RSS, RSS])
+
+    def test_etag_then_not_modified(self):
+        feed = self.storm_feed()
+        first = feed.fetch(self.session)
+        self.assertEqual(feed.status, "ok")
+        self.assertEqual(len(first), 3)
+        second = feed.fetch(self.session)
+        self.assertEqual(feed.status, "not_modified")
+        self.assertIs(second, first)
+        self.assertIsNone(self.server.requests[0][1])
+        self.assertEqual(self.server.requests[1][1], feed.etag)
+
+    def test_if_modified_since(self):
+        self.server.send_etag = False
+        self.server.last_modified = formatdate(time.time() - 3600, usegmt=True)
+        feed = self.storm_feed()
+        feed.fetch(self.session)
+        self.assertIsNone(feed.etag)
+        feed.fetch(self.session)
+        self.assertEqual(feed.status, "not_modified")
+        self.assertEqual(self.server.requests[1][2], self.server.last_modified)
+
+    def test_poll_filters_and_dedups(self):
+        store = self.store(self.storm_feed(), self.unusual_feed())
+        self.assertEqual(store.poll(self.session), 3)
+        self.assertEqual(sorted(store.titles(STORM)), [
+            "Tin bão khẩn cấp (Cơn bão số 5)",
+            "Tin áp thấp nhiệt đới trên Biển Đông",
+        ])
+        self.assertEqual(store.titles(UNUSUAL), ["Tin cảnh báo dông tố, lốc, sét, mưa đá khu vực Hà Nội"])
+        version = store.version
+
+        # Lượt sau nhận 304: không thêm bản ghi trùng, version không đổi
+        self.assertEqual(store.poll(self.session), 3)
+        self.assertEqual(store.version, version)
+        self.assertEqual(store.stats()["feeds"]["storm_rss"]["status"], "not_modified")
+
+    def test_same_title_from_two_feeds_is_one_alert(self):
+        duplicate = Feed("storm_mirror", self.server.url("/rss/bao.xml"), RSS, (STORM,))
+        store = self.store(self.storm_feed(), duplicate)
+        self.assertEqual(store.poll(self.session), 2)
+        self.assertEqual({a.source for a in store.alerts(STORM)}, {"storm_rss"})
+
+    def test_summary_update_bumps_version(self):
+        store = self.store(self.storm_feed())
+        store.poll(self.session)
+        version = store.version
+        body = _fixture("storm.rss").replace("cấp 11".encode(), "cấp 12".encode())
+        self.server.routes["/rss/bao.xml"] = (body, "application/rss+xml")
+        store.poll(self.session)
+        self.assertEqual(store.version, version + 1)
+        self.assertIn("cấp 12", store.alerts(STORM)[0].summary)
+
+    def test_alerts_expire_when_gone(self):
+        store = self.store(self.storm_feed(), ttl_s=0.05)
+        self.assertEqual(store.poll(self.session), 2)
+        self.server.routes["/rss/bao.xml"] = (b'<?xml version="1.0"?><rss><channel></channel></rss>', "application/rss+xml")
+        time.sleep(0.1)
+        self.assertEqual(store.poll(self.session), 0)
+        self.assertEqual(store.titles(STORM), [])
+
+    def test_feed_error_keeps_other_feeds(self):
+        broken = Feed("broken", self.server.url("/missing.xml"), RSS, (STORM,))
+        store = self.store(broken, self.unusual_feed())
+        self.assertEqual(store.poll(self.session), 1)
+        self.assertTrue(store.stats()["feeds"]["broken"]["status"].startswith("error"))
+
+        # Feed lỗi ở lượt sau không xóa cảnh báo đã có
+        self.server.routes.pop("/rss/bat-thuong.xml")
+        self.assertEqual(store.poll(self.session), 1)
+
+    def test_html_feed_opt_in(self):
+        store = self.store(Feed("home_html", self.server.url("/"), HTML, (STORM,)))
+        store.poll(self.session)
+        self.assertEqual(store.titles(STORM), ["Tin bão khẩn cấp (Cơn bão số 5)", "Cảnh báo mưa lớn tại Lào Cai"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+# tests/test_open_meteo_flatbuffers.py
+import json
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import pandas as pd
+
+from services.open_meteo import flatbuffers_format as fbf
+from services.open_meteo.current import parse_current_table
+from services.open_meteo.daily import parse_daily_table
+from services.open_meteo.decode import PayloadError
+from services.open_meteo.hourly import parse_hourly_table
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures" / "open_meteo"
+PARSERS = (
+    parse_current_table,
+    lambda data: parse_hourly_table(data, forecast_days=10),
+    lambda data: parse_daily_table(data, forecast_days=10),
+)
+
+
+def _fixture(name: str):
+    """(body FlatBuffers, list payload JSON cùng dữ liệu) của forecast_<name>."""
+    body = (FIXTURES / f"forecast_{name}.fb").read_bytes()
+    data = json.loads((FIXTURES / f"forecast_{name}.json").read_text())
+    return body, data if isinstance(data, list) else [data]
+
+
+class _Resp:
+    def __init__(self, content: bytes):
+        self.content = content
+
+    def raise_for_status(self):
+        pass
+
+
+@unittest.skipIf(fbf.WeatherApiResponse is None, "chưa cài openmeteo_sdk")
+class DecodeFlatbuffersTest(unittest.TestCase):
+    def assert_same_payload(self, decoded: dict, expected: dict):
+        self.assertEqual(decoded["hourly"], expected["hourly"])
+        self.assertEqual(decoded["daily"], expected["daily"])
+        self.assertEqual(decoded["utc_offset_seconds"], expected["utc_offset_seconds"])
+        self.assertEqual(decoded["timezone"], expected["timezone"])
+        for key in ("latitude", "longitude", "elevation"):
+            self.assertAlmostEqual(decoded[key], expected[key], places=4)
+        for key, _ in fbf.CURRENT_VARS:
+            self.assertEqual(decoded["current_weather"][key], expected["current_weather"][key])
+        self.assertEqual(decoded["current_weather"]["time"], expected["current_weather"]["time"])
+
+    def assert_same_tables(self, decoded: dict, expected: dict):
+        for parse in PARSERS:
+            pd.testing.assert_frame_equal(parse(decoded).to_pandas(), parse(expected).to_pandas())
+
+    def test_single_point_matches_json(self):
+        body, expected = _fixture("single")
+        payloads = fbf.decode_flatbuffers(body)
+        self.assertEqual(len(payloads), 1)
+        self.assert_same_payload(payloads[0], expected[0])
+        self.assert_same_tables(payloads[0], expected[0])
+
+    def test_multi_point_keeps_order(self):
+        body, expected = _fixture("multi")
+        payloads = fbf.decode_flatbuffers(body)
+        self.assertEqual(len(payloads), len(expected))
+        for decoded, payload in zip(payloads, expected):
+            self.assert_same_payload(decoded, payload)
+            self.assert_same_tables(decoded, payload)
+
+    def test_missing_values_become_none(self):
+        body, expected = _fixture("single")
+        decoded = fbf.decode_flatbuffers(body)[0]
+        self.assertIsNone(decoded["hourly"]["precipitation"][7])
+        self.assertIsNone(decoded["daily"]["uv_index_max"][3])
+
+    def test_truncated_body_raises(self):
+        body, _ = _fixture("single")
+        with self.assertRaises(PayloadError):
+            fbf.decode_flatbuffers(body[:-10])
+
+    def test_fetch_rejects_point_count_mismatch(self):
+        body, _ = _fixture("single")
+        session = mock.Mock()
+        session.get.return_value = _Resp(body)
+        with mock.patch.object(fbf, "get_session", return_value=session):
+            self.assertIsNone(fbf.fetch_flatbuffers([(21.0, 105.75), (10.75, 106.75)]))
+            self.assertEqual(len(fbf.fetch_flatbuffers([(21.0, 105.75)])), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,213 @@
+# tests/test_parity.py
+"""
+So khớp với bản cài đặt gốc (parse và cảnh báo theo từng dòng, trước khi chuyển sang cột/luật).
+fixtures/parity/expected_*.json được ghi lại bằng chính các hàm snapshot_* dưới đây chạy trên
+mã gốc, cùng đầu vào fixtures/parity/forecast_iso.json; mã hiện tại phải cho kết quả y hệt.
+"""
+import json
+import math
+import unittest
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from pytz import timezone
+
+from services.open_meteo.daily import parse_daily
+from services.open_meteo.hourly import parse_hourly
+from services.trend_10days import generate_trend_10days
+from services.unusual_alert import check_unusual_alert
+from services.utils import detect_alerts
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures" / "parity"
+FORECAST_DAYS = 4
+ICT = timezone("Asia/Bangkok")
+
+
+def _payload() -> dict:
+    return json.loads((FIXTURES / "forecast_iso.json").read_text())
+
+
+def _plain(value):
+    """Giá trị numpy/pandas → kiểu JSON (NaN/NA → None)."""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if value is None or value is pd.NA or (isinstance(value, float) and math.isnan(value)):
+        return None
+    return value
+
+
+def _frame(df: pd.DataFrame) -> dict:
+    return {
+        "columns": [str(c) for c in df.columns],
+        "kinds": [t.kind for t in df.dtypes],
+        "records": [{k: _plain(v) for k, v in row.items()} for row in df.to_dict("records")],
+    }
+
+
+def _unixtime(payload: dict) -> dict:
+    """Cùng payload nhưng timeformat=unixtime (giờ địa phương ICT → epoch giây)."""
+    to_epoch = lambda v: int(pd.Timestamp(v).tz_localize(ICT).timestamp())
+    out = json.loads(json.dumps(payload))
+    out["current_weather"]["time"] = to_epoch(out["current_weather"]["time"])
+    out["hourly"]["time"] = [to_epoch(t) for t in out["hourly"]["time"]]
+    for key in ("time", "sunrise", "sunset"):
+        out["daily"][key] = [to_epoch(t) for t in out["daily"][key]]
+    return out
+
+
+def snapshot_hourly() -> dict:
+    return _frame(parse_hourly(_payload(), FORECAST_DAYS))
+
+
+def snapshot_daily() -> dict:
+    return _frame(parse_daily(_payload(), FORECAST_DAYS))
+
+
+def _frames(ts_local: bool = False):
+    """hourly/daily DataFrame của fixture, thêm vài mô tả có hiện tượng bất thường."""
+    payload = _payload()
+    hourly, daily = parse_hourly(payload, FORECAST_DAYS), parse_daily(payload, FORECAST_DAYS)
+    hourly.loc[10, "weather_desc"] = "Dông tố kèm mưa đá"
+    hourly.loc[30, "weather_desc"] = "Sương mù dày đặc"
+    daily.loc[2, "weather_desc"] = "Có lốc xoáy, sấm sét"
+    if ts_local:
+        hourly["ts_local"] = pd.to_datetime(hourly["ts"]).dt.tz_localize(ICT)
+    return hourly, daily
+
+
+# Số liệu hiện tại cho check_unusual_alert: số thường, numpy, thiếu/NaN
+UNUSUAL_CURRENT = [
+    {},
+    {"temp_c": 31.0, "wind_speed_ms": 5.0, "rain_mm": 2.0, "mslp_hpa": 1008.0, "weather_desc": "Có mây"},
+    {"temp_c": 41.26, "wind_speed_ms": 25, "rain_mm": 120.4, "mslp_hpa": 985.6, "weather_desc": "Dông tố, mưa đá"},
+    {"temp_c": np.float64(40.0), "wind_speed_ms": np.float64(30.5), "rain_mm": None, "mslp_hpa": float("nan"),
+     "weather_desc": None},
+]
+
+
+def snapshot_unusual() -> list:
+    out = []
+    for ts_local in (False, True):
+        hourly, daily = _frames(ts_local)
+        out.extend(check_unusual_alert(current, hourly, daily) for current in UNUSUAL_CURRENT)
+    out.append(check_unusual_alert({}, pd.DataFrame(), pd.DataFrame()))
+    out.append(check_unusual_alert({"temp_c": 45.0}, None, None, official_alerts=["Tin bão số 5"]))
+    return out
+
+
+# Số liệu hiện tại cho detect_alerts: chuỗi số, chuỗi lỗi, None, NaN, numpy, int, bool
+DETECT_CURRENT = [
+    {},
+    {"temp_c": 28.0, "wind_speed_ms": 3.0, "rain_24h": 0.0, "uv_index": 2.0, "solar_wm2": 100.0,
+     "mslp": 1012.0, "humidity_pct": 60.0},
+    {"temp_c": 35.26, "wind_speed_ms": 9.04, "rain_24h": 12.5, "uv_index": 7.35, "solar_wm2": 712.0,
+     "mslp": 1005.55, "humidity_pct": 85.4},
+    {"temp_c": "18.5", "wind_speed_ms": "abc", "rain_24h": "", "uv_index": "4", "solar_wm2": None,
+     "mslp": "1025.3", "humidity_pct": "30"},
+    {"temp_c": None, "wind_speed_ms": float("nan"), "rain_24h": np.nan, "uv_index": pd.NA, "solar_wm2": "nan",
+     "mslp": None, "humidity_pct": None},
+    {"temp_c": np.float64(32), "wind_speed_ms": np.int64(8), "rain_24h": 10, "uv_index": np.float32(4.5),
+     "solar_wm2": 600, "mslp": 1020, "humidity_pct": True},
+]
+
+# check_unusual_alert chỉ xét giá trị int/float: chuỗi số, numpy int/float32 bị bỏ qua
+UNUSUAL_STRICT = [
+    {"temp_c": "41.5", "wind_speed_ms": "30", "rain_mm": "150", "mslp_hpa": "980"},
+    {"temp_c": np.float32(41.5), "wind_speed_ms": np.int64(30), "rain_mm": np.int32(150), "mslp_hpa": np.float64(980.4)},
+    {"temp_c": 41, "wind_speed_ms": 30, "rain_mm": 150, "mslp_hpa": 980},
+    {"temp_c": float("nan"), "wind_speed_ms": None, "rain_mm": "", "mslp_hpa": "abc"},
+]
+
+
+def snapshot_alerts() -> dict:
+    return {
+        "detect_alerts": [detect_alerts(current) for current in DETECT_CURRENT],
+        "unusual_current": [check_unusual_alert(current, None, None) for current in UNUSUAL_STRICT],
+    }
+
+
+# Lượng mưa ghi đè từ rain_openmeteo: chuỗi số, None, numpy
+RAIN_10D = [{"precipitation": "12.5"}, {"precipitation": None}, {"precipitation": 0}, {"precipitation": np.float32(3.5)}]
+
+
+def snapshot_trend() -> list:
+    hourly, _ = _frames(ts_local=True)
+    cold = hourly.assign(temp_c=hourly["temp_c"] - 24.0, wind_speed_ms=hourly["wind_speed_ms"] * 2)
+    out = []
+    for df, rain_10d in ((hourly, None), (hourly, RAIN_10D), (cold, None)):
+        bulletin, _, stats = generate_trend_10days(df, "2025-07-01", rain_10d=rain_10d, start_from_now=False)
+        out.append({"bulletin": bulletin, "stats": stats})
+    return out
+
+
+def expected(name: str):
+    return json.loads((FIXTURES / f"expected_{name}.json").read_text())
+
+
+class ParityTest(unittest.TestCase):
+    maxDiff = None
+
+    def assert_frame(self, got: dict, want: dict):
+        self.assertEqual(got["columns"], want["columns"])
+        self.assertEqual(got["kinds"], want["kinds"])
+        self.assertEqual(len(got["records"]), len(want["records"]))
+        for i, (row, ref) in enumerate(zip(got["records"], want["records"])):
+            self.assertEqual(row, ref, f"dòng {i}")
+
+    def assert_same_values(self, got: pd.DataFrame, want: dict, skip=("ts",)):
+        """Mọi cột trừ skip giống bản gốc (dùng cho payload unixtime, cột thời gian là epoch)."""
+        frame = _frame(got)
+        self.assertEqual(frame["columns"], want["columns"])
+        for row, ref in zip(frame["records"], want["records"]):
+            self.assertEqual({k: v for k, v in row.items() if k not in skip},
+                             {k: v for k, v in ref.items() if k not in skip})
+
+    def test_parse_hourly(self):
+        self.assert_frame(snapshot_hourly(), expected("hourly"))
+
+    def test_parse_hourly_unixtime(self):
+        self.assert_same_values(parse_hourly(_unixtime(_payload()), FORECAST_DAYS), expected("hourly"))
+
+    def test_parse_daily(self):
+        self.assert_frame(snapshot_daily(), expected("daily"))
+
+    def test_parse_daily_unixtime(self):
+        self.assert_same_values(parse_daily(_unixtime(_payload()), FORECAST_DAYS), expected("daily"),
+                                skip=("ts", "sunrise", "sunset"))
+
+    def test_check_unusual_alert(self):
+        got, want = snapshot_unusual(), expected("unusual")
+        self.assertEqual(len(got), len(want))
+        for i, (text, ref) in enumerate(zip(got, want)):
+            self.assertEqual(text.splitlines(), ref.splitlines(), f"trường hợp {i}")
+
+    def test_check_unusual_alert_on_unixtime_table(self):
+        # ForecastTable chỉ có ở mã hiện tại (import trong hàm để snapshot_* vẫn chạy được trên mã gốc)
+        from services.open_meteo.daily import parse_daily_table
+        from services.open_meteo.hourly import parse_hourly_table
+
+        payload = _unixtime(_payload())
+        hourly, daily = parse_hourly_table(payload, FORECAST_DAYS), parse_daily_table(payload, FORECAST_DAYS)
+        want = expected("unusual")[2].splitlines()
+        got = check_unusual_alert(UNUSUAL_CURRENT[2], hourly, daily).splitlines()
+        # Không có mô tả bất thường ghép thêm như _frames: chỉ so các dòng theo ngưỡng
+        self.assertEqual(got, [line for line in want if "dự báo có" not in line])
+
+    def test_current_alerts(self):
+        got, want = snapshot_alerts(), expected("alerts")
+        for key in ("detect_alerts", "unusual_current"):
+            self.assertEqual(len(got[key]), len(want[key]))
+            for i, (alerts, ref) in enumerate(zip(got[key], want[key])):
+                self.assertEqual(alerts, ref, f"{key} trường hợp {i}")
+
+    def test_trend_stats(self):
+        got, want = snapshot_trend(), expected("trend")
+        self.assertEqual(len(got), len(want))
+        for i, (trend, ref) in enumerate(zip(got, want)):
+            self.assertEqual(trend["stats"], ref["stats"], f"trường hợp {i}")
+            self.assertEqual(trend["bulletin"], ref["bulletin"], f"trường hợp {i}")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+# tests/test_singleflight.py
+import asyncio
+import threading
+import time
+import unittest
+
+from services.open_meteo.singleflight import SingleFlight
+
+
+def _wait_until(cond, timeout: float = 2.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while not cond():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+
+class SingleFlightThreadTest(unittest.TestCase):
+    def run_callers(self, flight: SingleFlight, fn, n: int = 8):
+        """n thread cùng gọi do("k", fn); trả (kết quả, lỗi) của từng thread."""
+        results, errors = [], []
+
+        def call():
+            try:
+                results.append(flight.do("k", fn))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=call) for _ in range(n)]
+        for t in threads:
+            t.start()
+        return threads, results, errors
+
+    def test_concurrent_callers_share_one_load(self):
+        flight, release, calls = SingleFlight(), threading.Event(), []
+
+        def load():
+            calls.append(1)
+            release.wait(2)
+            return {"n": len(calls)}
+
+        threads, results, errors = self.run_callers(flight, load)
+        self.assertTrue(_wait_until(lambda: flight.coalesced == 7))
+        release.set()
+        for t in threads:
+            t.join(2)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{"n": 1}] * 8)
+        self.assertEqual(errors, [])
+        self.assertEqual(flight.stats(), {"leaders": 1, "coalesced": 7, "in_flight": 0})
+
+    def test_error_reaches_every_caller(self):
+        flight, release = SingleFlight(), threading.Event()
+
+        def load():
+            release.wait(2)
+            raise ValueError("upstream")
+
+        threads, results, errors = self.run_callers(flight, load, n=4)
+        self.assertTrue(_wait_until(lambda: flight.coalesced == 3))
+        release.set()
+        for t in threads:
+            t.join(2)
+        self.assertEqual(results, [])
+        self.assertEqual([str(e) for e in errors], ["upstream"] * 4)
+
+    def test_next_call_after_finish_loads_again(self):
+        flight, calls = SingleFlight(), []
+        flight.do("k", lambda: calls.append(1))
+        flight.do("k", lambda: calls.append(1))
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(flight.in_flight(), 0)
+
+
+class SingleFlightAsyncTest(unittest.TestCase):
+    def test_concurrent_coroutines_share_one_load(self):
+        flight, calls = SingleFlight(), []
+
+        async def load():
+            calls.append(1)
+            await asyncio.sleep(0.02)
+            return len(calls)
+
+        async def main():
+            return await asyncio.gather(*(flight.do_async("k", load) for _ in range(5)))
+
+        self.assertEqual(asyncio.run(main()), [1] * 5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(flight.stats(), {"leaders": 1, "coalesced": 4, "in_flight": 0})
+
+    def test_cancelled_caller_does_not_cancel_shared_load(self):
+        flight, calls = SingleFlight(), []
+
+        async def load():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "ok"
+
+        async def main():
+            leader = asyncio.ensure_future(flight.do_async("k", load))
+            follower = asyncio.ensure_future(flight.do_async("k", load))
+            await asyncio.sleep(0.01)
+            leader.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await leader
+            return await follower
+
+        self.assertEqual(asyncio.run(main()), "ok")
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(flight.in_flight(), 0)
+
+    def test_error_reaches_every_coroutine(self):
+        flight = SingleFlight()
+
+        async def load():
+            await asyncio.sleep(0.01)
+            raise ValueError("upstream")
+
+        async def main():
+            return await asyncio.gather(*(flight.do_async("k", load) for _ in range(3)), return_exceptions=True)
+
+        self.assertEqual([str(e) for e in asyncio.run(main())], ["upstream"] * 3)
+        self.assertEqual(flight.leaders, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
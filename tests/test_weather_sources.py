@@ -0,0 +1,36 @@
+# tests/test_weather_sources.py
+import asyncio
+import unittest
+from unittest import mock
+
+import httpx
+
+from services import weather_sources
+from services.open_meteo.decode import decode_forecast
+
+
+def _client(body: bytes) -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(200, content=body)))
+
+
+class FetchJsonTest(unittest.TestCase):
+    def fetch(self, body: bytes, **kwargs):
+        async def main():
+            async with _client(body) as client:
+                with mock.patch.object(weather_sources, "get_async_client", return_value=client):
+                    return await weather_sources.fetch_json("https://example.test/forecast", **kwargs)
+        return asyncio.run(main())
+
+    def test_invalid_payload_is_handled_without_traceback(self):
+        with mock.patch.object(weather_sources, "handle_service_error") as handle, \
+                mock.patch.object(weather_sources.logger, "exception") as log_exception:
+            self.assertIsNone(self.fetch(b'{"hourly": []}', decode=decode_forecast))
+        self.assertEqual(handle.call_args.args[1], "invalid_payload")
+        log_exception.assert_not_called()
+
+    def test_valid_json(self):
+        self.assertEqual(self.fetch(b'{"latitude": 21.0}'), {"latitude": 21.0})
+
+
+if __name__ == "__main__":
+    unittest.main()